@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script para archivar los meses cerrados del ledger.
+
+Ejecutar:
+    python archive_ledger.py                  # Conserva en caliente solo el mes actual
+    python archive_ledger.py --keep-months 3  # Conserva el mes actual y los dos anteriores
+    python archive_ledger.py --list           # Muestra el resumen de los meses archivados
+"""
+import argparse
+import sys
+
+# Fix para Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from src.repositories.ledger_repository import LedgerRepository  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Archivado mensual del ledger")
+    parser.add_argument("--keep-months", type=int, default=None, help="Meses en caliente, incluido el actual")
+    parser.add_argument("--list", action="store_true", help="Solo lista los meses archivados")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repository = LedgerRepository()
+
+    if not args.list:
+        archived = repository.archive_closed_months(args.keep_months)
+        if not archived:
+            print("[INFO] No hay meses cerrados para archivar")
+        for month, count in archived.items():
+            print(f"[EXITO] {month}: {count} movimientos archivados")
+
+    summaries = repository.get_archive_summaries()
+    if summaries:
+        print("\nMeses archivados:")
+        for summary in summaries:
+            totals = ", ".join(f"{amount} {currency}" for currency, amount in sorted(summary["totals"].items()))
+            print(f"  {summary['month']}: {summary['count']} movimientos ({totals})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script para reconciliar el ledger histórico con Actual Budget.
+
+Ejecutar:
+    python backfill_actual.py --dry-run          # Reporta qué cambiaría
+    python backfill_actual.py                    # Retoma desde el último checkpoint
+    python backfill_actual.py --account Efectivo --from-start
+"""
+import argparse
+import asyncio
+import sys
+
+# Fix para Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from src.repositories.ledger_repository import LedgerRepository  # noqa: E402
+from src.services.actual_budget_service import ActualBudgetService  # noqa: E402
+from src.services.backfill_service import BackfillService  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill del ledger hacia Actual Budget")
+    parser.add_argument("--account", help="Nombre (de ACTUAL_BUDGET_ACCOUNTS) o id de la cuenta destino")
+    parser.add_argument("--dry-run", action="store_true", help="No confirma cambios, solo reporta")
+    parser.add_argument("--from-start", action="store_true", help="Ignora y borra el checkpoint guardado")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Movimientos por lote")
+    return parser.parse_args()
+
+
+async def run(args) -> int:
+    actual_budget = ActualBudgetService()
+    if not actual_budget.is_configured():
+        print("[ERROR] Actual Budget no esta configurado (URL, budget id y password)")
+        return 1
+
+    service = BackfillService(LedgerRepository(), actual_budget, chunk_size=args.chunk_size)
+    if args.from_start and not args.dry_run:
+        service.reset_checkpoint()
+
+    def progress(stats):
+        print(
+            f"[INFO] Lote {stats['chunks']}: {stats['processed']} procesados "
+            f"({stats['created']} nuevos, {stats['updated']} actualizados, {stats['unchanged']} sin cambios)"
+        )
+
+    try:
+        result = await service.run(
+            account=args.account,
+            dry_run=args.dry_run,
+            resume=not args.from_start,
+            progress=progress,
+        )
+    except Exception as e:
+        print(f"[ERROR] Backfill interrumpido: {e}")
+        print("Volve a ejecutar el script para retomar desde el ultimo lote confirmado.")
+        return 1
+    finally:
+        await actual_budget.close()
+
+    label = "[DRY-RUN]" if args.dry_run else "[EXITO]"
+    print(f"{label} Backfill finalizado en la cuenta {result['account_id']}")
+    if result["resumed_from"]:
+        print(f"  Retomado desde: {result['resumed_from']}")
+    print(f"  Procesados:    {result['processed']}")
+    print(f"  Nuevos:        {result['created']}")
+    print(f"  Actualizados:  {result['updated']}")
+    print(f"  Sin cambios:   {result['unchanged']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
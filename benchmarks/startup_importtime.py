@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de arranque en frío basado en ``python -X importtime``.
+
+Mide cuánto tarda en importarse ``main`` (y opcionalmente en construirse
+``GastosBot``) y verifica qué dependencias pesadas se cargaron.
+
+Ejecutar desde la raíz del repo:
+    python benchmarks/startup_importtime.py
+    python benchmarks/startup_importtime.py --runs 10 --construct
+    python benchmarks/startup_importtime.py --database-url sqlite:// --construct
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("sqlalchemy", "actual", "yaml", "dateutil")
+
+
+def run_once(construct: bool, env: dict) -> dict:
+    """Ejecuta un intérprete nuevo y parsea la salida de -X importtime."""
+    code = "import main"
+    if construct:
+        code += "; main.GastosBot()"
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(parts) != 3 or not parts[0].isdigit():
+            continue  # encabezado
+        self_us, cumulative_us, name = parts
+        modules[name] = (int(self_us), int(cumulative_us))
+
+    return {
+        "total_us": sum(self_us for self_us, _ in modules.values()),
+        "modules": modules,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cantidad de intérpretes a lanzar")
+    parser.add_argument("--top", type=int, default=15, help="Módulos más lentos a mostrar")
+    parser.add_argument("--construct", action="store_true", help="Además de importar, construir GastosBot")
+    parser.add_argument("--database-url", default=None, help="DATABASE_URL a usar (por defecto: backend archivos)")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("TELEGRAM_BOT_TOKEN", "benchmark-token")
+    env["CONFIG_PATH"] = env.get("CONFIG_PATH", "config.benchmark.yaml")
+    env.pop("DATABASE_URL", None)
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+
+    results = [run_once(args.construct, env) for _ in range(args.runs)]
+    totals_ms = [r["total_us"] / 1000 for r in results]
+
+    print(f"Runs: {args.runs} | construct={args.construct} | database_url={args.database_url or '-'}")
+    print(f"Import time total: mediana {statistics.median(totals_ms):.1f} ms "
+          f"(min {min(totals_ms):.1f} / max {max(totals_ms):.1f})")
+
+    last = results[-1]["modules"]
+    print("\nDependencias pesadas cargadas:")
+    for heavy in HEAVY_MODULES:
+        loaded = heavy in last
+        cumulative = f"{last[heavy][1] / 1000:.1f} ms" if loaded else "-"
+        print(f"  {heavy:<12} {'sí' if loaded else 'no':<3} {cumulative}")
+
+    print(f"\nTop {args.top} módulos por tiempo acumulado:")
+    ranking = sorted(last.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in ranking:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {name}")
+
+
+if __name__ == "__main__":
+    main()
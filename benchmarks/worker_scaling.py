@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de escalado del modo scale-out (PartitionedWorkerPool).
+
+Envía el mismo lote de updates (repartidos en varios chats) a pools de
+1..N workers y mide el throughput hasta que todos los updates se confirman.
+
+Ejecutar desde la raíz del repo:
+    python benchmarks/worker_scaling.py
+    python benchmarks/worker_scaling.py --workers 1 2 4 8 --updates 4000 --cpu-ms 3
+    python benchmarks/worker_scaling.py --mode bot --updates 600
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark-token")
+
+from src.worker_pool import PartitionedWorkerPool  # noqa: E402
+
+CPU_MS = float(os.environ.get("BENCH_CPU_MS", "2"))
+IO_MS = float(os.environ.get("BENCH_IO_MS", "0"))
+
+
+def synthetic_handler_factory():
+    """Handler sintético: trabajo de CPU + espera de IO configurables."""
+    async def handle(update):
+        deadline = time.perf_counter() + CPU_MS / 1000
+        while time.perf_counter() < deadline:
+            pass
+        if IO_MS:
+            await asyncio.sleep(IO_MS / 1000)
+
+    async def close():
+        pass
+
+    return handle, close
+
+
+def bot_handler_factory():
+    """GastosBot real (backend del entorno) con Telegram sin red."""
+    from src.bot import GastosBot
+
+    bot = GastosBot()
+    bot.track_offset = False
+
+    async def send_message(*args, **kwargs):
+        return True
+
+    bot.telegram_service.send_message = send_message
+    return bot.process_message, bot.close
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": {"id": chat_id, "first_name": "Bench"},
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+            "date": 1700000000 + update_id,
+        },
+    }
+
+
+def make_updates(count: int, chats: int, mode: str, start_id: int):
+    wizard = ["💸 Nuevo Gasto", "2500", "ARS", "Comida", "Bench"]
+    updates = []
+    for i in range(count):
+        chat_id = 1000 + i % chats
+        text = wizard[(i // chats) % len(wizard)] if mode == "bot" else "bench"
+        updates.append(make_update(start_id + i, chat_id, text))
+    return updates
+
+
+async def wait_acked(pool: PartitionedWorkerPool, last_update_id: int):
+    while True:
+        offset = pool.collect_acks()
+        if offset is not None and offset >= last_update_id:
+            return
+        if pool.tracker.in_flight == 0:
+            return
+        await asyncio.sleep(0.005)
+
+
+async def measure(workers: int, args, factory, next_id: int):
+    pool = PartitionedWorkerPool(workers, handler_factory=factory)
+    pool.start()
+    try:
+        # Calentamiento: un update por worker para excluir el arranque del proceso
+        warmup = [make_update(next_id + i, 10 + i, "bench") for i in range(workers * 4)]
+        for update in warmup:
+            await pool.submit(update)
+        await wait_acked(pool, warmup[-1]["update_id"])
+        next_id += len(warmup)
+
+        updates = make_updates(args.updates, args.chats, args.mode, next_id)
+        started = time.perf_counter()
+        for update in updates:
+            await pool.submit(update)
+        await wait_acked(pool, updates[-1]["update_id"])
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.stop()
+    return elapsed, next_id + len(updates)
+
+
+async def run(args):
+    factory = bot_handler_factory if args.mode == "bot" else synthetic_handler_factory
+    print(f"mode={args.mode} updates={args.updates} chats={args.chats} "
+          f"cpu_ms={CPU_MS} io_ms={IO_MS} cpus={os.cpu_count()}")
+    print(f"{'workers':>7} {'segundos':>9} {'updates/s':>10} {'speedup':>8}")
+
+    baseline = None
+    next_id = 1
+    for workers in args.workers:
+        elapsed, next_id = await measure(workers, args, factory, next_id)
+        throughput = args.updates / elapsed
+        baseline = baseline or throughput
+        print(f"{workers:>7} {elapsed:>9.2f} {throughput:>10.1f} {throughput / baseline:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=64)
+    parser.add_argument("--mode", choices=["synthetic", "bot"], default="synthetic")
+    parser.add_argument("--cpu-ms", type=float, default=None, help="CPU por update (modo synthetic)")
+    parser.add_argument("--io-ms", type=float, default=None, help="Espera de IO por update (modo synthetic)")
+    args = parser.parse_args()
+
+    # Los workers (spawn) leen la configuración del entorno
+    if args.cpu_ms is not None:
+        os.environ["BENCH_CPU_MS"] = str(args.cpu_ms)
+    if args.io_ms is not None:
+        os.environ["BENCH_IO_MS"] = str(args.io_ms)
+    global CPU_MS, IO_MS
+    CPU_MS = float(os.environ.get("BENCH_CPU_MS", "2"))
+    IO_MS = float(os.environ.get("BENCH_IO_MS", "0"))
+
+    if args.mode == "bot" and not os.environ.get("DATABASE_URL"):
+        tmp = tempfile.mkdtemp(prefix="gastos-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,54 @@ CREATE TABLE IF NOT EXISTS ledger_entries (
     description TEXT DEFAULT '',
     payee VARCHAR(255) DEFAULT '',
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    -- Día y mes en hora local (TIMEZONE), calculados desde ts
+    local_date DATE,
+    month VARCHAR(7),
     CONSTRAINT uq_ledger_chat_message UNIQUE (chat_id, message_id)
 );
 
+CREATE INDEX IF NOT EXISTS ix_ledger_entries_chat_month ON ledger_entries (chat_id, month);
+CREATE INDEX IF NOT EXISTS ix_ledger_entries_user_month ON ledger_entries (user_id, month);
+CREATE INDEX IF NOT EXISTS ix_ledger_entries_local_date ON ledger_entries (local_date);
+
+-- Meses cerrados (ver archive_ledger.py)
+CREATE TABLE IF NOT EXISTS ledger_archive (
+    id SERIAL PRIMARY KEY,
+    month VARCHAR(7) NOT NULL,
+    chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    ts BIGINT NOT NULL,
+    date_iso VARCHAR(32) NOT NULL,
+    amount BIGINT NOT NULL,
+    currency VARCHAR(12) NOT NULL,
+    category VARCHAR(128) NOT NULL,
+    description TEXT DEFAULT '',
+    payee VARCHAR(255) DEFAULT '',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    local_date DATE,
+    CONSTRAINT uq_ledger_archive_chat_message UNIQUE (chat_id, message_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_ledger_archive_month ON ledger_archive (month);
+CREATE INDEX IF NOT EXISTS ix_ledger_archive_chat_month ON ledger_archive (chat_id, month);
+CREATE INDEX IF NOT EXISTS ix_ledger_archive_local_date ON ledger_archive (local_date);
+
+-- Búsqueda de texto (/buscar): debe coincidir con la expresión que usa el bot
+CREATE INDEX IF NOT EXISTS ix_ledger_entries_search ON ledger_entries
+    USING GIN (to_tsvector('simple'::regconfig, coalesce(description, '') || ' ' || coalesce(payee, '')));
+CREATE INDEX IF NOT EXISTS ix_ledger_archive_search ON ledger_archive
+    USING GIN (to_tsvector('simple'::regconfig, coalesce(description, '') || ' ' || coalesce(payee, '')));
+
+CREATE TABLE IF NOT EXISTS ledger_archive_months (
+    month VARCHAR(7) PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0,
+    totals JSONB NOT NULL,
+    min_ts BIGINT,
+    max_ts BIGINT,
+    archived_at TIMESTAMPTZ
+);
+
 CREATE TABLE IF NOT EXISTS bot_state (
     key VARCHAR(64) PRIMARY KEY,
     value JSONB NOT NULL,
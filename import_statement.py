@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script para importar resúmenes bancarios (CSV) al ledger.
+
+Ejecutar:
+    python import_statement.py resumen.csv --chat-id 123456789 --dry-run
+    python import_statement.py resumen.csv --chat-id 123456789 --category Supermercado
+    python import_statement.py movimientos.csv --chat-id 123456789 --format credicoop
+"""
+import argparse
+import sys
+import time
+
+# Fix para Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from src.repositories.ledger_repository import LedgerRepository  # noqa: E402
+from src.services.budget_service import BudgetService  # noqa: E402
+from src.services.category_index import CategoryIndex  # noqa: E402
+from src.services.statement_import_service import STATEMENT_FORMATS, StatementImportService  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Importación de resúmenes bancarios al ledger")
+    parser.add_argument("path", help="Archivo CSV del resumen")
+    parser.add_argument("--chat-id", type=int, required=True, help="Chat de Telegram al que se asignan los movimientos")
+    parser.add_argument("--user-id", type=int, default=None, help="Usuario (por defecto el mismo chat_id)")
+    parser.add_argument("--format", choices=sorted(STATEMENT_FORMATS), default=None, help="Forzar formato")
+    parser.add_argument("--category", default=None, help="Categoría para gastos sin categoría")
+    parser.add_argument("--currency", default=None, help="Moneda para filas sin moneda")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Movimientos por escritura")
+    parser.add_argument("--dry-run", action="store_true", help="No escribe, solo reporta")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    repository = LedgerRepository()
+    category_index = CategoryIndex(repository)
+    if not args.dry_run:
+        category_index.load()
+    service = StatementImportService(repository, batch_size=args.batch_size, on_imported=category_index.observe_many)
+
+    try:
+        stats = service.import_file(
+            args.path,
+            args.chat_id,
+            args.user_id or args.chat_id,
+            category=args.category,
+            currency=args.currency,
+            fmt=args.format,
+            dry_run=args.dry_run,
+        )
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        return 1
+    finally:
+        category_index.save()
+
+    if stats["imported"] and not args.dry_run:
+        BudgetService(repository).reseed_months(args.user_id or args.chat_id, stats["months"], int(time.time()))
+
+    label = "[DRY-RUN]" if args.dry_run else "[EXITO]"
+    print(f"{label} Resumen {stats['format']} procesado")
+    print(f"  Filas:       {stats['rows']}")
+    print(f"  Nuevos:      {stats['imported']}")
+    print(f"  Duplicados:  {stats['duplicates']}")
+    print(f"  Inválidas:   {stats['invalid']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
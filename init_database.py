@@ -69,6 +69,7 @@ try:
     print()
     print("Tablas creadas:")
     print("  - ledger_entries (gastos registrados)")
+    print("  - ledger_archive / ledger_archive_months (meses archivados)")
     print("  - bot_state (estado del bot)")
 
     cursor.close()
@@ -1,14 +1,29 @@
 """Punto de entrada principal del Bot de Gastos."""
-import asyncio
-from src.bot import GastosBot
-from src.utils.logger import setup_logger
+import time
+
+# Se registra antes de cualquier import pesado para medir el arranque en frío
+_STARTED_AT = time.monotonic()
+
+import asyncio  # noqa: E402
+from src.bot import GastosBot  # noqa: E402
+from src.config.settings import settings  # noqa: E402
+from src.utils.logger import setup_logger  # noqa: E402
 
 logger = setup_logger(__name__)
 
 
 def main():
     """Función principal."""
-    bot = GastosBot()
+    if settings.WORKER_PROCESSES > 1:
+        from src.worker_pool import run_scale_out
+
+        try:
+            asyncio.run(run_scale_out(settings.WORKER_PROCESSES))
+        except KeyboardInterrupt:
+            logger.info("🛑 Bot detenido por el usuario")
+        return
+
+    bot = GastosBot(started_at=_STARTED_AT)
     asyncio.run(bot.start())
 
 
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script para migrar el backend de archivos (ledger.json, archivo, state.json) a la base de datos.
+
+Ejecutar:
+    python migrate_to_database.py                               # Usa DATABASE_URL
+    python migrate_to_database.py --database-url sqlite:///data/bot.db
+    python migrate_to_database.py --on-conflict update          # El origen pisa lo que ya esté en la base
+"""
+import argparse
+import sys
+
+# Fix para Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from src.config.settings import settings  # noqa: E402
+from src.repositories.json_migration import ON_CONFLICT, JsonToDatabaseMigration  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migración de ledger.json y state.json a la base de datos")
+    parser.add_argument("--database-url", default=None, help="Base de destino (por defecto DATABASE_URL)")
+    parser.add_argument("--ledger", default="data/ledger.json", help="Ledger de origen")
+    parser.add_argument("--state", default="state.json", help="Estado de origen")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Movimientos por lote")
+    parser.add_argument(
+        "--on-conflict",
+        choices=ON_CONFLICT,
+        default="skip",
+        help="Movimientos/sesiones que ya están en la base: conservarlos (skip) o reemplazarlos (update)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    database_url = args.database_url or settings.DATABASE_URL
+    if not database_url:
+        print("[ERROR] Indicá --database-url o definí DATABASE_URL")
+        return 1
+
+    try:
+        migration = JsonToDatabaseMigration(
+            database_url,
+            ledger_path=args.ledger,
+            state_path=args.state,
+            batch_size=args.batch_size,
+            on_conflict=args.on_conflict,
+        )
+        report = migration.run(on_batch=lambda table, rows: print(f"[INFO] {table}: {rows} filas leídas"))
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    for table in report["tables"]:
+        status = "OK" if table["ok"] else "ERROR"
+        print(f"\n[{status}] {table['table']}")
+        print(f"  Origen:      {table['source_rows']} filas ({table['source_duplicates']} duplicadas)")
+        print(f"  Escritas:    {table['written']}")
+        print(f"  En la base:  {table['destination_rows']} de {table['unique']}")
+        print(f"  Faltantes:   {table['missing']}")
+        print(f"  Distintas:   {table['different']}")
+        print(f"  Otras filas: {table['extra_in_destination']} (ya estaban en la base)")
+        print(f"  Checksum:    {table['checksum']} / {table['destination_checksum']}")
+
+    state = report["state"]
+    print(f"\n[{'OK' if state['ok'] else 'ERROR'}] Estado")
+    print(f"  Sesiones:    {state['sessions']} ({state['sessions_missing']} faltantes, {state['sessions_different']} distintas)")
+    print(f"  Offset:      {state['update_offset']}")
+    print(f"  Snapshots:   {state['snapshots']} copiados")
+
+    if not report["ok"]:
+        if args.on_conflict == "skip":
+            print("\n[AVISO] Hay filas que ya estaban en la base con otros datos; --on-conflict update las reemplaza.")
+        return 1
+    print("\n[EXITO] Migración verificada. Configurá DATABASE_URL en el bot para usar la base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,204 @@
 """Bot principal - Orquestador de servicios."""
 import asyncio
+import copy
+import os
+import signal
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from src.config.settings import settings
 from src.services.telegram_service import TelegramService
 from src.services.actual_budget_service import ActualBudgetService
-from src.services.gastos_service import GastosService
+from src.services.backfill_service import BackfillService
+from src.services.budget_service import BudgetService
+from src.services.category_index import CategoryIndex
+from src.services.chart_service import ChartService
+from src.services.exchange_rates import ExchangeRateStore
+from src.services.gastos_service import MORE_RESULTS_BUTTON, GastosService
+from src.services.poller_lease import PollerLease
+from src.services.recurring_service import RecurringService
+from src.services.statement_import_service import StatementImportService
+from src.services.update_inbox import UpdateInbox
 from src.repositories.ledger_repository import LedgerRepository
 from src.schemas import TelegramMessage
-from src.utils.logger import setup_logger
+from src.utils import tracing
+from src.utils.logger import bind_log_context, log_context, setup_logger, shutdown_logging
 
 logger = setup_logger(__name__)
 
 
+class _UpdateUnitOfWork:
+    """
+    Unidad de trabajo de un update: sesión leída una vez, escrita como mucho una vez.
+
+    Los handlers modifican la sesión en memoria; ``commit`` persiste la sesión
+    (solo si cambió) y el offset del update en una sola escritura del estado.
+    """
+
+    def __init__(self, ledger_repository: LedgerRepository, update_id: Optional[int]):
+        self.ledger = ledger_repository
+        self.update_id = update_id
+        self.user_id: Optional[int] = None
+        self._original: Optional[dict] = None
+        self.session: dict = {"stage": None, "draft": {}}
+        self._cleared = False
+
+    def load_session(self, user_id: int):
+        self.user_id = user_id
+        self._original = self.ledger.get_session(user_id)
+        self.session = copy.deepcopy(self._original) if self._original else {"stage": None, "draft": {}}
+
+    def set(self, stage: Optional[str], draft: Optional[dict]):
+        """Avanza el wizard a ``stage`` (o lo termina si es None)."""
+        if not stage:
+            self.clear()
+            return
+        self.session = {"stage": stage, "draft": draft or {}}
+        self._cleared = False
+
+    def clear(self):
+        self.session = {"stage": None, "draft": {}}
+        self._cleared = True
+
+    def _session_changes(self) -> Dict[int, Optional[dict]]:
+        if self.user_id is None:
+            return {}
+        if self._cleared:
+            return {self.user_id: None} if self._original is not None else {}
+        if self.session.get("stage") and self.session != self._original:
+            return {self.user_id: self.session}
+        return {}
+
+    async def commit(self):
+        sessions = self._session_changes()
+        if not sessions and self.update_id is None:
+            return
+        await self.ledger.apply_state_changes_async(sessions=sessions, update_offset=self.update_id)
+        self._original = None if self._cleared else copy.deepcopy(self.session)
+        self.update_id = None
+
+
 class GastosBot:
     """Bot de Gastos - Orquesta todos los servicios."""
 
-    def __init__(self):
+    def __init__(self, started_at: Optional[float] = None):
+        # Referencia (time.monotonic) para medir el tiempo hasta estar listo
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        # En modo scale-out el offset lo persiste el ingress, no cada worker
+        self.track_offset = True
+        self._lease: Optional[PollerLease] = None
+        # Último update procesado y updates reprocesados desde el inbox al arrancar
+        self._last_processed_update: Optional[int] = None
+        self._replayed_updates: set = set()
         self.telegram_service = TelegramService()
         self.actual_budget_service = ActualBudgetService()
         self.ledger_repository = LedgerRepository()
+        self.inbox = UpdateInbox(self.ledger_repository)
+        self.backfill_service = BackfillService(self.ledger_repository, self.actual_budget_service)
+        self.category_index = CategoryIndex(self.ledger_repository)
+        self.recurring_service = RecurringService(self.ledger_repository)
+        self.exchange_rates = ExchangeRateStore(self.ledger_repository)
         self.gastos_service = GastosService(
             telegram_service=self.telegram_service,
             ledger_repository=self.ledger_repository,
             actual_budget_service=self.actual_budget_service,
+            backfill_service=self.backfill_service,
+            statement_import_service=StatementImportService(
+                self.ledger_repository, on_imported=self.category_index.observe_many
+            ),
+            category_index=self.category_index,
+            budget_service=BudgetService(self.ledger_repository),
+            recurring_service=self.recurring_service,
+            exchange_rates=self.exchange_rates,
+            chart_service=ChartService(self.ledger_repository, self.exchange_rates),
         )
+        self.recurring_service.on_materialized = self.gastos_service.handle_recurring_gastos
+        self._build_routes()
+
+    def _build_routes(self):
+        """Tablas de ruteo: texto exacto, prefijo de comando y etapa del wizard."""
+        gs = self.gastos_service
+
+        # Comandos/botones que no usan la sesión
+        stateless = {
+            "📊 Ver Categorías": gs.handle_button_ver_categorias,
+            "📤 Exportar CSV": gs.handle_button_exportar_csv,
+            "/export": gs.handle_button_exportar_csv,
+            "❓ Ayuda": gs.handle_button_ayuda,
+            MORE_RESULTS_BUTTON: gs.handle_button_mas_resultados,
+        }
+        # Botones que inician el wizard: devuelven (stage, draft)
+        wizard_entries = {
+            "💸 Nuevo Gasto": gs.handle_button_nuevo_gasto,
+            "💰 Nuevo Ingreso": gs.handle_button_nuevo_ingreso,
+        }
+
+        self._text_routes: Dict[str, Callable[[TelegramMessage, _UpdateUnitOfWork], Awaitable]] = {
+            "/start": self._route_start,
+            **{text: self._stateless_route(handler) for text, handler in stateless.items()},
+            **{text: self._wizard_entry_route(handler) for text, handler in wizard_entries.items()},
+        }
+        # Comandos con argumentos (se comparan por prefijo)
+        self._prefix_routes: List[Tuple[str, Callable[[TelegramMessage, _UpdateUnitOfWork], Awaitable]]] = [
+            ("/backfill", self._stateless_route(gs.handle_command_backfill)),
+            ("/buscar", self._stateless_route(gs.handle_command_buscar)),
+            ("/deshacer", self._stateless_route(gs.handle_command_deshacer)),
+            ("/editar", self._stateless_route(gs.handle_command_editar)),
+            ("/gasto", self._wizard_entry_route(gs.handle_command_gasto)),
+            ("/ingreso", self._wizard_entry_route(gs.handle_command_ingreso)),
+            ("/presupuesto", self._stateless_route(gs.handle_command_presupuesto)),
+            ("/recurrente", self._stateless_route(gs.handle_command_recurrente)),
+            ("/resumen", self._stateless_route(gs.handle_command_resumen)),
+            ("/grafico", self._stateless_route(gs.handle_command_grafico)),
+            ("/cotizacion", self._stateless_route(gs.handle_command_cotizacion)),
+            ("/traza", self._stateless_route(gs.handle_command_traza)),
+            ("/perfil", self._stateless_route(gs.handle_command_perfil)),
+        ]
+        # Archivos adjuntos (resúmenes bancarios)
+        self._document_route = self._stateless_route(gs.handle_document)
+        # Pasos del wizard: reciben la sesión y devuelven (stage, draft)
+        self._stage_routes: Dict[str, Callable[[TelegramMessage, dict], Awaitable[Tuple[Optional[str], Optional[dict]]]]] = {
+            "amount": gs.process_wizard_amount,
+            "currency": gs.process_wizard_currency,
+            "category": gs.process_wizard_category,
+            "description": gs.process_wizard_description,
+            "account": gs.process_wizard_account,
+        }
+
+    async def _route_start(self, message: TelegramMessage, uow: "_UpdateUnitOfWork"):
+        await self.gastos_service.handle_command_start(message)
+        uow.clear()
+
+    @staticmethod
+    def _stateless_route(handler):
+        async def route(message: TelegramMessage, uow: "_UpdateUnitOfWork"):
+            await handler(message)
+        return route
+
+    @staticmethod
+    def _wizard_entry_route(handler):
+        async def route(message: TelegramMessage, uow: "_UpdateUnitOfWork"):
+            stage, draft = await handler(message)
+            uow.set(stage, draft)
+        return route
+
+    def _resolve_route(self, text: str, stage: Optional[str]):
+        """Busca el handler para el texto recibido (o la etapa activa del wizard)."""
+        route = self._text_routes.get(text)
+        if route:
+            return route
+
+        for prefix, prefix_route in self._prefix_routes:
+            if text == prefix or text.startswith(prefix + " "):
+                return prefix_route
+
+        step = self._stage_routes.get(stage)
+        if step:
+            async def route(message: TelegramMessage, uow: "_UpdateUnitOfWork"):
+                next_stage, draft = await step(message, uow.session)
+                uow.set(next_stage, draft)
+            return route
+
+        return None
 
     async def process_message(self, update: dict):
         """
@@ -31,111 +207,219 @@ class GastosBot:
         Args:
             update: Update raw de Telegram
         """
-        # Extraer mensaje
-        msg = update.get("message")
-        if not msg:
-            logger.debug(f"Update sin mensaje (tipo: {list(update.keys())})")
+        update_id = update.get("update_id")
+        if update_id in self._replayed_updates:
+            # Ya se procesó desde el inbox; Telegram lo reenvió porque no llegó a confirmarse
+            self._replayed_updates.discard(update_id)
             return
+        message = update.get("message") or (update.get("callback_query") or {}).get("message") or {}
+        chat_id = message.get("chat", {}).get("id")
+        with log_context(update_id=update_id, chat_id=chat_id), tracing.trace_update(update_id, chat_id):
+            await self._process_message(update)
+        if update_id is not None:
+            self._last_processed_update = update_id
+
+    async def _save_inbox(self, updates: List[dict]):
+        """
+        Guarda un lote recibido antes de que el próximo getUpdates lo confirme.
 
-        try:
-            # Convertir a TelegramMessage
-            message = TelegramMessage.from_telegram_update(update)
-
-            logger.info(f"Mensaje de {message.user.get_display_name()}: {message.text[:50]}...")
-
-            # Obtener sesión del usuario
-            session = self.ledger_repository.get_session(message.user.user_id) or {
-                "stage": None,
-                "draft": {}
-            }
-
-            current_stage = session.get("stage")
-            text = message.text.strip()
-
-            # === Manejo de comandos y botones (sin sesión activa) ===
-
-            if text == "/start":
-                await self.gastos_service.handle_command_start(message)
-                self.ledger_repository.clear_session(message.user.user_id)
-                return
-
-            if text == "💸 Nuevo Gasto":
-                stage, draft = await self.gastos_service.handle_button_nuevo_gasto(message)
-                self.ledger_repository.save_session(message.user.user_id, {"stage": stage, "draft": draft})
-                return
-
-            if text == "💰 Nuevo Ingreso":
-                stage, draft = await self.gastos_service.handle_button_nuevo_ingreso(message)
-                self.ledger_repository.save_session(message.user.user_id, {"stage": stage, "draft": draft})
-                return
+        Se conservan solo los updates posteriores al último procesado.
+        """
+        await self.inbox.save(updates, self._last_processed_update)
 
-            if text == "📊 Ver Categorías":
-                await self.gastos_service.handle_button_ver_categorias(message)
-                return
+    async def run_scheduled(self, poll):
+        """
+        Corre ``poll`` junto con las tareas que solo hace la instancia que hace polling.
 
-            if text == "📤 Exportar CSV" or text == "/export":
-                await self.gastos_service.handle_button_exportar_csv(message)
-                return
+        Archivado de meses cerrados y movimientos recurrentes; con lease (o en el
+        proceso de ingreso del escalado) no se duplican entre instancias.
+        """
+        if settings.LEDGER_ARCHIVE:
+            await self._archive_closed_months()
+        recurring_task = asyncio.create_task(self.recurring_service.run())
+        try:
+            await poll()
+        finally:
+            recurring_task.cancel()
+
+    async def _replay_inbox(self):
+        """Procesa los updates del inbox que quedaron sin procesar (corte durante el polling anterior)."""
+        pending = await self.inbox.pending()
+        if pending:
+            logger.info("📬 Reprocesando %s update(s) recibidos antes del último corte", len(pending))
+        for update in pending:
+            try:
+                await self.process_message(update)
+            except Exception as e:
+                logger.error("Error reprocesando update %s: %s", update.get("update_id"), e, exc_info=True)
+            self._replayed_updates.add(update["update_id"])
+        if pending:
+            await self.inbox.clear()
 
-            if text == "❓ Ayuda":
-                await self.gastos_service.handle_button_ayuda(message)
-                return
+    async def _process_message(self, update: dict):
+        """
+        Procesa un update dentro del contexto de logging del update.
 
-            # === Wizard guiado (con sesión activa) ===
+        La sesión del usuario se lee una vez y los cambios (sesión y offset)
+        se guardan en una única escritura al final.
+        """
+        uow = _UpdateUnitOfWork(
+            self.ledger_repository,
+            update.get("update_id") if self.track_offset else None,
+        )
 
-            if current_stage == "amount":
-                stage, draft = await self.gastos_service.process_wizard_amount(message, session)
-                if stage:
-                    self.ledger_repository.save_session(message.user.user_id, {"stage": stage, "draft": draft})
-                else:
-                    self.ledger_repository.clear_session(message.user.user_id)
-                return
+        # Extraer mensaje
+        msg = update.get("message")
+        callback = update.get("callback_query")
+        if not msg and not (callback and callback.get("message")):
+            logger.debug("Update sin mensaje (tipo: %s)", list(update))
+            await uow.commit()
+            return
+        chat_id = (msg or callback["message"])["chat"]["id"]
 
-            if current_stage == "currency":
-                stage, draft = await self.gastos_service.process_wizard_currency(message, session)
-                if stage:
-                    self.ledger_repository.save_session(message.user.user_id, {"stage": stage, "draft": draft})
-                else:
-                    self.ledger_repository.clear_session(message.user.user_id)
+        try:
+            if callback:
+                await self._process_callback(update, uow)
                 return
 
-            if current_stage == "category":
-                stage, draft = await self.gastos_service.process_wizard_category(message, session)
-                if stage:
-                    self.ledger_repository.save_session(message.user.user_id, {"stage": stage, "draft": draft})
-                else:
-                    self.ledger_repository.clear_session(message.user.user_id)
-                return
+            # Convertir a TelegramMessage
+            message = TelegramMessage.from_telegram_update(update)
 
-            if current_stage == "description":
-                stage, draft = await self.gastos_service.process_wizard_description(message, session)
-                if stage:
-                    self.ledger_repository.save_session(message.user.user_id, {"stage": stage, "draft": draft})
-                else:
-                    self.ledger_repository.clear_session(message.user.user_id)
-                return
+            logger.info("Mensaje de %s: %s...", message.user.get_display_name(), message.text[:50])
 
-            if current_stage == "account":
-                stage, draft = await self.gastos_service.process_wizard_account(message, session)
-                if stage:
-                    self.ledger_repository.save_session(message.user.user_id, {"stage": stage, "draft": draft})
-                else:
-                    self.ledger_repository.clear_session(message.user.user_id)
-                return
+            # Obtener sesión del usuario (única lectura)
+            uow.load_session(message.user.user_id)
+            current_stage = uow.session.get("stage")
+            bind_log_context(stage=current_stage)
+            text = message.text.strip()
 
-            # Si llega acá, es un mensaje no reconocido
-            logger.debug(f"Mensaje no reconocido: {text}")
+            if message.document:
+                route = self._document_route
+            else:
+                route = self._resolve_route(text, current_stage)
+            if route:
+                await route(message, uow)
+            else:
+                # Si llega acá, es un mensaje no reconocido
+                logger.debug("Mensaje no reconocido: %s", text)
 
         except Exception as e:
-            logger.error(f"Error procesando mensaje: {e}", exc_info=True)
+            logger.error("Error procesando mensaje: %s", e, exc_info=True)
             # Intentar notificar al usuario
             try:
                 await self.telegram_service.send_message(
-                    msg["chat"]["id"],
+                    chat_id,
                     f"❌ Error inesperado: {str(e)}"
                 )
             except:
                 pass
+        finally:
+            await uow.commit()
+
+    async def _process_callback(self, update: dict, uow: "_UpdateUnitOfWork"):
+        """
+        Procesa un botón inline del wizard (callback_data ``wiz:<stage>:<índice>``).
+
+        El botón solo vale si el wizard sigue en esa etapa y en ese mensaje;
+        si no, se le quitan los botones al mensaje viejo.
+        """
+        message = TelegramMessage.from_callback_query(update, int(time.time()))
+        uow.load_session(message.user.user_id)
+        stage = uow.session.get("stage")
+        bind_log_context(stage=stage)
+        draft = uow.session.get("draft") or {}
+
+        prefix, _, rest = message.text.partition(":")
+        button_stage, _, index = rest.partition(":")
+        options = draft.get("wizard_options") or []
+        step = self._stage_routes.get(stage)
+        if (
+            prefix != "wiz"
+            or not step
+            or button_stage != stage
+            or draft.get("wizard_message_id") != message.message_id
+            or not index.isdigit()
+            or int(index) >= len(options)
+        ):
+            if draft.get("wizard_message_id") == message.message_id:
+                # Doble toque sobre el mensaje activo: el paso ya avanzó
+                await self.telegram_service.answer_callback_query(message.callback_query_id)
+                return
+            await asyncio.gather(
+                self.telegram_service.answer_callback_query(message.callback_query_id, "Esta carga ya no está activa"),
+                self.telegram_service.edit_message_reply_markup(message.chat.chat_id, message.message_id),
+            )
+            return
+
+        # Se confirma el botón mientras se procesa el paso
+        answer = asyncio.create_task(self.telegram_service.answer_callback_query(message.callback_query_id))
+        try:
+            message.text = options[int(index)]
+            logger.info("Botón de %s: %s", message.user.get_display_name(), message.text[:50])
+            next_stage, next_draft = await step(message, uow.session)
+            uow.set(next_stage, next_draft)
+        finally:
+            await answer
+
+    async def close(self):
+        """Cierra las conexiones de los servicios."""
+        await asyncio.to_thread(self.category_index.save)
+        await self.telegram_service.close()
+        await self.actual_budget_service.close()
+        if self.gastos_service.charts:
+            self.gastos_service.charts.close()
+        logger.info("Caché de reportes: %s", self.gastos_service.reports.stats())
+
+    def _on_ready(self):
+        """Señal de readiness: se emite el primer getUpdates."""
+        elapsed = time.monotonic() - self.started_at
+        logger.info("✅ Bot listo: primer getUpdates emitido %.2fs después del arranque", elapsed)
+
+        if settings.READY_FILE:
+            try:
+                with open(settings.READY_FILE, "w", encoding="utf-8") as f:
+                    f.write(f"{time.time():.3f} {elapsed:.3f}\n")
+            except OSError as e:
+                logger.warning("No se pudo escribir READY_FILE %s: %s", settings.READY_FILE, e)
+
+    def _clear_ready(self):
+        """Elimina el archivo de readiness al detener el bot."""
+        if settings.READY_FILE and os.path.exists(settings.READY_FILE):
+            try:
+                os.remove(settings.READY_FILE)
+            except OSError:
+                pass
+
+    async def _archive_closed_months(self):
+        """Archiva los meses cerrados del ledger sin bloquear el event loop."""
+        try:
+            await asyncio.to_thread(self.ledger_repository.archive_closed_months)
+        except Exception as e:
+            logger.error("Error archivando meses cerrados: %s", e, exc_info=True)
+
+    def _install_profile_signal(self):
+        """``kill -USR1 <pid>`` arranca un profiling de ``PROFILE_SECONDS`` (o lo corta si ya corre)."""
+        if not hasattr(signal, "SIGUSR1"):
+            return
+
+        def toggle():
+            if tracing.profiler.running:
+                tracing.profiler.stop()
+            else:
+                tracing.profiler.start(settings.PROFILE_SECONDS)
+
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, toggle)
+        except (NotImplementedError, RuntimeError):
+            pass  # Loop sin soporte de señales (o fuera del thread principal)
+
+    async def _load_exchange_rates(self, path: str):
+        """Carga el CSV de cotizaciones; un archivo inválido no impide arrancar."""
+        try:
+            loaded = await asyncio.to_thread(self.exchange_rates.load_file, path)
+            logger.info("💱 Cotizaciones cargadas desde %s: %s", path, loaded)
+        except (OSError, ValueError) as e:
+            logger.error("No se pudieron cargar las cotizaciones de %s: %s", path, e)
 
     async def start(self):
         """Inicia el bot."""
@@ -149,36 +433,58 @@ class GastosBot:
             logger.info("✅ Configuración validada")
 
             # Información del bot
-            logger.info(f"📡 Intervalo de polling: {settings.POLLING_INTERVAL}s")
-            logger.info(f"💰 Moneda por defecto: {settings.DEFAULT_CURRENCY}")
-            logger.info(f"📂 Categorías: {len(settings.CATEGORIES)}")
+            logger.info("📡 Intervalo de polling: %ss", settings.POLLING_INTERVAL)
+            logger.info("💰 Moneda por defecto: %s", settings.DEFAULT_CURRENCY)
+            logger.info("📂 Categorías: %s", len(settings.CATEGORIES))
+
+            # Precargar cuentas/categorías de Actual Budget sin demorar el polling
+            if self.actual_budget_service.is_configured():
+                self._warm_up_task = asyncio.create_task(self.actual_budget_service.warm_up())
+
+            # SIGUSR1: activa (o corta) el profiling bajo demanda
+            self._install_profile_signal()
+
+            # Índice de categorías: snapshot + movimientos nuevos, en segundo plano
+            self._index_task = asyncio.create_task(asyncio.to_thread(self.category_index.load))
+
+            # Cotizaciones desde archivo (opcional)
+            if settings.EXCHANGE_RATES_FILE:
+                await self._load_exchange_rates(settings.EXCHANGE_RATES_FILE)
 
             # Cargar offset anterior
             offset = self.ledger_repository.get_update_offset()
-            logger.info(f"🔄 Último update procesado: {offset}")
+            logger.info("🔄 Último update procesado: %s", offset)
 
-            # Callback para procesar mensajes y actualizar offset
-            async def on_message(update):
-                await self.process_message(update)
-                # Actualizar offset
-                new_offset = update.get("update_id", 0)
-                if new_offset > offset:
-                    self.ledger_repository.save_update_offset(new_offset)
-
-            # Iniciar polling
+            # Iniciar polling (process_message guarda el offset junto con la sesión)
             logger.info("\n🚀 Bot iniciado. Esperando mensajes...\n")
-            await self.telegram_service.start_polling(on_message)
+
+            async def poll():
+                # Lo recibido y confirmado en Telegram que no llegó a procesarse
+                await self._replay_inbox()
+                await self.telegram_service.start_polling(
+                    self.process_message, on_ready=self._on_ready, on_received=self._save_inbox
+                )
+
+            if settings.POLLER_LEASE:
+                # Solo una instancia hace polling (redeploys superpuestos)
+                self._lease = PollerLease(self.ledger_repository)
+                await self._lease.run_while_held(lambda: self.run_scheduled(poll))
+            else:
+                await self.run_scheduled(poll)
 
         except ValueError as e:
-            logger.error(f"❌ Error de configuración: {e}")
+            logger.error("❌ Error de configuración: %s", e)
             logger.error("Por favor, configurá las variables en config.yaml")
         except KeyboardInterrupt:
             logger.info("\n\n🛑 Bot detenido por el usuario")
         except Exception as e:
-            logger.error(f"❌ Error fatal: {e}", exc_info=True)
+            logger.error("❌ Error fatal: %s", e, exc_info=True)
         finally:
             # Cerrar conexiones
             logger.info("Cerrando conexiones...")
-            await self.telegram_service.close()
-            await self.actual_budget_service.close()
+            if self._lease:
+                await self._lease.release()
+            self._clear_ready()
+            await self.close()
             logger.info("✅ Conexiones cerradas correctamente")
+            shutdown_logging()
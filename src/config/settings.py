@@ -1,6 +1,5 @@
 """Configuración centralizada del bot."""
 import os
-import yaml
 from typing import List, Optional
 
 
@@ -22,6 +21,8 @@ class Settings:
         # Intentar cargar config.yaml si existe (local development)
         if os.path.exists(config_path):
             try:
+                import yaml
+
                 with open(config_path, "r", encoding="utf-8") as f:
                     config = yaml.safe_load(f) or {}
             except Exception as e:
@@ -38,16 +39,86 @@ class Settings:
         if os.getenv("DEFAULT_CURRENCY"):
             config["default_currency"] = os.getenv("DEFAULT_CURRENCY")
 
+        if os.getenv("BASE_CURRENCY"):
+            config["base_currency"] = os.getenv("BASE_CURRENCY")
+
+        if os.getenv("EXCHANGE_RATES_FILE"):
+            config["exchange_rates_file"] = os.getenv("EXCHANGE_RATES_FILE")
+
         if os.getenv("TIMEZONE"):
             config["timezone"] = os.getenv("TIMEZONE")
 
         if os.getenv("LOG_LEVEL"):
             config["log_level"] = os.getenv("LOG_LEVEL")
 
+        if os.getenv("READY_FILE"):
+            config["ready_file"] = os.getenv("READY_FILE")
+
+        if os.getenv("LOG_FORMAT"):
+            config["log_format"] = os.getenv("LOG_FORMAT")
+
+        if os.getenv("LOG_ASYNC"):
+            config["log_async"] = os.getenv("LOG_ASYNC").strip().lower() in ("1", "true", "yes")
+
         # Categorías desde env (separadas por comas)
         if os.getenv("CATEGORIES"):
             config["categories"] = [cat.strip() for cat in os.getenv("CATEGORIES").split(",")]
 
+        # IDs de Telegram con permisos de administrador (separados por comas)
+        if os.getenv("ADMIN_USER_IDS"):
+            config["admin_user_ids"] = [uid.strip() for uid in os.getenv("ADMIN_USER_IDS").split(",") if uid.strip()]
+
+        if os.getenv("POLLING_LIMIT"):
+            config["polling_limit"] = os.getenv("POLLING_LIMIT")
+
+        if os.getenv("POLLING_PREFETCH"):
+            config["polling_prefetch"] = os.getenv("POLLING_PREFETCH")
+
+        if os.getenv("TRACING"):
+            config["tracing"] = os.getenv("TRACING").strip().lower() in ("1", "true", "yes")
+
+        if os.getenv("TRACE_SLOW_MS"):
+            config["trace_slow_ms"] = os.getenv("TRACE_SLOW_MS")
+
+        if os.getenv("REPORT_CACHE_BYTES"):
+            config["report_cache_bytes"] = os.getenv("REPORT_CACHE_BYTES")
+
+        if os.getenv("CHART_WORKERS"):
+            config["chart_workers"] = os.getenv("CHART_WORKERS")
+
+        if os.getenv("CHART_MAX_PER_USER"):
+            config["chart_max_per_user"] = os.getenv("CHART_MAX_PER_USER")
+
+        if os.getenv("PROFILE_DIR"):
+            config["profile_dir"] = os.getenv("PROFILE_DIR")
+
+        if os.getenv("PROFILE_SECONDS"):
+            config["profile_seconds"] = os.getenv("PROFILE_SECONDS")
+
+        if os.getenv("POLLER_LEASE"):
+            config["poller_lease"] = os.getenv("POLLER_LEASE").strip().lower() in ("1", "true", "yes")
+
+        if os.getenv("POLLER_LEASE_TTL"):
+            config["poller_lease_ttl"] = os.getenv("POLLER_LEASE_TTL")
+
+        if os.getenv("WORKER_PROCESSES"):
+            config["worker_processes"] = os.getenv("WORKER_PROCESSES")
+
+        if os.getenv("BACKFILL_CHUNK_SIZE"):
+            config["backfill_chunk_size"] = os.getenv("BACKFILL_CHUNK_SIZE")
+
+        if os.getenv("INLINE_WIZARD"):
+            config["inline_wizard"] = os.getenv("INLINE_WIZARD").strip().lower() in ("1", "true", "yes")
+
+        if os.getenv("LEDGER_ARCHIVE"):
+            config["ledger_archive"] = os.getenv("LEDGER_ARCHIVE").strip().lower() in ("1", "true", "yes")
+
+        if os.getenv("LEDGER_SNAPSHOT"):
+            config["ledger_snapshot"] = os.getenv("LEDGER_SNAPSHOT").strip().lower() in ("1", "true", "yes")
+
+        if os.getenv("LEDGER_ARCHIVE_KEEP_MONTHS"):
+            config["ledger_archive_keep_months"] = os.getenv("LEDGER_ARCHIVE_KEEP_MONTHS")
+
         if os.getenv("DATABASE_URL"):
             config["database_url"] = os.getenv("DATABASE_URL")
 
@@ -72,6 +143,21 @@ class Settings:
         if os.getenv("ACTUAL_BUDGET_PASSWORD"):
             config["actual_budget"]["password"] = os.getenv("ACTUAL_BUDGET_PASSWORD")
 
+        if os.getenv("ACTUAL_BUDGET_TIMEOUT"):
+            config["actual_budget"]["timeout"] = os.getenv("ACTUAL_BUDGET_TIMEOUT")
+
+        if os.getenv("ACTUAL_BUDGET_MAX_WORKERS"):
+            config["actual_budget"]["max_workers"] = os.getenv("ACTUAL_BUDGET_MAX_WORKERS")
+
+        if os.getenv("ACTUAL_BUDGET_BREAKER_FAILURES"):
+            config["actual_budget"]["breaker_failures"] = os.getenv("ACTUAL_BUDGET_BREAKER_FAILURES")
+
+        if os.getenv("ACTUAL_BUDGET_BREAKER_RESET"):
+            config["actual_budget"]["breaker_reset"] = os.getenv("ACTUAL_BUDGET_BREAKER_RESET")
+
+        if os.getenv("ACTUAL_BUDGET_CACHE_TTL"):
+            config["actual_budget"]["cache_ttl"] = os.getenv("ACTUAL_BUDGET_CACHE_TTL")
+
         # Cuentas de Actual Budget (múltiples)
         accounts = {}
         if os.getenv("ACTUAL_BUDGET_ACCOUNT_MERCADOPAGO"):
@@ -99,6 +185,16 @@ class Settings:
         """Moneda por defecto."""
         return self._config.get("default_currency", "ARS")
 
+    @property
+    def BASE_CURRENCY(self) -> str:
+        """Moneda a la que se convierten resúmenes y exportaciones (por defecto, la moneda por defecto)."""
+        return str(self._config.get("base_currency") or self.DEFAULT_CURRENCY).upper()
+
+    @property
+    def EXCHANGE_RATES_FILE(self) -> Optional[str]:
+        """CSV de cotizaciones (moneda,fecha,cotización) que se carga al iniciar (opcional)."""
+        return self._config.get("exchange_rates_file") or None
+
     @property
     def TIMEZONE(self) -> str:
         """Zona horaria."""
@@ -122,11 +218,116 @@ class Settings:
         """Nivel de logging."""
         return self._config.get("log_level", "INFO")
 
+    @property
+    def LOG_FORMAT(self) -> str:
+        """Formato de salida de logs: "text" o "json" (estructurado)."""
+        return str(self._config.get("log_format", "text")).lower()
+
+    @property
+    def LOG_ASYNC(self) -> bool:
+        """Si es True, los logs se escriben desde un thread dedicado (QueueHandler)."""
+        return bool(self._config.get("log_async", False))
+
     @property
     def POLLING_INTERVAL(self) -> int:
         """Intervalo de polling en segundos."""
         return self._config.get("polling_interval", 5)
 
+    @property
+    def POLLING_LIMIT(self) -> int:
+        """Máximo de updates por getUpdates (1-100)."""
+        return min(100, max(1, int(self._config.get("polling_limit", 100))))
+
+    @property
+    def POLLING_PREFETCH(self) -> int:
+        """Lotes de updates recibidos que pueden esperar en cola mientras se procesa el actual."""
+        return max(1, int(self._config.get("polling_prefetch", 2)))
+
+    @property
+    def TRACING(self) -> bool:
+        """Si es True, arranca con el tracing por update activo (también se activa con /traza on)."""
+        return bool(self._config.get("tracing", False))
+
+    @property
+    def TRACE_SLOW_MS(self) -> float:
+        """Updates más lentos que esto (ms) se loguean con su desglose por categoría."""
+        return float(self._config.get("trace_slow_ms", 1000))
+
+    @property
+    def REPORT_CACHE_BYTES(self) -> int:
+        """Tamaño máximo (bytes) del caché de reportes (/resumen, /export, /grafico); 0 lo desactiva."""
+        return int(self._config.get("report_cache_bytes", 4 * 1024 * 1024))
+
+    @property
+    def CHART_WORKERS(self) -> int:
+        """Procesos que renderizan gráficos de /grafico."""
+        return max(1, int(self._config.get("chart_workers", 2)))
+
+    @property
+    def CHART_MAX_PER_USER(self) -> int:
+        """Gráficos en curso como máximo por usuario."""
+        return max(1, int(self._config.get("chart_max_per_user", 1)))
+
+    @property
+    def PROFILE_DIR(self) -> str:
+        """Directorio de los reportes de /perfil (o SIGUSR1)."""
+        return self._config.get("profile_dir", os.path.join("data", "profiles"))
+
+    @property
+    def PROFILE_SECONDS(self) -> float:
+        """Duración por defecto del profiling bajo demanda."""
+        return max(1.0, float(self._config.get("profile_seconds", 30)))
+
+    @property
+    def ADMIN_USER_IDS(self) -> List[int]:
+        """IDs de usuarios de Telegram habilitados para comandos de administración."""
+        return [int(uid) for uid in self._config.get("admin_user_ids", [])]
+
+    @property
+    def POLLER_LEASE(self) -> bool:
+        """Si es True, solo la instancia con el lease de la base hace polling."""
+        return bool(self._config.get("poller_lease", True))
+
+    @property
+    def POLLER_LEASE_TTL(self) -> float:
+        """Vigencia (segundos) del lease de polling sin heartbeat."""
+        return float(self._config.get("poller_lease_ttl", 15))
+
+    @property
+    def WORKER_PROCESSES(self) -> int:
+        """Procesos worker en modo scale-out (0 = un solo proceso)."""
+        return max(0, int(self._config.get("worker_processes", 0)))
+
+    @property
+    def BACKFILL_CHUNK_SIZE(self) -> int:
+        """Movimientos por lote al hacer backfill hacia Actual Budget."""
+        return max(1, int(self._config.get("backfill_chunk_size", 200)))
+
+    @property
+    def INLINE_WIZARD(self) -> bool:
+        """Si es True, el wizard usa botones inline y edita un único mensaje en lugar de enviar uno por paso."""
+        return bool(self._config.get("inline_wizard", False))
+
+    @property
+    def LEDGER_ARCHIVE(self) -> bool:
+        """Si es True, al iniciar se archivan los meses cerrados del ledger."""
+        return bool(self._config.get("ledger_archive", False))
+
+    @property
+    def LEDGER_SNAPSHOT(self) -> bool:
+        """Si es True, el backend de archivos mantiene ``data/ledger.snap`` (copia binaria para leer el ledger rápido)."""
+        return bool(self._config.get("ledger_snapshot", True))
+
+    @property
+    def LEDGER_ARCHIVE_KEEP_MONTHS(self) -> int:
+        """Meses que quedan en caliente al archivar (incluido el actual)."""
+        return max(1, int(self._config.get("ledger_archive_keep_months", 1)))
+
+    @property
+    def READY_FILE(self) -> Optional[str]:
+        """Archivo que se crea cuando el bot emite su primer getUpdates (opcional)."""
+        return self._config.get("ready_file") or None
+
     @property
     def DATABASE_URL(self) -> Optional[str]:
         """Cadena de conexión a la base de datos del bot."""
@@ -173,6 +374,31 @@ class Settings:
         """Contraseña del servidor de Actual Budget."""
         return self._config.get("actual_budget", {}).get("password")
 
+    @property
+    def ACTUAL_BUDGET_TIMEOUT(self) -> float:
+        """Timeout (segundos) de cada llamada a Actual Budget."""
+        return float(self._config.get("actual_budget", {}).get("timeout", 30))
+
+    @property
+    def ACTUAL_BUDGET_MAX_WORKERS(self) -> int:
+        """Threads máximos dedicados a llamadas a Actual Budget."""
+        return max(1, int(self._config.get("actual_budget", {}).get("max_workers", 2)))
+
+    @property
+    def ACTUAL_BUDGET_BREAKER_FAILURES(self) -> int:
+        """Fallos consecutivos que abren el circuit breaker de Actual Budget."""
+        return int(self._config.get("actual_budget", {}).get("breaker_failures", 3))
+
+    @property
+    def ACTUAL_BUDGET_BREAKER_RESET(self) -> float:
+        """Segundos con el breaker abierto antes de intentar una llamada de prueba."""
+        return float(self._config.get("actual_budget", {}).get("breaker_reset", 60))
+
+    @property
+    def ACTUAL_BUDGET_CACHE_TTL(self) -> float:
+        """Segundos que se conservan los ids de cuentas/categorías/payees cacheados."""
+        return float(self._config.get("actual_budget", {}).get("cache_ttl", 600))
+
     def validate(self):
         """Valida que la configuración esté completa."""
         _ = self.TELEGRAM_BOT_TOKEN  # Lanza error si no está configurado
@@ -0,0 +1,778 @@
+"""Backend de persistencia sobre base de datos (SQLAlchemy).
+
+Se importa de forma diferida desde ``LedgerRepository`` solo cuando hay
+``DATABASE_URL`` configurada, para no cargar SQLAlchemy en el modo archivos.
+"""
+import copy
+import heapq
+import re
+import time
+import unicodedata
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    bindparam,
+    create_engine,
+    delete,
+    func,
+    insert,
+    inspect,
+    literal_column,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from src.repositories.ledger_repository import _default_state, search_tokens
+from src.schemas import Gasto
+from src.utils.local_time import local_date, month_bucket
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+Base = declarative_base()
+
+# Documento de búsqueda en Postgres; debe coincidir con el índice GIN para que se use
+_PG_SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, coalesce(description, '') || ' ' || coalesce(payee, ''))"
+_SEARCH_TABLES = ("ledger_entries", "ledger_archive")
+# Columnas derivadas de ``ts`` agregadas después de la primera versión del esquema
+_DATE_COLUMNS = ("local_date", "month")
+_BACKFILL_BATCH = 5000
+# Fila de bot_state que marca el backfill de _DATE_COLUMNS como terminado
+_DATE_BACKFILL_KEY = "schema:date_columns"
+
+
+def _date_columns(ts: int) -> Dict[str, Any]:
+    """Día y mes locales de un movimiento (valores de ``local_date`` y ``month``)."""
+    return {"local_date": local_date(ts), "month": month_bucket(ts)}
+
+
+class _LedgerColumns:
+    """Columnas comunes a los movimientos en caliente y archivados."""
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    ts = Column(BigInteger, nullable=False)
+    date_iso = Column(String(32), nullable=False)
+    amount = Column(Integer, nullable=False)
+    currency = Column(String(12), nullable=False)
+    category = Column(String(128), nullable=False)
+    description = Column(Text, default="")
+    payee = Column(String(255), default="")
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Día y mes en hora local, calculados desde ``ts`` al escribir (índices de rango y por mes)
+    local_date = Column(Date)
+    month = Column(String(7))
+
+    @classmethod
+    def from_gasto(cls, gasto: Gasto):
+        return cls(
+            **_date_columns(int(gasto.ts)),
+            chat_id=gasto.chat_id,
+            message_id=gasto.message_id,
+            user_id=gasto.user_id,
+            ts=int(gasto.ts),
+            date_iso=gasto.date_iso,
+            amount=int(gasto.amount),
+            currency=gasto.currency,
+            category=gasto.category,
+            description=gasto.description,
+            payee=gasto.payee,
+        )
+
+    def to_gasto(self) -> Gasto:
+        return Gasto(
+            chat_id=self.chat_id,
+            message_id=self.message_id,
+            user_id=self.user_id,
+            ts=self.ts,
+            date_iso=self.date_iso,
+            amount=self.amount,
+            currency=self.currency,
+            category=self.category,
+            description=self.description or "",
+            payee=self.payee or "",
+        )
+
+
+class LedgerEntry(_LedgerColumns, Base):
+    """Tabla de movimientos registrados por el bot (meses en caliente)."""
+
+    __tablename__ = "ledger_entries"
+
+    __table_args__ = (
+        UniqueConstraint("chat_id", "message_id", name="uq_ledger_chat_message"),
+        Index("ix_ledger_entries_chat_month", "chat_id", "month"),
+        Index("ix_ledger_entries_user_month", "user_id", "month"),
+        Index("ix_ledger_entries_local_date", "local_date"),
+    )
+
+
+class LedgerArchiveEntry(_LedgerColumns, Base):
+    """Movimientos de meses cerrados, particionados por ``month`` ("YYYY-MM")."""
+
+    __tablename__ = "ledger_archive"
+
+    month = Column(String(7), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("chat_id", "message_id", name="uq_ledger_archive_chat_message"),
+        Index("ix_ledger_archive_month", "month"),
+        Index("ix_ledger_archive_chat_month", "chat_id", "month"),
+        Index("ix_ledger_archive_local_date", "local_date"),
+    )
+
+
+class LedgerArchiveMonth(Base):
+    """Resumen de cada mes archivado."""
+
+    __tablename__ = "ledger_archive_months"
+
+    month = Column(String(7), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    totals = Column(JSON, nullable=False)
+    min_ts = Column(BigInteger)
+    max_ts = Column(BigInteger)
+    archived_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BotState(Base):
+    """Tabla para almacenar estado del bot (offset, sesiones, etc.)."""
+
+    __tablename__ = "bot_state"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(JSON, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class _DatabaseLedgerBackend:
+    """Implementación basada en PostgreSQL."""
+
+    def __init__(self, database_url: str):
+        self.engine = create_engine(database_url, pool_pre_ping=True, future=True)
+        self.SessionLocal = sessionmaker(bind=self.engine, expire_on_commit=False, future=True)
+        Base.metadata.create_all(self.engine)
+        self._ensure_date_columns()
+        self._search_mode = self._ensure_search_indexes()
+        # Conexiones dedicadas que retienen advisory locks de Postgres {nombre: conexión}
+        self._lock_connections: Dict[str, Any] = {}
+        logger.info("LedgerRepository inicializado con backend de base de datos")
+
+    @contextmanager
+    def session_scope(self):
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _ensure_date_columns(self):
+        """
+        Agrega ``local_date``/``month`` (y sus índices) a tablas creadas antes
+        de que existieran y completa las filas que no los tienen.
+
+        ``create_all`` no altera tablas existentes. El backfill recalcula desde
+        ``ts`` por lotes; en el archivo conserva el ``month`` que ya tenía.
+        Corre hasta completarse una vez (queda marcado en ``bot_state``) o
+        cuando se acaba de agregar una columna: todas las escrituras ya
+        completan estas columnas, así que después no hay nada que buscar.
+        """
+        inspector = inspect(self.engine)
+        if_not_exists = "IF NOT EXISTS " if self.engine.dialect.name == "postgresql" else ""
+        added = False
+        with self.engine.begin() as conn:
+            for model in (LedgerEntry, LedgerArchiveEntry):
+                table = model.__table__
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for name in _DATE_COLUMNS:
+                    if name not in existing:
+                        column_type = table.c[name].type.compile(dialect=self.engine.dialect)
+                        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{name} {column_type}"))
+                        added = True
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
+        with self.SessionLocal() as session:
+            if not added and session.get(BotState, _DATE_BACKFILL_KEY) is not None:
+                return
+
+        for model in (LedgerEntry, LedgerArchiveEntry):
+            table = model.__table__
+            backfill = (
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values(local_date=bindparam("new_date"), month=func.coalesce(table.c.month, bindparam("new_month")))
+            )
+            filled = 0
+            while True:
+                with self.session_scope() as session:
+                    rows = session.execute(
+                        select(table.c.id, table.c.ts)
+                        .where(or_(table.c.local_date.is_(None), table.c.month.is_(None)))
+                        .limit(_BACKFILL_BATCH)
+                    ).all()
+                    if not rows:
+                        break
+                    session.connection().execute(backfill, [
+                        {"row_id": row_id, "new_date": local_date(ts), "new_month": month_bucket(ts)}
+                        for row_id, ts in rows
+                    ])
+                filled += len(rows)
+            if filled:
+                logger.info("Fechas locales completadas en %s: %s filas", table.name, filled)
+
+        with self.session_scope() as session:
+            session.merge(BotState(key=_DATE_BACKFILL_KEY, value={"completed_at": datetime.utcnow().isoformat()}))
+
+    # === Ledger ===
+    def load_ledger(self, include_archive: bool = True) -> List[Gasto]:
+        models = (LedgerArchiveEntry, LedgerEntry) if include_archive else (LedgerEntry,)
+        gastos: List[Gasto] = []
+        with self.SessionLocal() as session:
+            for model in models:
+                result = session.execute(select(model).order_by(model.ts))
+                gastos.extend(row.to_gasto() for row in result.scalars().all())
+        if include_archive:
+            gastos.sort(key=lambda g: g.ts)  # Ya vienen en dos tramos ordenados
+        return gastos
+
+    def load_month(self, chat_id: int, month: str) -> List[Gasto]:
+        gastos: List[Gasto] = []
+        with self.SessionLocal() as session:
+            for model in (LedgerArchiveEntry, LedgerEntry):
+                result = session.execute(
+                    select(model).where(model.chat_id == chat_id, model.month == month).order_by(model.ts)
+                )
+                gastos.extend(row.to_gasto() for row in result.scalars().all())
+        gastos.sort(key=lambda g: g.ts)
+        return gastos
+
+    def save_ledger(self, gastos: List[Gasto]):
+        with self.session_scope() as session:
+            session.execute(delete(LedgerEntry))
+            for gasto in gastos:
+                session.add(LedgerEntry.from_gasto(gasto))
+
+    def iter_ledger_chunks(
+        self,
+        chunk_size: int = 500,
+        after: Optional[Tuple[int, int, int]] = None,
+    ) -> Iterator[List[Gasto]]:
+        def sort_key(gasto: Gasto) -> Tuple[int, int, int]:
+            return (gasto.ts, gasto.chat_id, gasto.message_id)
+
+        while True:
+            # Keyset sobre cada tabla y merge de ambos tramos ordenados
+            with self.SessionLocal() as session:
+                parts = [
+                    [row.to_gasto() for row in self._keyset_page(session, model, chunk_size, after)]
+                    for model in (LedgerArchiveEntry, LedgerEntry)
+                ]
+            chunk = list(heapq.merge(*parts, key=sort_key))[:chunk_size]
+            if not chunk:
+                return
+            after = sort_key(chunk[-1])
+            yield chunk
+
+    @staticmethod
+    def _keyset_page(session, model, limit: int, after: Optional[Tuple[int, int, int]]):
+        query = select(model).order_by(model.ts, model.chat_id, model.message_id)
+        if after is not None:
+            query = query.where(tuple_(model.ts, model.chat_id, model.message_id) > tuple_(*after))
+        return session.execute(query.limit(limit)).scalars().all()
+
+    def append_gasto(self, gasto: Gasto) -> bool:
+        entry = LedgerEntry.from_gasto(gasto)
+        session = self.SessionLocal()
+        try:
+            session.add(entry)
+            session.commit()
+            logger.info(
+                "Gasto agregado en base de datos: %s %s - %s",
+                gasto.amount,
+                gasto.currency,
+                gasto.category,
+            )
+            return True
+        except IntegrityError:
+            session.rollback()
+            logger.warning(
+                "Gasto duplicado en base de datos (chat_id=%s, message_id=%s), ignorando",
+                gasto.chat_id,
+                gasto.message_id,
+            )
+            return False
+        finally:
+            session.close()
+
+    def append_gastos(self, gastos: List[Gasto]) -> List[Tuple[int, int]]:
+        if not gastos:
+            return []
+        rows = [
+            {
+                "chat_id": g.chat_id,
+                "message_id": g.message_id,
+                "user_id": g.user_id,
+                "ts": int(g.ts),
+                "date_iso": g.date_iso,
+                "amount": int(g.amount),
+                "currency": g.currency,
+                "category": g.category,
+                "description": g.description,
+                "payee": g.payee,
+                "created_at": datetime.utcnow(),
+                **_date_columns(int(g.ts)),
+            }
+            for g in gastos
+        ]
+
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            dialect_insert = None
+
+        with self.session_scope() as session:
+            if dialect_insert is not None:
+                # INSERT multi-fila; los duplicados no devuelven fila
+                stmt = (
+                    dialect_insert(LedgerEntry)
+                    .on_conflict_do_nothing(index_elements=["chat_id", "message_id"])
+                    .returning(LedgerEntry.chat_id, LedgerEntry.message_id)
+                )
+                inserted = {tuple(row) for row in session.execute(stmt, rows).all()}
+            else:
+                inserted = set()
+                for row in rows:
+                    try:
+                        with session.begin_nested():
+                            session.execute(insert(LedgerEntry), row)
+                        inserted.add((row["chat_id"], row["message_id"]))
+                    except IntegrityError:
+                        pass
+        added = [(g.chat_id, g.message_id) for g in gastos if (g.chat_id, g.message_id) in inserted]
+        logger.info("Gastos agregados en lote en base de datos: %s de %s", len(added), len(gastos))
+        return added
+
+    # === Búsqueda ===
+    def _ensure_search_indexes(self) -> str:
+        """
+        Crea los índices de texto si faltan y devuelve el modo de búsqueda.
+
+        - postgresql: índice GIN sobre tsvector (configuración 'simple')
+        - fts5: tablas FTS5 de contenido externo mantenidas por triggers
+        - like: sin índice (otros motores o SQLite sin FTS5)
+        """
+        dialect = self.engine.dialect.name
+        try:
+            with self.engine.begin() as conn:
+                if dialect == "postgresql":
+                    for table in _SEARCH_TABLES:
+                        conn.execute(text(
+                            f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING GIN ({_PG_SEARCH_DOCUMENT})"
+                        ))
+                    return "postgresql"
+                if dialect == "sqlite":
+                    for table in _SEARCH_TABLES:
+                        self._ensure_fts5_table(conn, table)
+                    return "fts5"
+        except OperationalError as e:
+            logger.warning("Búsqueda sin índice de texto (%s): %s", dialect, e)
+        return "like"
+
+    @staticmethod
+    def _ensure_fts5_table(conn, table: str):
+        fts = f"{table}_fts"
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+        ).first()
+        if exists:
+            return
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5(description, payee, content='{table}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, description, payee) VALUES (new.id, new.description, new.payee); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, description, payee) "
+            f"VALUES ('delete', old.id, old.description, old.payee); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, description, payee) "
+            f"VALUES ('delete', old.id, old.description, old.payee); "
+            f"INSERT INTO {fts}(rowid, description, payee) VALUES (new.id, new.description, new.payee); END"
+        ))
+        # Indexa las filas que ya existían
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    @staticmethod
+    def _pg_tsquery(query: str) -> str:
+        """Prefijos con y sin acentos (la configuración 'simple' no los quita)."""
+        terms = []
+        for word in re.findall(r"[^\W_]+", query.lower()):
+            plain = unicodedata.normalize("NFKD", word).encode("ascii", "ignore").decode("ascii")
+            variants = [f"{v}:*" for v in dict.fromkeys((word, plain)) if len(v) >= 2]
+            if variants:
+                terms.append("(" + " | ".join(variants) + ")")
+        return " & ".join(terms)
+
+    def _search_page(self, session, model, chat_id: int, query: str, limit: int, before):
+        table = model.__tablename__
+        statement = select(model).where(model.chat_id == chat_id)
+        if self._search_mode == "postgresql":
+            statement = statement.where(
+                text(f"{_PG_SEARCH_DOCUMENT} @@ to_tsquery('simple'::regconfig, :tsquery)").bindparams(
+                    tsquery=self._pg_tsquery(query)
+                )
+            )
+        elif self._search_mode == "fts5":
+            match = " ".join(f'"{token}"*' for token in search_tokens(query))
+            statement = statement.where(
+                model.id.in_(
+                    select(literal_column("rowid"))
+                    .select_from(text(f"{table}_fts"))
+                    .where(text(f"{table}_fts MATCH :match").bindparams(match=match))
+                )
+            )
+        else:
+            document = func.lower(func.coalesce(model.description, "") + " " + func.coalesce(model.payee, ""))
+            for token in search_tokens(query):
+                statement = statement.where(document.like(f"%{token}%"))
+        if before is not None:
+            statement = statement.where(tuple_(model.ts, model.message_id) < tuple_(*before))
+        statement = statement.order_by(model.ts.desc(), model.message_id.desc()).limit(limit)
+        return session.execute(statement).scalars().all()
+
+    def search_gastos(
+        self,
+        chat_id: int,
+        query: str,
+        limit: int = 10,
+        before: Optional[Tuple[int, int]] = None,
+    ) -> List[Gasto]:
+        if not search_tokens(query):
+            return []
+        with self.SessionLocal() as session:
+            rows = [
+                row
+                for model in (LedgerEntry, LedgerArchiveEntry)
+                for row in self._search_page(session, model, chat_id, query, limit, before)
+            ]
+        hits = sorted((row.to_gasto() for row in rows), key=lambda g: (g.ts, g.message_id), reverse=True)
+        return hits[:limit]
+
+    def sum_expenses(self, user_id: int, month: str, category: str, currency: str) -> int:
+        with self.SessionLocal() as session:
+            total = session.execute(
+                select(func.sum(LedgerEntry.amount)).where(
+                    LedgerEntry.user_id == user_id,
+                    LedgerEntry.amount < 0,
+                    LedgerEntry.category == category,
+                    LedgerEntry.currency == currency,
+                    LedgerEntry.month == month,
+                )
+            ).scalar()
+        return -int(total or 0)
+
+    def update_gasto(self, gasto: Gasto) -> bool:
+        with self.session_scope() as session:
+            result = session.execute(
+                update(LedgerEntry)
+                .where(LedgerEntry.chat_id == gasto.chat_id, LedgerEntry.message_id == gasto.message_id)
+                .values(
+                    user_id=gasto.user_id,
+                    ts=int(gasto.ts),
+                    date_iso=gasto.date_iso,
+                    amount=int(gasto.amount),
+                    currency=gasto.currency,
+                    category=gasto.category,
+                    description=gasto.description,
+                    payee=gasto.payee,
+                    **_date_columns(int(gasto.ts)),
+                )
+            )
+            updated = result.rowcount > 0
+        if updated:
+            logger.info("Gasto editado en base de datos (chat_id=%s, message_id=%s)", gasto.chat_id, gasto.message_id)
+        return updated
+
+    def delete_gasto(self, chat_id: int, message_id: int) -> bool:
+        with self.session_scope() as session:
+            result = session.execute(
+                delete(LedgerEntry).where(LedgerEntry.chat_id == chat_id, LedgerEntry.message_id == message_id)
+            )
+            deleted = result.rowcount > 0
+        if deleted:
+            logger.info("Gasto eliminado de base de datos (chat_id=%s, message_id=%s)", chat_id, message_id)
+        return deleted
+
+    # === Archivo (meses cerrados) ===
+    def archive_months_before(self, cutoff: str) -> Dict[str, int]:
+        month = LedgerEntry.month
+        closed = LedgerEntry.month < cutoff
+        columns = [
+            "chat_id", "message_id", "user_id", "ts", "date_iso", "amount",
+            "currency", "category", "description", "payee", "created_at", "local_date", "month",
+        ]
+        with self.session_scope() as session:
+            rows = session.execute(
+                select(
+                    month,
+                    LedgerEntry.currency,
+                    func.count(),
+                    func.sum(LedgerEntry.amount),
+                    func.min(LedgerEntry.ts),
+                    func.max(LedgerEntry.ts),
+                )
+                .where(closed)
+                .group_by(month, LedgerEntry.currency)
+            ).all()
+            if not rows:
+                return {}
+
+            session.execute(
+                insert(LedgerArchiveEntry).from_select(
+                    columns,
+                    select(*[getattr(LedgerEntry, name) for name in columns]).where(closed),
+                )
+            )
+            session.execute(delete(LedgerEntry).where(closed))
+
+            archived: Dict[str, int] = {}
+            for row_month, currency, count, total, min_ts, max_ts in rows:
+                summary = session.get(LedgerArchiveMonth, row_month, with_for_update=True)
+                if summary is None:
+                    summary = LedgerArchiveMonth(month=row_month, count=0, totals={})
+                    session.add(summary)
+                totals = dict(summary.totals or {})
+                totals[currency] = totals.get(currency, 0) + int(total or 0)
+                summary.totals = totals
+                summary.count = (summary.count or 0) + count
+                summary.min_ts = min(t for t in (summary.min_ts, min_ts) if t is not None)
+                summary.max_ts = max(t for t in (summary.max_ts, max_ts) if t is not None)
+                archived[row_month] = archived.get(row_month, 0) + count
+        return dict(sorted(archived.items()))
+
+    def get_archive_summaries(self) -> List[Dict[str, Any]]:
+        with self.SessionLocal() as session:
+            rows = session.execute(select(LedgerArchiveMonth).order_by(LedgerArchiveMonth.month)).scalars()
+            return [
+                {
+                    "month": row.month,
+                    "count": row.count,
+                    "totals": dict(row.totals or {}),
+                    "min_ts": row.min_ts,
+                    "max_ts": row.max_ts,
+                }
+                for row in rows
+            ]
+
+    # === Estado ===
+    def _load_state_row(self) -> Dict[str, Any]:
+        with self.SessionLocal() as session:
+            state = session.get(BotState, "global_state")
+            if not state:
+                return _default_state()
+            stored = state.value or {}
+            stored.setdefault("update_offset", 0)
+            stored.setdefault("sessions", {})
+            return stored
+
+    def load_state(self) -> Dict[str, Any]:
+        return self._load_state_row()
+
+    def save_state(self, state: Dict[str, Any]):
+        with self.session_scope() as session:
+            current = session.get(BotState, "global_state")
+            if current:
+                current.value = state
+            else:
+                session.add(BotState(key="global_state", value=state))
+
+    def _update_state(self, mutate: Callable[[Dict[str, Any]], None]):
+        """Lee, modifica y guarda el estado en una única transacción."""
+        with self.session_scope() as session:
+            current = session.get(BotState, "global_state", with_for_update=True)
+            # Copia profunda: la columna JSON no detecta mutaciones in-place
+            state = copy.deepcopy(current.value) if current and current.value else _default_state()
+            state.setdefault("update_offset", 0)
+            state.setdefault("sessions", {})
+            mutate(state)
+            if current:
+                current.value = state
+            else:
+                session.add(BotState(key="global_state", value=state))
+
+    def apply_state_changes(
+        self,
+        sessions: Optional[Dict[int, Optional[Dict[str, Any]]]] = None,
+        update_offset: Optional[int] = None,
+    ):
+        def mutate(state: Dict[str, Any]):
+            for user_id, session_data in (sessions or {}).items():
+                if session_data is None:
+                    state["sessions"].pop(str(user_id), None)
+                else:
+                    state["sessions"][str(user_id)] = session_data
+            if update_offset is not None:
+                state["update_offset"] = int(update_offset)
+
+        self._update_state(mutate)
+
+    def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        state = self._load_state_row()
+        return state.get("sessions", {}).get(str(user_id))
+
+    def save_session(self, user_id: int, session_data: Dict[str, Any]):
+        self.apply_state_changes(sessions={user_id: session_data})
+
+    def clear_session(self, user_id: int):
+        self.apply_state_changes(sessions={user_id: None})
+
+    def get_update_offset(self) -> int:
+        state = self._load_state_row()
+        return int(state.get("update_offset", 0))
+
+    def save_update_offset(self, offset: int):
+        self.apply_state_changes(update_offset=offset)
+
+    def get_backfill_checkpoint(self) -> Optional[Dict[str, Any]]:
+        state = self._load_state_row()
+        return state.get("backfill_checkpoint")
+
+    def save_backfill_checkpoint(self, checkpoint: Optional[Dict[str, Any]]):
+        def mutate(state: Dict[str, Any]):
+            if checkpoint is None:
+                state.pop("backfill_checkpoint", None)
+            else:
+                state["backfill_checkpoint"] = checkpoint
+
+        self._update_state(mutate)
+
+    # === Snapshots (índices derivados del ledger) ===
+    def load_snapshot(self, name: str) -> Optional[Dict[str, Any]]:
+        with self.SessionLocal() as session:
+            row = session.get(BotState, f"snapshot:{name}")
+            return copy.deepcopy(row.value) if row else None
+
+    def update_snapshot(self, name: str, mutate: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]):
+        key = f"snapshot:{name}"
+        with self.session_scope() as session:
+            row = session.get(BotState, key, with_for_update=True)
+            snapshot = mutate(copy.deepcopy(row.value) if row else None)
+            if row:
+                row.value = snapshot
+            else:
+                session.add(BotState(key=key, value=snapshot))
+
+    # === Leases (una sola instancia haciendo polling) ===
+    def try_acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        if self.engine.dialect.name == "postgresql":
+            return self._try_advisory_lock(name)
+        return self._try_lease_row(name, holder, ttl)
+
+    def release_lease(self, name: str, holder: str):
+        if self.engine.dialect.name == "postgresql":
+            connection = self._lock_connections.pop(name, None)
+            if connection is not None:
+                try:
+                    connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self._lock_key(name)})
+                finally:
+                    connection.close()
+            return
+
+        with self.session_scope() as session:
+            row = session.get(BotState, f"lease:{name}", with_for_update=True)
+            if row and (row.value or {}).get("holder") == holder:
+                session.delete(row)
+
+    @staticmethod
+    def _lock_key(name: str) -> int:
+        return zlib.crc32(f"gastos-bot:{name}".encode("utf-8"))
+
+    def _try_advisory_lock(self, name: str) -> bool:
+        """
+        Advisory lock de sesión: se mantiene mientras viva la conexión dedicada.
+
+        Si el proceso que lo tiene muere, Postgres lo libera al cerrarse la conexión.
+        """
+        connection = self._lock_connections.get(name)
+        if connection is not None:
+            try:
+                connection.execute(text("SELECT 1"))
+                connection.commit()
+                return True
+            except Exception as e:
+                logger.warning("Se perdió la conexión del lease '%s': %s", name, e)
+                self._lock_connections.pop(name, None)
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+                return False
+
+        connection = self.engine.connect()
+        try:
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self._lock_key(name)}
+            ).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if acquired:
+            self._lock_connections[name] = connection
+        else:
+            connection.close()
+        return bool(acquired)
+
+    def _try_lease_row(self, name: str, holder: str, ttl: float) -> bool:
+        """Lease en ``bot_state`` con vencimiento; el holder lo renueva con heartbeats."""
+        now = time.time()
+        key = f"lease:{name}"
+        try:
+            with self.session_scope() as session:
+                row = session.get(BotState, key, with_for_update=True)
+                lease = (row.value or {}) if row else {}
+                if lease.get("holder") not in (None, holder) and lease.get("expires_at", 0) > now:
+                    return False
+                value = {"holder": holder, "expires_at": now + ttl}
+                if row:
+                    row.value = value
+                else:
+                    session.add(BotState(key=key, value=value))
+            return True
+        except IntegrityError:
+            # Otra instancia creó la fila al mismo tiempo
+            return False
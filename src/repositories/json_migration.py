@@ -0,0 +1,453 @@
+"""
+Migración del backend de archivos a la base de datos.
+
+Lleva ``data/ledger.json``, los segmentos de ``data/archive``, ``state.json``
+y los snapshots ``data/*.snapshot.json`` a las tablas del backend SQLAlchemy:
+
+- el ledger se lee en streaming (no se carga entero) y se escribe en lotes:
+  en PostgreSQL con ``COPY`` a una tabla temporal y ``INSERT ... SELECT``, en
+  SQLite con ``INSERT`` multi-fila; en ambos los conflictos sobre
+  (chat_id, message_id) se saltean o actualizan según ``on_conflict``
+- el estado se combina con el que ya tenga la base (sesiones, offset, etc.)
+- al final se verifica que cada movimiento del origen esté en la base con los
+  mismos datos: cantidad de filas y checksum independiente del orden
+
+La huella de cada movimiento del origen se guarda en una tabla auxiliar de la
+misma base (``migration_digests_<tabla>``, se borra al terminar), no en
+memoria: los duplicados del origen y la verificación se resuelven con esa
+tabla y el proceso usa memoria acotada por el tamaño de lote.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import BigInteger, Column, MetaData, Table, and_, func, select, text
+
+from src.repositories import ledger_archive
+from src.repositories.database_backend import LedgerArchiveEntry, LedgerArchiveMonth, LedgerEntry, _DatabaseLedgerBackend
+from src.schemas import Gasto
+from src.utils.local_time import local_date, month_bucket
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+ON_CONFLICT = ("skip", "update")
+_COLUMNS = (
+    "chat_id", "message_id", "user_id", "ts", "date_iso", "amount",
+    "currency", "category", "description", "payee",
+)
+_SKIP_SPACE = re.compile(r"[\s,]*")
+_MASK = (1 << 64) - 1
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """
+    Objetos de un archivo JSON ``[{...}, {...}]`` de a uno, leyendo de a bloques.
+
+    Raises:
+        ValueError: Si el archivo no es un array de objetos
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer:
+            return
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} no es un array JSON")
+        position = 1
+        eof = False
+        while True:
+            position = _SKIP_SPACE.match(buffer, position).end()
+            if position < len(buffer):
+                if buffer[position] == "]":
+                    return
+                if buffer[position] != "{":
+                    raise ValueError(f"{path}: se esperaba un objeto en la posición {position}")
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield item
+                    continue
+            elif eof:
+                raise ValueError(f"{path} termina antes de cerrar el array")
+            # Objeto incompleto al final del bloque: se lee el siguiente
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+def _row(gasto: Gasto) -> Tuple:
+    """Valores normalizados como los guarda la base."""
+    return (
+        int(gasto.chat_id), int(gasto.message_id), int(gasto.user_id), int(gasto.ts), gasto.date_iso,
+        int(gasto.amount), gasto.currency, gasto.category, gasto.description or "", gasto.payee or "",
+    )
+
+
+def _digest(row: Tuple) -> int:
+    """Huella de 64 bits con signo (entra en una columna BIGINT)."""
+    encoded = json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little", signed=True)
+
+
+def _digest_table(table: str) -> Table:
+    """Tabla auxiliar con la huella de cada movimiento del origen, por clave."""
+    return Table(
+        f"migration_digests_{table}",
+        MetaData(),
+        Column("chat_id", BigInteger, primary_key=True, autoincrement=False),
+        Column("message_id", BigInteger, primary_key=True, autoincrement=False),
+        Column("digest", BigInteger, nullable=False),
+    )
+
+
+class _TableStats:
+    """Conteos y checksums de una tabla migrada."""
+
+    def __init__(self, table: str):
+        self.table = table
+        self.digests = _digest_table(table)
+        self.source_rows = 0
+        self.unique = 0
+        self.written = 0
+        self.digest_sum = 0
+        self.verified: Dict[str, Any] = {}
+
+    @property
+    def source_duplicates(self) -> int:
+        return self.source_rows - self.unique
+
+    @property
+    def checksum(self) -> int:
+        return self.digest_sum & _MASK
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "source_rows": self.source_rows,
+            "source_duplicates": self.source_duplicates,
+            "unique": self.unique,
+            "written": self.written,
+            "checksum": f"{self.checksum:016x}",
+            **self.verified,
+        }
+
+
+class JsonToDatabaseMigration:
+    """
+    Copia el backend de archivos a la base de ``database_url``.
+
+    Args:
+        on_conflict: "skip" conserva las filas/sesiones que ya estén en la
+            base; "update" las reemplaza con las del origen
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        ledger_path: str = "data/ledger.json",
+        state_path: str = "state.json",
+        batch_size: int = 5000,
+        on_conflict: str = "skip",
+    ):
+        if on_conflict not in ON_CONFLICT:
+            raise ValueError(f"on_conflict debe ser uno de {ON_CONFLICT}")
+        self.backend = _DatabaseLedgerBackend(database_url)
+        self.engine = self.backend.engine
+        self.dialect = self.engine.dialect.name
+        if self.dialect not in ("postgresql", "sqlite"):
+            raise ValueError(f"Motor no soportado para la migración: {self.dialect} (usar PostgreSQL o SQLite)")
+        self.ledger_path = ledger_path
+        self.state_path = state_path
+        self.data_dir = os.path.dirname(ledger_path) or "."
+        self.archive_dir = os.path.join(self.data_dir, "archive")
+        self.batch_size = max(1, batch_size)
+        self.on_conflict = on_conflict
+
+    # === Origen ===
+    def _iter_hot(self) -> Iterator[Tuple[Tuple, Optional[str]]]:
+        if not os.path.exists(self.ledger_path):
+            return
+        for item in iter_json_array(self.ledger_path):
+            yield _row(Gasto.from_dict(item)), None
+
+    def _iter_archive(self) -> Iterator[Tuple[Tuple, Optional[str]]]:
+        for month, _, path in ledger_archive.list_segments(self.archive_dir):
+            for gasto in ledger_archive.iter_segment(path):
+                yield _row(gasto), month
+
+    # === Carga del ledger ===
+    def _insert_sql(self, table: str, columns: List[str], source: str) -> str:
+        action = "DO NOTHING"
+        if self.on_conflict == "update":
+            updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in ("chat_id", "message_id", "created_at"))
+            action = f"DO UPDATE SET {updates}"
+        return f"INSERT INTO {table} ({', '.join(columns)}) {source} ON CONFLICT (chat_id, message_id) {action}"
+
+    def _load_table(self, model, rows: Iterator[Tuple[Tuple, Optional[str]]], on_batch: Callable) -> _TableStats:
+        table = model.__tablename__
+        # local_date/month se derivan de ts (el archivo conserva el mes de su segmento)
+        columns = list(_COLUMNS) + ["created_at", "local_date", "month"]
+        stats = _TableStats(table)
+        created_at = datetime.utcnow()
+        # Restos de una corrida cortada: la tabla auxiliar se arma de cero
+        stats.digests.drop(self.engine, checkfirst=True)
+        stats.digests.create(self.engine)
+
+        with self.engine.connect() as conn:
+            if self.dialect == "postgresql":
+                staging = f"{table}_migration"
+                conn.execute(text(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {staging} AS SELECT {', '.join(columns)} FROM {table} WITH NO DATA"
+                ))
+                insert_sql = self._insert_sql(table, columns, f"SELECT {', '.join(columns)} FROM {staging}")
+            else:
+                staging = None
+                insert_sql = self._insert_sql(
+                    table, columns, "VALUES (" + ", ".join(f":{c}" for c in columns) + ")"
+                )
+            conn.commit()
+
+            # Lote por clave: dentro del lote gana la primera aparición
+            pending: Dict[Tuple[int, int], Tuple] = {}
+
+            def flush():
+                if not pending:
+                    return
+                fresh = self._record_digests(conn, stats, pending)
+                batch = [values for key, values in pending.items() if key in fresh]
+                pending.clear()
+                if not batch:
+                    pass  # Todo el lote repetía claves de lotes anteriores
+                elif staging:
+                    stats.written += self._copy_batch(conn, staging, columns, batch, insert_sql)
+                else:
+                    result = conn.execute(text(insert_sql), [dict(zip(columns, values)) for values in batch])
+                    stats.written += max(result.rowcount, 0)
+                conn.commit()
+                on_batch(table, stats.source_rows)
+
+            for values, month in rows:
+                stats.source_rows += 1
+                key = (values[0], values[1])
+                if key in pending:
+                    continue
+                ts = values[3]
+                pending[key] = values + (created_at, local_date(ts).isoformat(), month or month_bucket(ts))
+                if len(pending) >= self.batch_size:
+                    flush()
+            flush()
+            if staging:
+                conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+                conn.commit()
+        return stats
+
+    def _record_digests(self, conn, stats: _TableStats, pending: Dict[Tuple[int, int], Tuple]) -> set:
+        """
+        Guarda las huellas del lote y devuelve las claves que el origen no tenía antes.
+
+        El backend de archivos conserva la primera aparición de una clave: las
+        repetidas de lotes anteriores chocan con la clave primaria y se descartan.
+        """
+        if self.dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        table = stats.digests
+        digests = {key: _digest(values[: len(_COLUMNS)]) for key, values in pending.items()}
+        result = conn.execute(
+            dialect_insert(table).on_conflict_do_nothing().returning(table.c.chat_id, table.c.message_id),
+            [{"chat_id": key[0], "message_id": key[1], "digest": digest} for key, digest in digests.items()],
+        )
+        fresh = {(chat_id, message_id) for chat_id, message_id in result}
+        stats.unique += len(fresh)
+        stats.digest_sum += sum(digests[key] for key in fresh)
+        return fresh
+
+    @staticmethod
+    def _copy_batch(conn, staging: str, columns: List[str], batch: List[Tuple], insert_sql: str) -> int:
+        """COPY del lote a la tabla temporal y pasaje a la tabla real resolviendo conflictos."""
+        buffer = io.StringIO()
+        # Strings entre comillas: en CSV de COPY un campo vacío sin comillas es NULL
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in values] for values in batch
+        )
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f"TRUNCATE {staging}")
+            cursor.copy_expert(f"COPY {staging} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        return max(conn.execute(text(insert_sql)).rowcount, 0)
+
+    def _refresh_archive_months(self, months: List[str]):
+        """Recalcula desde ``ledger_archive`` el resumen de los meses migrados."""
+        if not months:
+            return
+        with self.backend.session_scope() as session:
+            rows = session.execute(
+                select(
+                    LedgerArchiveEntry.month,
+                    LedgerArchiveEntry.currency,
+                    func.count(),
+                    func.sum(LedgerArchiveEntry.amount),
+                    func.min(LedgerArchiveEntry.ts),
+                    func.max(LedgerArchiveEntry.ts),
+                )
+                .where(LedgerArchiveEntry.month.in_(months))
+                .group_by(LedgerArchiveEntry.month, LedgerArchiveEntry.currency)
+            ).all()
+            summaries: Dict[str, Dict[str, Any]] = {}
+            for month, currency, count, total, min_ts, max_ts in rows:
+                summary = summaries.setdefault(month, {"count": 0, "totals": {}, "min_ts": min_ts, "max_ts": max_ts})
+                summary["count"] += count
+                summary["totals"][currency] = int(total or 0)
+                summary["min_ts"] = min(summary["min_ts"], min_ts)
+                summary["max_ts"] = max(summary["max_ts"], max_ts)
+            for month, summary in summaries.items():
+                session.merge(LedgerArchiveMonth(month=month, **summary))
+
+    # === Estado y snapshots ===
+    def _snapshot_files(self) -> Dict[str, str]:
+        suffix = ".snapshot.json"
+        if not os.path.isdir(self.data_dir):
+            return {}
+        return {
+            name[: -len(suffix)]: os.path.join(self.data_dir, name)
+            for name in sorted(os.listdir(self.data_dir))
+            if name.endswith(suffix)
+        }
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def migrate_state(self) -> Dict[str, int]:
+        """Sesiones, offset y demás claves de ``state.json`` más los snapshots."""
+        stats = {"sessions": 0, "keys": 0, "snapshots": 0}
+        source = self._read_state()
+        replace = self.on_conflict == "update"
+        if source:
+            def mutate(state: Dict[str, Any]):
+                for user_id, session_data in (source.get("sessions") or {}).items():
+                    if replace or str(user_id) not in state["sessions"]:
+                        state["sessions"][str(user_id)] = session_data
+                        stats["sessions"] += 1
+                # El offset nunca retrocede: volver atrás reprocesaría updates
+                state["update_offset"] = max(int(state.get("update_offset", 0)), int(source.get("update_offset", 0)))
+                for key, value in source.items():
+                    if key not in ("sessions", "update_offset") and (replace or key not in state):
+                        state[key] = value
+                        stats["keys"] += 1
+
+            self.backend._update_state(mutate)
+
+        for name, path in self._snapshot_files().items():
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+
+            def keep_or_replace(current, snapshot=snapshot):
+                if current is None or replace:
+                    stats["snapshots"] += 1
+                    return snapshot
+                return current
+
+            self.backend.update_snapshot(name, keep_or_replace)
+        return stats
+
+    # === Verificación ===
+    def _verify_table(self, model, stats: _TableStats):
+        """
+        Compara cada fila del origen con la de la base (por clave) y el checksum del conjunto.
+
+        Recorre en streaming la tabla unida con la de huellas: la memoria no
+        depende de la cantidad de filas.
+        """
+        table, digests = model.__table__, stats.digests
+        query = select(*[table.c[name] for name in _COLUMNS], digests.c.digest).join_from(
+            table, digests, and_(table.c.chat_id == digests.c.chat_id, table.c.message_id == digests.c.message_id)
+        )
+        present = different = 0
+        destination_sum = 0
+        with self.engine.connect() as conn:
+            total = conn.execute(select(func.count()).select_from(table)).scalar() or 0
+            result = conn.execution_options(stream_results=True, yield_per=self.batch_size).execute(query)
+            for *values, expected in result:
+                present += 1
+                digest = _digest(_row(Gasto(*values)))
+                destination_sum += digest
+                if digest != expected:
+                    different += 1
+        missing_total = stats.unique - present
+        extra = total - present
+        stats.verified = {
+            "destination_rows": present,
+            "destination_checksum": f"{destination_sum & _MASK:016x}",
+            "missing": missing_total,
+            "different": different,
+            "extra_in_destination": extra,
+            "ok": missing_total == 0 and different == 0 and (destination_sum & _MASK) == stats.checksum,
+        }
+
+    def _verify_state(self) -> Dict[str, Any]:
+        source = self._read_state() or {}
+        state = self.backend.load_state()
+        sessions = source.get("sessions") or {}
+        replace = self.on_conflict == "update"
+        missing = [user_id for user_id in sessions if str(user_id) not in state["sessions"]]
+        different = [
+            user_id for user_id, data in sessions.items()
+            if str(user_id) in state["sessions"] and state["sessions"][str(user_id)] != data
+        ]
+        snapshots_missing = [
+            name for name in self._snapshot_files() if self.backend.load_snapshot(name) is None
+        ]
+        offset_ok = int(state.get("update_offset", 0)) >= int(source.get("update_offset", 0))
+        return {
+            "sessions": len(sessions),
+            "sessions_missing": len(missing),
+            "sessions_different": len(different),
+            "snapshots_missing": snapshots_missing,
+            "update_offset": state.get("update_offset", 0),
+            "ok": offset_ok and not missing and not snapshots_missing and (not replace or not different),
+        }
+
+    # === Todo junto ===
+    def run(self, on_batch: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+        """
+        Migra ledger, archivo y estado y verifica el resultado.
+
+        Returns:
+            {"tables": [stats por tabla], "state": {...}, "ok": bool}
+        """
+        on_batch = on_batch or (lambda table, rows: logger.info("%s: %s filas leídas", table, rows))
+        months = [month for month, _, _ in ledger_archive.list_segments(self.archive_dir)]
+        tables = []
+        try:
+            for model, rows in ((LedgerEntry, self._iter_hot()), (LedgerArchiveEntry, self._iter_archive())):
+                tables.append((model, self._load_table(model, rows, on_batch)))
+            self._refresh_archive_months(sorted(set(months)))
+            state_stats = self.migrate_state()
+
+            for model, stats in tables:
+                self._verify_table(model, stats)
+        finally:
+            for model in (LedgerEntry, LedgerArchiveEntry):
+                _digest_table(model.__tablename__).drop(self.engine, checkfirst=True)
+        state = {**state_stats, **self._verify_state()}
+        report = {"tables": [stats.as_dict() for _, stats in tables], "state": state}
+        report["ok"] = state["ok"] and all(stats.verified["ok"] for _, stats in tables)
+        return report
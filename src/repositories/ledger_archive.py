@@ -0,0 +1,109 @@
+"""
+Segmentos de archivo del ledger (backend de archivos).
+
+Cada mes cerrado se mueve a un segmento inmutable ``ledger-YYYY-MM.pN.jsonl.gz``:
+la primera línea es un encabezado con el resumen del mes y las siguientes
+son los movimientos (un JSON por línea). El resumen se puede leer sin
+descomprimir el segmento completo.
+"""
+import gzip
+import io
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
+from src.schemas import Gasto
+
+SEGMENT_FORMAT = 1
+_SEGMENT_RE = re.compile(r"^ledger-(\d{4}-\d{2})\.p(\d+)\.jsonl\.gz$")
+
+
+def gasto_month(gasto: Gasto) -> str:
+    """Mes local ("YYYY-MM") de un movimiento."""
+    return gasto.date_iso[:7]
+
+
+def cutoff_month(now: datetime, keep_months: int) -> str:
+    """Primer mes que queda en caliente si se conservan ``keep_months`` meses (incluido el actual)."""
+    index = now.year * 12 + now.month - 1 - (max(1, keep_months) - 1)
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def summarize(month: str, gastos: List[Gasto]) -> Dict[str, Any]:
+    """Resumen de un mes: cantidad, totales por moneda y rango de timestamps."""
+    totals: Dict[str, int] = {}
+    for gasto in gastos:
+        totals[gasto.currency] = totals.get(gasto.currency, 0) + int(gasto.amount)
+    return {
+        "month": month,
+        "count": len(gastos),
+        "totals": totals,
+        "min_ts": min((g.ts for g in gastos), default=None),
+        "max_ts": max((g.ts for g in gastos), default=None),
+    }
+
+
+def list_segments(archive_dir: str) -> List[Tuple[str, int, str]]:
+    """Segmentos existentes como (mes, parte, ruta), ordenados."""
+    if not os.path.isdir(archive_dir):
+        return []
+    segments = []
+    for name in os.listdir(archive_dir):
+        match = _SEGMENT_RE.match(name)
+        if match:
+            segments.append((match.group(1), int(match.group(2)), os.path.join(archive_dir, name)))
+    return sorted(segments)
+
+
+def write_segment(archive_dir: str, month: str, gastos: List[Gasto]) -> str:
+    """
+    Escribe un segmento nuevo para ``month`` (nunca modifica uno existente).
+
+    Si el mes ya tenía segmentos (movimientos tardíos), se agrega una parte nueva.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    part = 1 + max((p for m, p, _ in list_segments(archive_dir) if m == month), default=-1)
+    path = os.path.join(archive_dir, f"ledger-{month}.p{part}.jsonl.gz")
+    header = {
+        "format": SEGMENT_FORMAT,
+        "part": part,
+        "archived_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **summarize(month, gastos),
+    }
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as compressed, io.TextIOWrapper(
+                compressed, encoding="utf-8"
+            ) as f:
+                f.write(json.dumps(header, ensure_ascii=False) + "\n")
+                for gasto in gastos:
+                    f.write(json.dumps(gasto.to_dict(), ensure_ascii=False) + "\n")
+            # El segmento tiene que estar en disco antes de que el ledger caliente lo deje de tener
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    """Lee solo el encabezado (primera línea) de un segmento."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.loads(f.readline())
+
+
+def iter_segment(path: str) -> Iterator[Gasto]:
+    """Recorre los movimientos de un segmento sin cargarlo entero en memoria."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        f.readline()  # encabezado
+        for line in f:
+            if line.strip():
+                yield Gasto.from_dict(json.loads(line))
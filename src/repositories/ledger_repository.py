@@ -1,203 +1,74 @@
 """Repositorio para acceso y persistencia de gastos."""
+import asyncio
+import bisect
 import json
 import os
+import re
+import threading
+import time
+import unicodedata
+import weakref
 from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-from sqlalchemy import (
-    JSON,
-    BigInteger,
-    Column,
-    DateTime,
-    Integer,
-    String,
-    Text,
-    UniqueConstraint,
-    create_engine,
-    delete,
-    select,
-)
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import declarative_base, sessionmaker
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 from src.config.settings import settings
+from src.repositories import ledger_archive, ledger_snapshot
 from src.schemas import Gasto
+from src.utils.local_time import local_tz, month_bucket
 from src.utils.logger import setup_logger
+from src.utils.tracing import trace_methods
 
-logger = setup_logger(__name__)
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos para el lease de archivo
+    fcntl = None
 
-Base = declarative_base()
+logger = setup_logger(__name__)
 
 
 def _default_state() -> Dict[str, Any]:
     return {"update_offset": 0, "sessions": {}}
 
 
-class LedgerEntry(Base):
-    """Tabla de movimientos registrados por el bot."""
-
-    __tablename__ = "ledger_entries"
-
-    id = Column(Integer, primary_key=True)
-    chat_id = Column(BigInteger, nullable=False)
-    message_id = Column(BigInteger, nullable=False)
-    user_id = Column(BigInteger, nullable=False)
-    ts = Column(BigInteger, nullable=False)
-    date_iso = Column(String(32), nullable=False)
-    amount = Column(Integer, nullable=False)
-    currency = Column(String(12), nullable=False)
-    category = Column(String(128), nullable=False)
-    description = Column(Text, default="")
-    payee = Column(String(255), default="")
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-
-    __table_args__ = (
-        UniqueConstraint("chat_id", "message_id", name="uq_ledger_chat_message"),
-    )
-
-    @classmethod
-    def from_gasto(cls, gasto: Gasto) -> "LedgerEntry":
-        return cls(
-            chat_id=gasto.chat_id,
-            message_id=gasto.message_id,
-            user_id=gasto.user_id,
-            ts=int(gasto.ts),
-            date_iso=gasto.date_iso,
-            amount=int(gasto.amount),
-            currency=gasto.currency,
-            category=gasto.category,
-            description=gasto.description,
-            payee=gasto.payee,
-        )
-
-    def to_gasto(self) -> Gasto:
-        return Gasto(
-            chat_id=self.chat_id,
-            message_id=self.message_id,
-            user_id=self.user_id,
-            ts=self.ts,
-            date_iso=self.date_iso,
-            amount=self.amount,
-            currency=self.currency,
-            category=self.category,
-            description=self.description or "",
-            payee=self.payee or "",
-        )
-
-
-class BotState(Base):
-    """Tabla para almacenar estado del bot (offset, sesiones, etc.)."""
-
-    __tablename__ = "bot_state"
-
-    key = Column(String(64), primary_key=True)
-    value = Column(JSON, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-
-
-class _DatabaseLedgerBackend:
-    """Implementación basada en PostgreSQL."""
-
-    def __init__(self, database_url: str):
-        self.engine = create_engine(database_url, pool_pre_ping=True, future=True)
-        self.SessionLocal = sessionmaker(bind=self.engine, expire_on_commit=False, future=True)
-        Base.metadata.create_all(self.engine)
-        logger.info("LedgerRepository inicializado con backend de base de datos")
-
-    @contextmanager
-    def session_scope(self):
-        session = self.SessionLocal()
+def _atomic_write_json(path: str, data: Any, **dump_kwargs):
+    """
+    Escribe ``data`` como JSON reemplazando ``path`` de forma atómica.
+
+    Se escribe un temporal en el mismo directorio, se hace fsync y se
+    renombra encima del original (y fsync del directorio): un lector ve el
+    archivo anterior o el nuevo completo, nunca uno a medio escribir, y un
+    corte a mitad de la escritura no trunca el original.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
         try:
-            yield session
-            session.commit()
-        except Exception:
-            session.rollback()
-            raise
-        finally:
-            session.close()
-
-    # === Ledger ===
-    def load_ledger(self) -> List[Gasto]:
-        with self.SessionLocal() as session:
-            result = session.execute(select(LedgerEntry).order_by(LedgerEntry.ts))
-            return [row.to_gasto() for row in result.scalars().all()]
-
-    def save_ledger(self, gastos: List[Gasto]):
-        with self.session_scope() as session:
-            session.execute(delete(LedgerEntry))
-            for gasto in gastos:
-                session.add(LedgerEntry.from_gasto(gasto))
-
-    def append_gasto(self, gasto: Gasto) -> bool:
-        entry = LedgerEntry.from_gasto(gasto)
-        session = self.SessionLocal()
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
         try:
-            session.add(entry)
-            session.commit()
-            logger.info(
-                "Gasto agregado en base de datos: %s %s - %s",
-                gasto.amount,
-                gasto.currency,
-                gasto.category,
-            )
-            return True
-        except IntegrityError:
-            session.rollback()
-            logger.warning(
-                "Gasto duplicado en base de datos (chat_id=%s, message_id=%s), ignorando",
-                gasto.chat_id,
-                gasto.message_id,
-            )
-            return False
+            os.fsync(dir_fd)
         finally:
-            session.close()
-
-    # === Estado ===
-    def _load_state_row(self) -> Dict[str, Any]:
-        with self.SessionLocal() as session:
-            state = session.get(BotState, "global_state")
-            if not state:
-                return _default_state()
-            stored = state.value or {}
-            stored.setdefault("update_offset", 0)
-            stored.setdefault("sessions", {})
-            return stored
-
-    def load_state(self) -> Dict[str, Any]:
-        return self._load_state_row()
-
-    def save_state(self, state: Dict[str, Any]):
-        with self.session_scope() as session:
-            current = session.get(BotState, "global_state")
-            if current:
-                current.value = state
-            else:
-                session.add(BotState(key="global_state", value=state))
-
-    def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
-        state = self._load_state_row()
-        return state.get("sessions", {}).get(str(user_id))
+            os.close(dir_fd)
 
-    def save_session(self, user_id: int, session_data: Dict[str, Any]):
-        state = self._load_state_row()
-        state.setdefault("sessions", {})[str(user_id)] = session_data
-        self.save_state(state)
 
-    def clear_session(self, user_id: int):
-        state = self._load_state_row()
-        state.get("sessions", {}).pop(str(user_id), None)
-        self.save_state(state)
+_SEARCH_TOKEN_RE = re.compile(r"[a-z0-9]+")
 
-    def get_update_offset(self) -> int:
-        state = self._load_state_row()
-        return int(state.get("update_offset", 0))
 
-    def save_update_offset(self, offset: int):
-        state = self._load_state_row()
-        state["update_offset"] = int(offset)
-        self.save_state(state)
+def search_tokens(text: str) -> List[str]:
+    """Términos de búsqueda normalizados (minúsculas, sin acentos, 2+ caracteres)."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    return list(dict.fromkeys(token for token in _SEARCH_TOKEN_RE.findall(text) if len(token) >= 2))
 
 
 class _FileLedgerBackend:
@@ -206,6 +77,21 @@ class _FileLedgerBackend:
     def __init__(self, ledger_path: str = "data/ledger.json", state_path: str = "state.json"):
         self.ledger_path = ledger_path
         self.state_path = state_path
+        self.archive_dir = os.path.join(os.path.dirname(ledger_path) or ".", "archive")
+        # Serializan el read-modify-write del ledger y del estado (importaciones en
+        # otro thread); entre procesos se suma un flock por archivo. Son
+        # independientes: escribir el estado no espera a una escritura del ledger.
+        self._ledger_lock = threading.RLock()
+        self._state_lock = threading.RLock()
+        self._flock_depth: Dict[str, int] = {}
+        # Índice invertido en memoria para búsquedas (se arma en la primera búsqueda)
+        self._search_docs: Optional[List[Gasto]] = None
+        self._search_postings: Dict[str, Set[int]] = {}
+        self._search_vocab: List[str] = []
+        self._search_mtime: Optional[int] = None
+        # Snapshot binario del ledger caliente (se reabre si cambia ledger.json)
+        self.snapshot_path = ledger_snapshot.snapshot_path(ledger_path)
+        self._snapshot: Optional[ledger_snapshot.LedgerSnapshot] = None
         self._ensure_data_dir()
         logger.info("LedgerRepository inicializado con backend de archivos")
 
@@ -213,43 +99,175 @@ class _FileLedgerBackend:
         Path("data").mkdir(exist_ok=True)
 
     # === Ledger ===
-    def load_ledger(self) -> List[Gasto]:
-        if not os.path.exists(self.ledger_path):
-            return []
-
+    def load_ledger(self, include_archive: bool = True) -> List[Gasto]:
+        hot = self._load_hot_ledger()
+        if not include_archive:
+            return hot
+
+        # Si una archivación se cortó entre escribir el segmento y reescribir el
+        # ledger caliente, un movimiento puede estar en ambos: gana la copia caliente
+        hot_keys = {(g.chat_id, g.message_id) for g in hot}
+        archived = [
+            gasto
+            for _, _, path in ledger_archive.list_segments(self.archive_dir)
+            for gasto in ledger_archive.iter_segment(path)
+            if (gasto.chat_id, gasto.message_id) not in hot_keys
+        ]
+        return archived + hot
+
+    def load_month(self, chat_id: int, month: str) -> List[Gasto]:
+        hot = [g for g in self._load_hot_ledger() if g.chat_id == chat_id and g.date_iso.startswith(month)]
+        hot_keys = {g.message_id for g in hot}
+        archived = [
+            gasto
+            for segment_month, _, path in ledger_archive.list_segments(self.archive_dir)
+            if segment_month == month
+            for gasto in ledger_archive.iter_segment(path)
+            if gasto.chat_id == chat_id and gasto.message_id not in hot_keys
+        ]
+        return archived + hot
+
+    def _load_hot_ledger(self) -> List[Gasto]:
         try:
-            with open(self.ledger_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return [Gasto.from_dict(item) for item in data]
+            return self._read_hot_ledger()
         except Exception as e:
             logger.error("Error cargando ledger: %s", e)
             return []
 
-    def save_ledger(self, gastos: List[Gasto]):
-        try:
-            with open(self.ledger_path, "w", encoding="utf-8") as f:
-                data = [gasto.to_dict() for gasto in gastos]
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error("Error guardando ledger: %s", e)
-            raise
+    def _read_hot_ledger(self) -> List[Gasto]:
+        """
+        Como ``_load_hot_ledger`` pero un ledger ilegible es un error.
 
-    def append_gasto(self, gasto: Gasto) -> bool:
-        gastos = self.load_ledger()
+        Lo usan las escrituras: reescribir sobre un ledger que no se pudo
+        leer lo dejaría vacío.
+        """
+        snapshot = self._open_snapshot()
+        if snapshot is not None:
+            return snapshot.gastos()
+        if not os.path.exists(self.ledger_path):
+            return []
+
+        signature = ledger_snapshot.source_signature(self.ledger_path)
+        with open(self.ledger_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            gastos = [Gasto.from_dict(item) for item in data]
+        # Desactualizado o inexistente: se regenera para la próxima lectura
+        self._write_snapshot(gastos, signature)
+        return gastos
 
-        key = (gasto.chat_id, gasto.message_id)
-        existing_keys = {(g.chat_id, g.message_id) for g in gastos}
+    @contextmanager
+    def _exclusive(self, lock: threading.RLock, path: str):
+        """
+        Lock del thread más flock sobre ``path``.lock (reentrante en el mismo thread).
+
+        flock es por descriptor: volver a tomarlo desde el mismo proceso con
+        otro open() se bloquearía, así que solo lo toma el nivel más externo.
+        """
+        with lock:
+            depth = self._flock_depth.get(path, 0)
+            self._flock_depth[path] = depth + 1
+            try:
+                if depth:
+                    yield
+                else:
+                    with self._file_lock(path):
+                        yield
+            finally:
+                self._flock_depth[path] = depth
+
+    def _ledger_write(self):
+        return self._exclusive(self._ledger_lock, self.ledger_path)
+
+    def _state_write(self):
+        return self._exclusive(self._state_lock, self.state_path)
+
+    def _open_snapshot(self) -> Optional[ledger_snapshot.LedgerSnapshot]:
+        """Snapshot vigente del ledger caliente, o None si hay que leer el JSON."""
+        if not settings.LEDGER_SNAPSHOT:
+            return None
+        signature = ledger_snapshot.source_signature(self.ledger_path)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.signature != signature:
+            snapshot = self._snapshot = ledger_snapshot.LedgerSnapshot.open(self.snapshot_path, signature)
+        return snapshot
+
+    def _write_snapshot(self, gastos: List[Gasto], signature: Optional[ledger_snapshot.Signature]):
+        if not settings.LEDGER_SNAPSHOT or signature is None:
+            return
+        try:
+            if ledger_snapshot.write_snapshot(self.snapshot_path, gastos, signature):
+                self._snapshot = None  # Se reabre (mmap) en la próxima lectura
+        except OSError as e:
+            logger.warning("No se pudo escribir el snapshot del ledger: %s", e)
 
-        if key in existing_keys:
-            logger.warning(
-                "Gasto duplicado (chat_id=%s, message_id=%s), ignorando",
-                gasto.chat_id,
-                gasto.message_id,
-            )
-            return False
+    def save_ledger(self, gastos: List[Gasto]):
+        with self._ledger_write():
+            try:
+                _atomic_write_json(self.ledger_path, [gasto.to_dict() for gasto in gastos], indent=2)
+            except Exception as e:
+                logger.error("Error guardando ledger: %s", e)
+                raise
+            self._write_snapshot(gastos, ledger_snapshot.source_signature(self.ledger_path))
+
+    def iter_ledger_chunks(
+        self,
+        chunk_size: int = 500,
+        after: Optional[Tuple[int, int, int]] = None,
+    ) -> Iterator[List[Gasto]]:
+        if after is None:
+            gastos = self.load_ledger()
+        else:
+            gastos = self._load_after(tuple(after))
+        gastos.sort(key=lambda g: (g.ts, g.chat_id, g.message_id))
+        for start in range(0, len(gastos), chunk_size):
+            yield gastos[start:start + chunk_size]
+
+    def _load_after(self, after: Tuple[int, int, int]) -> List[Gasto]:
+        """
+        Movimientos posteriores a la clave ``after`` sin recorrer todo el archivo.
+
+        Los segmentos de meses anteriores al de la marca se descartan por el
+        nombre, y los demás por el ``max_ts`` de su encabezado: al reanudar
+        normalmente solo se lee el ledger caliente (o su snapshot).
+        """
+        # Un día de margen: el mes del segmento sale de date_iso, que pudo calcularse con otra zona horaria
+        watermark_month = month_bucket(after[0] - 86400)
+        hot = self._load_hot_ledger()
+        hot_keys = {(g.chat_id, g.message_id) for g in hot}
+        archived = [
+            gasto
+            for month, _, path in ledger_archive.list_segments(self.archive_dir)
+            if month >= watermark_month and (ledger_archive.read_header(path).get("max_ts") or 0) >= after[0]
+            for gasto in ledger_archive.iter_segment(path)
+            if (gasto.chat_id, gasto.message_id) not in hot_keys
+        ]
+        return [g for g in archived + hot if (g.ts, g.chat_id, g.message_id) > after]
 
-        gastos.append(gasto)
-        self.save_ledger(gastos)
+    def append_gasto(self, gasto: Gasto) -> bool:
+        # Solo el ledger caliente: los meses archivados no reciben mensajes nuevos
+        with self._ledger_write():
+            key = (gasto.chat_id, gasto.message_id)
+            snapshot = self._open_snapshot()
+            # Con snapshot, el duplicado (redelivery) se detecta sin armar el ledger
+            if snapshot is not None and snapshot.contains(*key):
+                existing_keys = {key}
+            else:
+                gastos = self._read_hot_ledger()
+                existing_keys = {(g.chat_id, g.message_id) for g in gastos}
+
+            if key in existing_keys:
+                logger.warning(
+                    "Gasto duplicado (chat_id=%s, message_id=%s), ignorando",
+                    gasto.chat_id,
+                    gasto.message_id,
+                )
+                return False
+
+            if snapshot is not None:
+                gastos = snapshot.gastos()
+            gastos.append(gasto)
+            self.save_ledger(gastos)
+            self._search_index_add([gasto])
         logger.info(
             "Gasto agregado: %s %s - %s",
             gasto.amount,
@@ -258,6 +276,176 @@ class _FileLedgerBackend:
         )
         return True
 
+    def append_gastos(self, nuevos: List[Gasto]) -> List[Tuple[int, int]]:
+        with self._ledger_write():
+            gastos = self._read_hot_ledger()
+            existing_keys = {(g.chat_id, g.message_id) for g in gastos}
+            added: List[Tuple[int, int]] = []
+            for gasto in nuevos:
+                key = (gasto.chat_id, gasto.message_id)
+                if key in existing_keys:
+                    continue
+                existing_keys.add(key)
+                gastos.append(gasto)
+                added.append(key)
+            if added:
+                self.save_ledger(gastos)
+                self._search_index_add(gastos[-len(added):])
+        logger.info("Gastos agregados en lote: %s de %s", len(added), len(nuevos))
+        return added
+
+    def update_gasto(self, gasto: Gasto) -> bool:
+        with self._ledger_write():
+            gastos = self._read_hot_ledger()
+            key = (gasto.chat_id, gasto.message_id)
+            for i, existing in enumerate(gastos):
+                if (existing.chat_id, existing.message_id) == key:
+                    gastos[i] = gasto
+                    break
+            else:
+                return False
+            self.save_ledger(gastos)
+            self._search_docs = None  # Se rearma en la próxima búsqueda
+        logger.info("Gasto editado (chat_id=%s, message_id=%s)", gasto.chat_id, gasto.message_id)
+        return True
+
+    def delete_gasto(self, chat_id: int, message_id: int) -> bool:
+        with self._ledger_write():
+            gastos = self._read_hot_ledger()
+            remaining = [g for g in gastos if (g.chat_id, g.message_id) != (chat_id, message_id)]
+            if len(remaining) == len(gastos):
+                return False
+            self.save_ledger(remaining)
+            self._search_docs = None
+        logger.info("Gasto eliminado (chat_id=%s, message_id=%s)", chat_id, message_id)
+        return True
+
+    # === Archivo (meses cerrados) ===
+    def archive_months_before(self, cutoff: str) -> Dict[str, int]:
+        with self._ledger_write():
+            archived = self._archive_months_before(cutoff)
+            if self._search_docs is not None:
+                # Mismos movimientos, solo cambió dónde están guardados
+                self._search_mtime = self._ledger_mtime()
+            return archived
+
+    def _archive_months_before(self, cutoff: str) -> Dict[str, int]:
+        hot = self._read_hot_ledger()
+        keep: List[Gasto] = []
+        by_month: Dict[str, List[Gasto]] = {}
+        for gasto in hot:
+            month = ledger_archive.gasto_month(gasto)
+            if month < cutoff:
+                by_month.setdefault(month, []).append(gasto)
+            else:
+                keep.append(gasto)
+        if not by_month:
+            return {}
+
+        # Primero los segmentos, después el ledger caliente (ver load_ledger)
+        for month, gastos in sorted(by_month.items()):
+            ledger_archive.write_segment(self.archive_dir, month, gastos)
+        self.save_ledger(keep)
+        return {month: len(gastos) for month, gastos in sorted(by_month.items())}
+
+    def get_archive_summaries(self) -> List[Dict[str, Any]]:
+        summaries: Dict[str, Dict[str, Any]] = {}
+        for month, _, path in ledger_archive.list_segments(self.archive_dir):
+            header = ledger_archive.read_header(path)
+            summary = summaries.setdefault(month, {"month": month, "count": 0, "totals": {}, "min_ts": None, "max_ts": None})
+            summary["count"] += header["count"]
+            for currency, amount in header["totals"].items():
+                summary["totals"][currency] = summary["totals"].get(currency, 0) + amount
+            summary["min_ts"] = min(t for t in (summary["min_ts"], header["min_ts"]) if t is not None)
+            summary["max_ts"] = max(t for t in (summary["max_ts"], header["max_ts"]) if t is not None)
+        return [summaries[month] for month in sorted(summaries)]
+
+    # === Búsqueda ===
+    def _ledger_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.ledger_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _build_search_index(self):
+        self._search_docs = []
+        self._search_postings = {}
+        self._search_vocab = []
+        self._search_index_add(self.load_ledger())
+        logger.info("Índice de búsqueda armado: %s movimientos", len(self._search_docs))
+
+    def _search_index_add(self, gastos: List[Gasto]):
+        """Agrega movimientos al índice (si ya está armado)."""
+        if self._search_docs is None:
+            return
+        new_tokens = []
+        for gasto in gastos:
+            doc_id = len(self._search_docs)
+            self._search_docs.append(gasto)
+            for token in search_tokens(f"{gasto.description} {gasto.payee}"):
+                postings = self._search_postings.get(token)
+                if postings is None:
+                    postings = self._search_postings[token] = set()
+                    new_tokens.append(token)
+                postings.add(doc_id)
+        if len(new_tokens) > 64:
+            self._search_vocab = sorted(self._search_postings)
+        else:
+            for token in new_tokens:
+                bisect.insort(self._search_vocab, token)
+        self._search_mtime = self._ledger_mtime()
+
+    def _prefix_postings(self, prefix: str) -> Set[int]:
+        matches: Set[int] = set()
+        start = bisect.bisect_left(self._search_vocab, prefix)
+        for token in self._search_vocab[start:]:
+            if not token.startswith(prefix):
+                break
+            matches |= self._search_postings[token]
+        return matches
+
+    def search_gastos(
+        self,
+        chat_id: int,
+        query: str,
+        limit: int = 10,
+        before: Optional[Tuple[int, int]] = None,
+    ) -> List[Gasto]:
+        tokens = search_tokens(query)
+        if not tokens:
+            return []
+        with self._ledger_lock:
+            # Otro proceso (p. ej. una importación por CLI) pudo modificar el ledger
+            if self._search_docs is None or self._search_mtime != self._ledger_mtime():
+                self._build_search_index()
+            matches: Optional[Set[int]] = None
+            for token in tokens:
+                postings = self._prefix_postings(token)
+                matches = postings if matches is None else matches & postings
+                if not matches:
+                    return []
+            hits = [self._search_docs[doc_id] for doc_id in matches]
+
+        hits = [
+            g for g in hits
+            if g.chat_id == chat_id and (before is None or (g.ts, g.message_id) < tuple(before))
+        ]
+        hits.sort(key=lambda g: (g.ts, g.message_id), reverse=True)
+        return hits[:limit]
+
+    def sum_expenses(self, user_id: int, month: str, category: str, currency: str) -> int:
+        with self._ledger_lock:
+            snapshot = self._open_snapshot()
+            if snapshot is not None:
+                return snapshot.sum_expenses(user_id, month, category, currency)
+            gastos = self._load_hot_ledger()
+        return sum(
+            -g.amount
+            for g in gastos
+            if g.user_id == user_id and g.amount < 0 and g.category == category
+            and g.currency == currency and g.date_iso.startswith(month)
+        )
+
     # === Estado ===
     def load_state(self) -> Dict[str, Any]:
         if not os.path.exists(self.state_path):
@@ -271,37 +459,133 @@ class _FileLedgerBackend:
             return _default_state()
 
     def save_state(self, state: Dict[str, Any]):
-        try:
-            with open(self.state_path, "w", encoding="utf-8") as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error("Error guardando state: %s", e)
-            raise
+        with self._state_write():
+            try:
+                _atomic_write_json(self.state_path, state, indent=2)
+            except Exception as e:
+                logger.error("Error guardando state: %s", e)
+                raise
+
+    def _update_state(self, mutate: Callable[[Dict[str, Any]], None]):
+        """Lee, modifica y guarda el estado (una lectura y una escritura)."""
+        with self._state_write():
+            state = self.load_state()
+            state.setdefault("update_offset", 0)
+            state.setdefault("sessions", {})
+            mutate(state)
+            self.save_state(state)
+
+    def apply_state_changes(
+        self,
+        sessions: Optional[Dict[int, Optional[Dict[str, Any]]]] = None,
+        update_offset: Optional[int] = None,
+    ):
+        def mutate(state: Dict[str, Any]):
+            for user_id, session_data in (sessions or {}).items():
+                if session_data is None:
+                    state["sessions"].pop(str(user_id), None)
+                else:
+                    state["sessions"][str(user_id)] = session_data
+            if update_offset is not None:
+                state["update_offset"] = update_offset
+
+        self._update_state(mutate)
 
     def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
         state = self.load_state()
         return state.get("sessions", {}).get(str(user_id))
 
     def save_session(self, user_id: int, session_data: Dict[str, Any]):
-        state = self.load_state()
-        state.setdefault("sessions", {})[str(user_id)] = session_data
-        self.save_state(state)
+        self.apply_state_changes(sessions={user_id: session_data})
 
     def clear_session(self, user_id: int):
-        state = self.load_state()
-        state.get("sessions", {}).pop(str(user_id), None)
-        self.save_state(state)
+        self.apply_state_changes(sessions={user_id: None})
 
     def get_update_offset(self) -> int:
         state = self.load_state()
         return state.get("update_offset", 0)
 
     def save_update_offset(self, offset: int):
+        self.apply_state_changes(update_offset=offset)
+
+    def get_backfill_checkpoint(self) -> Optional[Dict[str, Any]]:
         state = self.load_state()
-        state["update_offset"] = offset
-        self.save_state(state)
+        return state.get("backfill_checkpoint")
+
+    def save_backfill_checkpoint(self, checkpoint: Optional[Dict[str, Any]]):
+        def mutate(state: Dict[str, Any]):
+            if checkpoint is None:
+                state.pop("backfill_checkpoint", None)
+            else:
+                state["backfill_checkpoint"] = checkpoint
+
+        self._update_state(mutate)
 
+    # === Leases (una sola instancia haciendo polling) ===
+    def _lease_path(self, name: str) -> str:
+        return os.path.join("data", f"{name}.lease")
 
+    @contextmanager
+    def _lease_file_lock(self, name: str):
+        """Lock exclusivo (flock) alrededor del read-modify-write del lease."""
+        with self._file_lock(self._lease_path(name)):
+            yield
+
+    @contextmanager
+    def _file_lock(self, path: str):
+        """Lock exclusivo entre procesos (flock sobre ``path``.lock)."""
+        with open(path + ".lock", "a+") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_lease(self, name: str) -> Dict[str, Any]:
+        try:
+            with open(self._lease_path(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def try_acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lease_file_lock(name):
+            lease = self._read_lease(name)
+            if lease.get("holder") not in (None, holder) and lease.get("expires_at", 0) > now:
+                return False
+            _atomic_write_json(self._lease_path(name), {"holder": holder, "expires_at": now + ttl})
+        return True
+
+    def release_lease(self, name: str, holder: str):
+        with self._lease_file_lock(name):
+            if self._read_lease(name).get("holder") == holder:
+                os.remove(self._lease_path(name))
+
+    # === Snapshots (índices derivados del ledger) ===
+    def _snapshot_path(self, name: str) -> str:
+        return os.path.join("data", f"{name}.snapshot.json")
+
+    def load_snapshot(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._snapshot_path(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Snapshot %s ilegible, se reconstruye: %s", name, e)
+            return None
+
+    def update_snapshot(self, name: str, mutate: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]):
+        path = self._snapshot_path(name)
+        with self._file_lock(path):
+            snapshot = mutate(self.load_snapshot(name))
+            _atomic_write_json(path, snapshot, separators=(",", ":"))
+
+
+@trace_methods("storage")
 class LedgerRepository:
     """Fachada que expone una API uniforme para ambos backends."""
 
@@ -314,25 +598,196 @@ class LedgerRepository:
         db_url = database_url or settings.DATABASE_URL
         # Validar que la URL no sea None ni cadena vacía
         if db_url and db_url.strip():
+            # SQLAlchemy solo se importa cuando hay base de datos configurada
+            from src.repositories.database_backend import _DatabaseLedgerBackend
+
             self._backend = _DatabaseLedgerBackend(db_url)
         else:
             self._backend = _FileLedgerBackend(ledger_path, state_path)
+        # Locks asyncio de escritura por event loop: uno para el ledger y otro para el estado
+        self._write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    # === Escrituras desde el event loop ===
+    async def _locked_write(self, kind: str, func: Callable, *args) -> Any:
+        """
+        Ejecuta una escritura en un thread, en orden de llegada entre corrutinas.
+
+        El lock del thread y el flock del backend pueden esperar a otro
+        proceso: en un thread esa espera no frena el event loop, y el lock
+        asyncio evita que varias corrutinas ocupen threads esperando lo mismo.
+        Ledger y estado tienen locks separados.
+        """
+        locks = self._write_locks.setdefault(asyncio.get_running_loop(), {})
+        lock = locks.get(kind)
+        if lock is None:
+            lock = locks[kind] = asyncio.Lock()
+        async with lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def append_gasto_async(self, gasto: Gasto) -> bool:
+        """``append_gasto`` sin bloquear el event loop."""
+        return await self._locked_write("ledger", self.append_gasto, gasto)
+
+    async def update_gasto_async(self, gasto: Gasto) -> bool:
+        """``update_gasto`` sin bloquear el event loop."""
+        return await self._locked_write("ledger", self.update_gasto, gasto)
+
+    async def delete_gasto_async(self, chat_id: int, message_id: int) -> bool:
+        """``delete_gasto`` sin bloquear el event loop."""
+        return await self._locked_write("ledger", self.delete_gasto, chat_id, message_id)
+
+    async def apply_state_changes_async(
+        self,
+        sessions: Optional[Dict[int, Optional[Dict[str, Any]]]] = None,
+        update_offset: Optional[int] = None,
+    ):
+        """``apply_state_changes`` sin bloquear el event loop."""
+        await self._locked_write("state", self.apply_state_changes, sessions, update_offset)
 
-    def load_ledger(self) -> List[Gasto]:
-        return self._backend.load_ledger()
+    def load_ledger(self, include_archive: bool = True) -> List[Gasto]:
+        """
+        Carga el ledger.
+
+        Args:
+            include_archive: Si es False, solo los meses en caliente (sin archivar)
+        """
+        return self._backend.load_ledger(include_archive)
+
+    def load_month(self, chat_id: int, month: str) -> List[Gasto]:
+        """
+        Movimientos de un chat en un mes, archivado o en caliente.
+
+        Args:
+            month: Mes "YYYY-MM" (hora local, como ``date_iso``)
+        """
+        return self._backend.load_month(chat_id, month)
 
     def save_ledger(self, gastos: List[Gasto]):
         self._backend.save_ledger(gastos)
 
+    def iter_ledger_chunks(
+        self,
+        chunk_size: int = 500,
+        after: Optional[Tuple[int, int, int]] = None,
+    ) -> Iterator[List[Gasto]]:
+        """
+        Recorre el ledger en lotes ordenados por (ts, chat_id, message_id).
+
+        Args:
+            chunk_size: Cantidad de movimientos por lote
+            after: Clave (ts, chat_id, message_id) desde la cual continuar (exclusiva)
+        """
+        return self._backend.iter_ledger_chunks(chunk_size, after)
+
     def append_gasto(self, gasto: Gasto) -> bool:
         return self._backend.append_gasto(gasto)
 
+    def append_gastos(self, gastos: List[Gasto]) -> List[Tuple[int, int]]:
+        """
+        Inserta varios gastos en una sola escritura, ignorando los duplicados.
+
+        Returns:
+            Claves (chat_id, message_id) de los gastos efectivamente agregados,
+            en el orden recibido
+        """
+        return self._backend.append_gastos(gastos)
+
+    def update_gasto(self, gasto: Gasto) -> bool:
+        """
+        Reemplaza el movimiento con la misma clave (chat_id, message_id).
+
+        Solo alcanza a los meses en caliente (los archivados son inmutables).
+
+        Returns:
+            True si existía y se actualizó
+        """
+        return self._backend.update_gasto(gasto)
+
+    def delete_gasto(self, chat_id: int, message_id: int) -> bool:
+        """
+        Elimina el movimiento (chat_id, message_id) de los meses en caliente.
+
+        Returns:
+            True si existía y se eliminó
+        """
+        return self._backend.delete_gasto(chat_id, message_id)
+
+    def search_gastos(
+        self,
+        chat_id: int,
+        query: str,
+        limit: int = 10,
+        before: Optional[Tuple[int, int]] = None,
+    ) -> List[Gasto]:
+        """
+        Busca movimientos del chat por descripción o payee (incluye meses archivados).
+
+        Todas las palabras deben aparecer (como prefijo). Los resultados vienen
+        del más reciente al más antiguo.
+
+        Args:
+            chat_id: Chat cuyos movimientos se buscan
+            query: Texto a buscar
+            limit: Máximo de resultados
+            before: Clave (ts, message_id) del último resultado de la página anterior (exclusiva)
+        """
+        return self._backend.search_gastos(chat_id, query, limit, before)
+
+    def sum_expenses(self, user_id: int, month: str, category: str, currency: str) -> int:
+        """
+        Total gastado (positivo) por un usuario en una categoría y moneda durante un mes.
+
+        Solo recorre los meses en caliente: es para el mes en curso.
+
+        Args:
+            month: Mes "YYYY-MM" (hora local, como ``date_iso``)
+        """
+        return self._backend.sum_expenses(user_id, month, category, currency)
+
+    def archive_closed_months(self, keep_months: Optional[int] = None) -> Dict[str, int]:
+        """
+        Mueve los meses cerrados al archivo (segmentos comprimidos o tabla de archivo).
+
+        Args:
+            keep_months: Meses que quedan en caliente, incluido el actual
+                (por defecto ``LEDGER_ARCHIVE_KEEP_MONTHS``)
+
+        Returns:
+            {mes "YYYY-MM": movimientos archivados}
+        """
+        now = datetime.now(local_tz())
+        cutoff = ledger_archive.cutoff_month(now, keep_months or settings.LEDGER_ARCHIVE_KEEP_MONTHS)
+        archived = self._backend.archive_months_before(cutoff)
+        if archived:
+            logger.info("📦 Meses archivados (anteriores a %s): %s", cutoff, archived)
+        return archived
+
+    def get_archive_summaries(self) -> List[Dict[str, Any]]:
+        """Resumen por mes archivado: month, count, totals (por moneda), min_ts, max_ts."""
+        return self._backend.get_archive_summaries()
+
     def load_state(self) -> Dict[str, Any]:
         return self._backend.load_state()
 
     def save_state(self, state: Dict[str, Any]):
         self._backend.save_state(state)
 
+    def apply_state_changes(
+        self,
+        sessions: Optional[Dict[int, Optional[Dict[str, Any]]]] = None,
+        update_offset: Optional[int] = None,
+    ):
+        """
+        Aplica cambios de sesiones y offset en una sola escritura del estado.
+
+        Args:
+            sessions: {user_id: sesión}; ``None`` como valor elimina la sesión
+            update_offset: Nuevo offset de updates (opcional)
+        """
+        self._backend.apply_state_changes(sessions, update_offset)
+
     def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
         return self._backend.get_session(user_id)
 
@@ -348,3 +803,34 @@ class LedgerRepository:
     def save_update_offset(self, offset: int):
         self._backend.save_update_offset(offset)
 
+    def get_backfill_checkpoint(self) -> Optional[Dict[str, Any]]:
+        return self._backend.get_backfill_checkpoint()
+
+    def save_backfill_checkpoint(self, checkpoint: Optional[Dict[str, Any]]):
+        self._backend.save_backfill_checkpoint(checkpoint)
+
+    def load_snapshot(self, name: str) -> Optional[Dict[str, Any]]:
+        """Snapshot persistido ``name`` (o None si no existe)."""
+        return self._backend.load_snapshot(name)
+
+    def update_snapshot(self, name: str, mutate: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]):
+        """
+        Reemplaza el snapshot ``name`` con ``mutate(actual)`` de forma atómica.
+
+        Args:
+            mutate: Recibe el snapshot guardado (o None) y devuelve el nuevo
+        """
+        self._backend.update_snapshot(name, mutate)
+
+    def try_acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """
+        Toma o renueva el lease ``name`` para ``holder``.
+
+        Returns:
+            True si ``holder`` tiene el lease (vigente por ``ttl`` segundos)
+        """
+        return self._backend.try_acquire_lease(name, holder, ttl)
+
+    def release_lease(self, name: str, holder: str):
+        """Libera el lease si lo tiene ``holder``."""
+        self._backend.release_lease(name, holder)
@@ -0,0 +1,260 @@
+"""
+Snapshot binario del ledger caliente (backend de archivos).
+
+``ledger.json`` sigue siendo la fuente de verdad; junto a él se guarda
+``ledger.snap``, una copia columnar que se abre con mmap:
+
+- encabezado de 64 bytes: formato, cantidad de filas y de strings, mtime,
+  tamaño, inodo y dispositivo del ``ledger.json`` del que salió y CRC32 del
+  cuerpo
+- columnas int64: chat_id, message_id, user_id, ts, amount
+- columnas uint32 con el id de cada string: date_iso, currency, category,
+  description, payee
+- tabla de strings internados (ordenada): offsets uint32 + bytes UTF-8
+
+Contar o sumar recorre las columnas sin crear un ``Gasto`` por fila; por estar
+ordenada la tabla, los ids de un prefijo (p. ej. un mes de ``date_iso``) son
+un rango contiguo. Si el ``ledger.json`` cambió por fuera (mtime, tamaño o
+inodo distintos: un reemplazo atómico cambia el inodo aunque coincidan los
+otros) o el CRC no coincide, el snapshot se descarta y se regenera.
+"""
+import bisect
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.schemas import Gasto
+
+SNAPSHOT_FORMAT = 2
+_MAGIC = b"LGSN"
+# magic, formato, filas, strings, mtime_ns, tamaño, inodo y dispositivo del JSON de origen, crc32
+_HEADER = struct.Struct("<4sHxxIIqqQQI")
+_HEADER_SIZE = 64  # Columnas alineadas a 8 bytes
+INT_COLUMNS = ("chat_id", "message_id", "user_id", "ts", "amount")
+STR_COLUMNS = ("date_iso", "currency", "category", "description", "payee")
+
+
+def snapshot_path(ledger_path: str) -> str:
+    """Ruta del snapshot de un ledger (``data/ledger.json`` → ``data/ledger.snap``)."""
+    return os.path.splitext(ledger_path)[0] + ".snap"
+
+
+Signature = Tuple[int, int, int, int]
+
+
+def source_signature(ledger_path: str) -> Optional[Signature]:
+    """(mtime_ns, tamaño, inodo, dispositivo) del ``ledger.json``, o None si no existe."""
+    try:
+        stat = os.stat(ledger_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino, stat.st_dev
+
+
+def write_snapshot(path: str, gastos: Sequence[Gasto], signature: Signature) -> bool:
+    """
+    Escribe el snapshot de ``gastos`` (reemplazo atómico).
+
+    Returns:
+        False si algún movimiento no se puede representar tal cual (montos
+        o timestamps no enteros, textos nulos): en ese caso se borra el
+        snapshot anterior y se sigue leyendo el JSON
+    """
+    count = len(gastos)
+    ints = {name: [getattr(g, name) for g in gastos] for name in INT_COLUMNS}
+    raw = {name: [getattr(g, name) for g in gastos] for name in STR_COLUMNS}
+    if any(type(value) is not int for values in ints.values() for value in values) or any(
+        type(value) is not str for values in raw.values() for value in values
+    ):
+        _remove(path)
+        return False
+
+    strings = sorted({value for values in raw.values() for value in values})
+    ids = {value: i for i, value in enumerate(strings)}
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = [0]
+    for blob in encoded:
+        offsets.append(offsets[-1] + len(blob))
+
+    try:
+        body = b"".join(
+            [struct.pack(f"<{count}q", *ints[name]) for name in INT_COLUMNS]
+            + [struct.pack(f"<{count}I", *(ids[value] for value in raw[name])) for name in STR_COLUMNS]
+            + [struct.pack(f"<{len(offsets)}I", *offsets)]
+            + encoded
+        )
+    except struct.error:  # Fuera de rango para int64
+        _remove(path)
+        return False
+
+    header = _HEADER.pack(
+        _MAGIC, SNAPSHOT_FORMAT, count, len(strings), *signature, zlib.crc32(body)
+    ).ljust(_HEADER_SIZE, b"\0")
+    # Temporal por proceso y thread: las lecturas sin lock también regeneran el snapshot
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    return True
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class LedgerSnapshot:
+    """
+    Snapshot abierto con mmap (solo lectura).
+
+    No se cierra explícitamente: el mapeo se libera cuando nadie más lo
+    referencia, así un lector en otro thread nunca queda con columnas inválidas.
+    """
+
+    def __init__(self, mm: mmap.mmap, count: int, string_count: int, signature: Signature):
+        self._mm = mm
+        self.count = count
+        self.signature = signature
+        view = memoryview(mm)
+        offset = _HEADER_SIZE
+        self._ints: Dict[str, memoryview] = {}
+        for name in INT_COLUMNS:
+            self._ints[name] = view[offset:offset + 8 * count].cast("q")
+            offset += 8 * count
+        self._str_ids: Dict[str, memoryview] = {}
+        for name in STR_COLUMNS:
+            self._str_ids[name] = view[offset:offset + 4 * count].cast("I")
+            offset += 4 * count
+        self._offsets = view[offset:offset + 4 * (string_count + 1)].cast("I")
+        self._blob_start = offset + 4 * (string_count + 1)
+        self._string_count = string_count
+        self._decoded: Dict[int, str] = {}
+
+    @classmethod
+    def open(cls, path: str, signature: Optional[Signature]) -> Optional["LedgerSnapshot"]:
+        """
+        Abre el snapshot si corresponde a ``signature`` y el CRC es válido.
+
+        Returns:
+            None si no existe, está desactualizado o corrupto
+        """
+        if signature is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < _HEADER_SIZE:
+                    return None
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        magic, version, count, string_count, *stored, crc = _HEADER.unpack_from(mm)
+        if (
+            magic != _MAGIC
+            or version != SNAPSHOT_FORMAT
+            or tuple(stored) != tuple(signature)
+            or len(mm) < _HEADER_SIZE + count * 60 + 4 * (string_count + 1)
+            or zlib.crc32(memoryview(mm)[_HEADER_SIZE:]) != crc
+        ):
+            mm.close()
+            return None
+        return cls(mm, count, string_count, tuple(stored))
+
+    def __len__(self) -> int:
+        return self.count
+
+    # === Acceso ===
+    def string(self, string_id: int) -> str:
+        value = self._decoded.get(string_id)
+        if value is None:
+            start = self._blob_start + self._offsets[string_id]
+            end = self._blob_start + self._offsets[string_id + 1]
+            value = self._decoded[string_id] = self._mm[start:end].decode("utf-8")
+        return value
+
+    def string_range(self, prefix: str) -> range:
+        """Ids de los strings que empiezan con ``prefix`` (rango contiguo)."""
+        keys = _StringKeys(self)
+        return range(bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + "\U0010ffff"))
+
+    def string_id(self, value: str) -> Optional[int]:
+        index = bisect.bisect_left(_StringKeys(self), value)
+        if index < self._string_count and self.string(index) == value:
+            return index
+        return None
+
+    def contains(self, chat_id: int, message_id: int) -> bool:
+        """Si la clave ya está, buscando los bytes del message_id directamente en su columna."""
+        start = _HEADER_SIZE + 8 * self.count  # Columna message_id
+        end = start + 8 * self.count
+        needle = struct.pack("<q", message_id)
+        chat_ids = self._ints["chat_id"]
+        position = self._mm.find(needle, start, end)
+        while position != -1:
+            row, misaligned = divmod(position - start, 8)
+            if not misaligned and chat_ids[row] == chat_id:
+                return True
+            position = self._mm.find(needle, position + 1, end)
+        return False
+
+    def gastos(self) -> List[Gasto]:
+        """Todos los movimientos, en el orden del ledger."""
+        chat_ids, message_ids, user_ids, timestamps, amounts = (self._ints[name].tolist() for name in INT_COLUMNS)
+        string = self.string
+        dates, currencies, categories, descriptions, payees = (
+            [string(i) for i in self._str_ids[name].tolist()] for name in STR_COLUMNS
+        )
+        return [
+            Gasto(*fields)
+            for fields in zip(
+                chat_ids, message_ids, user_ids, timestamps, dates, amounts, currencies, categories, descriptions, payees
+            )
+        ]
+
+    # === Agregados ===
+    def sum_expenses(self, user_id: int, month: str, category: str, currency: str) -> int:
+        """Total gastado (positivo) por el usuario en la categoría, moneda y mes."""
+        category_id = self.string_id(category)
+        currency_id = self.string_id(currency)
+        months = self.string_range(month)
+        if category_id is None or currency_id is None or not months:
+            return 0
+        total = 0
+        for row_user, amount, row_category, row_currency, date_id in zip(
+            self._ints["user_id"],
+            self._ints["amount"],
+            self._str_ids["category"],
+            self._str_ids["currency"],
+            self._str_ids["date_iso"],
+        ):
+            if (
+                amount < 0 and row_user == user_id and row_category == category_id
+                and row_currency == currency_id and date_id in months
+            ):
+                total -= amount
+        return total
+
+
+class _StringKeys:
+    """Vista de la tabla de strings como secuencia ordenada (para ``bisect``)."""
+
+    def __init__(self, snapshot: LedgerSnapshot):
+        self._snapshot = snapshot
+
+    def __len__(self) -> int:
+        return self._snapshot._string_count
+
+    def __getitem__(self, index: int) -> str:
+        return self._snapshot.string(index)
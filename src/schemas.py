@@ -57,6 +57,9 @@ class TelegramMessage:
     chat: TelegramChat
     text: str
     date: int
+    document: Optional[Dict[str, Any]] = None  # Archivo adjunto (file_id, file_name, file_size, ...)
+    caption: str = ""
+    callback_query_id: Optional[str] = None  # Si viene de un botón inline
 
     @classmethod
     def from_telegram_update(cls, update: Dict[str, Any]) -> "TelegramMessage":
@@ -67,7 +70,29 @@ class TelegramMessage:
             user=TelegramUser.from_telegram_update(message["from"]),
             chat=TelegramChat.from_telegram_update(message["chat"]),
             text=message.get("text", ""),
-            date=message.get("date", 0)
+            date=message.get("date", 0),
+            document=message.get("document"),
+            caption=message.get("caption", "")
+        )
+
+    @classmethod
+    def from_callback_query(cls, update: Dict[str, Any], now: int) -> "TelegramMessage":
+        """
+        Crea instancia desde un botón inline (callback_query).
+
+        ``message_id`` es el del mensaje con los botones, ``text`` el
+        callback_data y ``date`` el momento en que se procesa (el callback no
+        trae fecha propia).
+        """
+        callback = update["callback_query"]
+        message = callback.get("message", {})
+        return cls(
+            message_id=message["message_id"],
+            user=TelegramUser.from_telegram_update(callback["from"]),
+            chat=TelegramChat.from_telegram_update(message["chat"]),
+            text=callback.get("data", ""),
+            date=now,
+            callback_query_id=callback["id"]
         )
 
 
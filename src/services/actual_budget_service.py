@@ -2,19 +2,116 @@
 from __future__ import annotations
 
 import asyncio
-import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from typing import Optional
-
-from actual import Actual
-from actual.queries import reconcile_transaction, get_account
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 from src.config.settings import settings
 from src.schemas import Gasto
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.local_time import local_date
 from src.utils.logger import setup_logger
+from src.utils.tracing import span
 
 logger = setup_logger(__name__)
 
+_DEFAULT_TIMEOUT = object()
+
+
+class ActualBudgetUnavailableError(RuntimeError):
+    """Actual Budget no acepta llamadas (circuit breaker abierto o pool saturado)."""
+
+
+class _ResolverCache:
+    """
+    Cache de ids de Actual Budget: cuentas, categoría → id y payee → id.
+
+    Se guardan ids (no objetos ORM) porque cada sincronización abre una
+    sesión nueva; con el id, la resolución es una búsqueda por clave primaria.
+    Todo el contenido expira junto tras ``ttl`` segundos.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._accounts: Dict[str, str] = {}
+        self._categories: Dict[str, str] = {}
+        self._payees: Dict[str, str] = {}
+        self._loaded_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def _expire_if_stale(self):
+        if time.monotonic() - self._loaded_at >= self.ttl:
+            self._accounts.clear()
+            self._categories.clear()
+            self._payees.clear()
+            self._loaded_at = time.monotonic()
+
+    def _get(self, table: Dict[str, str], key: str) -> Optional[str]:
+        with self._lock:
+            self._expire_if_stale()
+            value = table.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def _set(self, table: Dict[str, str], key: str, value: str):
+        with self._lock:
+            self._expire_if_stale()
+            table[key] = value
+
+    def _pop(self, table: Dict[str, str], key: str):
+        with self._lock:
+            table.pop(key, None)
+
+    def has_account(self, account_id: str) -> bool:
+        return self._get(self._accounts, account_id) is not None
+
+    def remember_account(self, account_id: str, resolved_id: str):
+        self._set(self._accounts, account_id, resolved_id)
+
+    def forget_account(self, account_id: str):
+        self._pop(self._accounts, account_id)
+
+    def get_category_id(self, name: str) -> Optional[str]:
+        return self._get(self._categories, name)
+
+    def remember_category(self, name: str, category_id: str):
+        self._set(self._categories, name, category_id)
+
+    def forget_category(self, name: str):
+        self._pop(self._categories, name)
+
+    def get_payee_id(self, name: str) -> Optional[str]:
+        return self._get(self._payees, name)
+
+    def remember_payee(self, name: str, payee_id: str):
+        self._set(self._payees, name, payee_id)
+
+    def forget_payee(self, name: str):
+        self._pop(self._payees, name)
+
+    def invalidate(self):
+        with self._lock:
+            self._accounts.clear()
+            self._categories.clear()
+            self._payees.clear()
+            self._loaded_at = time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "accounts": len(self._accounts),
+            "categories": len(self._categories),
+            "payees": len(self._payees),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
 
 class ActualBudgetService:
     """Servicio para insertar transacciones en Actual Budget usando actualpy."""
@@ -25,74 +122,253 @@ class ActualBudgetService:
         self.budget_id = settings.ACTUAL_BUDGET_BUDGET_ID
         self.encryption_key = settings.ACTUAL_BUDGET_ENCRYPTION_KEY
 
+        # Pool propio y acotado: un servidor colgado no agota el executor por defecto
+        self.max_workers = settings.ACTUAL_BUDGET_MAX_WORKERS
+        self.call_timeout = settings.ACTUAL_BUDGET_TIMEOUT
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self.breaker = CircuitBreaker(
+            "actual_budget",
+            failure_threshold=settings.ACTUAL_BUDGET_BREAKER_FAILURES,
+            reset_timeout=settings.ACTUAL_BUDGET_BREAKER_RESET,
+        )
+        self.metrics: Dict[str, int] = {"calls": 0, "timeouts": 0, "saturated": 0}
+        self._resolver = _ResolverCache(ttl=settings.ACTUAL_BUDGET_CACHE_TTL)
+
     def is_configured(self) -> bool:
         """Indica si hay suficiente configuración para sincronizar."""
         return bool(self.base_url and self.budget_id and self.password)
 
-    def _create_transaction_sync(self, gasto: Gasto, account_id: str):
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="actual-budget",
+            )
+        return self._executor
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas del executor y del circuit breaker."""
+        return {
+            **self.metrics,
+            "in_flight": self._in_flight,
+            "breaker": self.breaker.snapshot(),
+            "resolver": self._resolver.stats(),
+        }
+
+    async def _run_blocking(self, func: Callable, *args, timeout: Any = _DEFAULT_TIMEOUT) -> Any:
         """
-        Crea una transacción usando actualpy (síncrono).
+        Ejecuta una llamada bloqueante de actualpy en el pool dedicado.
 
-        Esta función se ejecuta en un thread separado para no bloquear el event loop.
+        Aplica timeout por llamada (``call_timeout`` salvo que se indique otro;
+        ``None`` desactiva el timeout) y pasa por el circuit breaker.
+
+        Raises:
+            ActualBudgetUnavailableError: Si el breaker está abierto o el pool saturado
+            asyncio.TimeoutError: Si la llamada supera ``call_timeout``
         """
-        logger.debug(f"Conectando a Actual Budget: {self.base_url}, budget: {self.budget_id}")
+        if not self.breaker.allow_request():
+            raise ActualBudgetUnavailableError("circuit breaker abierto")
+
+        # Los threads colgados no se pueden cancelar: si el pool está lleno,
+        # fallar rápido en lugar de encolar más trabajo detrás de ellos.
+        if self._in_flight >= self.max_workers:
+            self.metrics["saturated"] += 1
+            self.breaker.record_failure()
+            raise ActualBudgetUnavailableError("pool de Actual Budget saturado")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), func, *args)
+        self._in_flight += 1
+        future.add_done_callback(self._on_call_done)
+        self.metrics["calls"] += 1
+
+        try:
+            if timeout is _DEFAULT_TIMEOUT:
+                timeout = self.call_timeout
+            with span("actual." + func.__name__.strip("_").removesuffix("_sync")):
+                result = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.metrics["timeouts"] += 1
+            self.breaker.record_failure()
+            logger.error(
+                "Timeout (%ss) llamando a Actual Budget; métricas=%s",
+                timeout,
+                self.get_metrics(),
+            )
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelación: no es un fallo del servicio, pero libera la llamada de prueba
+            self.breaker.release_probe()
+            raise
 
-        with Actual(
+        self.breaker.record_success()
+        return result
+
+    def _on_call_done(self, _future):
+        self._in_flight -= 1
+
+    def _open_actual(self):
+        """Abre una sesión de actualpy contra el presupuesto configurado."""
+        # actualpy se importa recién en el primer uso (solo si está configurado)
+        from actual import Actual
+
+        logger.debug("Conectando a Actual Budget: %s, budget: %s", self.base_url, self.budget_id)
+        return Actual(
             base_url=self.base_url,
             password=self.password,
             file=self.budget_id,
             encryption_password=self.encryption_key,
-        ) as actual:
-            # Obtener la cuenta
-            try:
-                account = get_account(actual.session, account_id)
-                if not account:
-                    logger.error(f"Cuenta no encontrada: {account_id}")
-                    return
-            except Exception as e:
-                logger.error(f"Error al obtener cuenta {account_id}: {e}")
-                return
+        )
 
-            # Parsear fecha
-            date_str = gasto.date_iso.split(" ")[0] if gasto.date_iso else None
-            if date_str:
-                try:
-                    date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-                except ValueError:
-                    date = datetime.date.today()
-            else:
-                date = datetime.date.today()
+    def _resolve_account(self, session, account_id: str):
+        """Obtiene la cuenta, usando el id cacheado para una búsqueda por clave primaria."""
+        from actual.database import Accounts
+        from actual.queries import get_account
 
-            # Convertir monto a Decimal (actualpy usa Decimal, no milliunits)
-            amount = Decimal(str(gasto.amount))
+        if self._resolver.has_account(account_id):
+            account = session.get(Accounts, account_id)
+            if account is not None and not account.tombstone:
+                return account
+            self._resolver.forget_account(account_id)
 
-            # Payee
-            payee = gasto.payee or settings.PAYEE_DEFAULT or None
+        account = get_account(session, account_id)
+        if account is not None:
+            self._resolver.remember_account(account_id, account.id)
+        return account
 
-            # Notes (descripción)
-            notes = gasto.description or ""
+    def _resolve_category(self, session, name: Optional[str]):
+        """Obtiene (o crea una única vez) la categoría por nombre."""
+        if not name:
+            return None
+        from actual.database import Categories
+        from actual.queries import get_or_create_category
 
-            # Categoría (nombre de categoría)
-            category = gasto.category if gasto.category else None
+        category_id = self._resolver.get_category_id(name)
+        if category_id:
+            category = session.get(Categories, category_id)
+            if category is not None and not category.tombstone:
+                return category
+            self._resolver.forget_category(name)
+
+        category = get_or_create_category(session, name)
+        self._resolver.remember_category(name, category.id)
+        return category
+
+    def _resolve_payee(self, session, name: Optional[str]):
+        """Obtiene (o crea una única vez) el payee por nombre."""
+        if not name:
+            return None
+        from actual.database import Payees
+        from actual.queries import get_or_create_payee
+
+        payee_id = self._resolver.get_payee_id(name)
+        if payee_id:
+            payee = session.get(Payees, payee_id)
+            if payee is not None and not payee.tombstone:
+                return payee
+            self._resolver.forget_payee(name)
+
+        payee = get_or_create_payee(session, name)
+        self._resolver.remember_payee(name, payee.id)
+        return payee
+
+    def _warm_up_sync(self):
+        """Precarga en el cache las cuentas, categorías y payee configurados."""
+        from actual.queries import get_category, get_payee
+
+        with self._open_actual() as actual:
+            self._resolver.invalidate()
+            for account_id in settings.ACTUAL_BUDGET_ACCOUNTS.values():
+                if not self._resolve_account(actual.session, account_id):
+                    logger.warning("Cuenta configurada no encontrada en Actual Budget: %s", account_id)
+
+            # Solo búsqueda: las categorías/payees faltantes se crean al primer uso
+            for name in settings.CATEGORIES:
+                category = get_category(actual.session, name)
+                if category is not None:
+                    self._resolver.remember_category(name, category.id)
+
+            if settings.PAYEE_DEFAULT:
+                payee = get_payee(actual.session, settings.PAYEE_DEFAULT)
+                if payee is not None:
+                    self._resolver.remember_payee(settings.PAYEE_DEFAULT, payee.id)
+
+        logger.info("Cache de Actual Budget precargado: %s", self._resolver.stats())
+
+    def _reconcile_gasto(self, session, gasto: Gasto, account, already_matched: Optional[list] = None):
+        """
+        Reconcilia un gasto contra Actual Budget dentro de una sesión abierta.
+
+        Usa ``imported_id`` (``telegram:<chat_id>:<message_id>``) para evitar
+        duplicados. No hace commit.
+
+        Returns:
+            La transacción creada o encontrada
+        """
+        from actual.queries import reconcile_transaction
 
-            # Crear imported_id único para evitar duplicados
-            imported_id = f"telegram:{gasto.chat_id}:{gasto.message_id}"
+        date = local_date(gasto.ts)
 
-            logger.info(f"Creando transacción: {date} | {amount} {gasto.currency} | {category} | {payee}")
+        # Convertir monto a Decimal (actualpy usa Decimal, no milliunits)
+        amount = Decimal(str(gasto.amount))
+
+        # Payee
+        payee = gasto.payee or settings.PAYEE_DEFAULT or None
+
+        # Notes (descripción)
+        notes = gasto.description or ""
+
+        # Categoría (nombre de categoría)
+        category = gasto.category if gasto.category else None
+
+        # Crear imported_id único para evitar duplicados
+        imported_id = f"telegram:{gasto.chat_id}:{gasto.message_id}"
+
+        logger.debug(
+            "Reconciliando transacción: %s | %s %s | %s | %s",
+            date,
+            amount,
+            gasto.currency,
+            category,
+            payee,
+        )
+
+        # Usar reconcile_transaction que maneja duplicados automáticamente
+        return reconcile_transaction(
+            session,
+            date=date,
+            account=account,
+            payee=self._resolve_payee(session, payee),
+            notes=notes,
+            category=self._resolve_category(session, category),
+            amount=amount,
+            imported_id=imported_id,
+            cleared=True,  # Marcar como cleared
+            already_matched=already_matched,
+        )
+
+    def _create_transaction_sync(self, gasto: Gasto, account_id: str):
+        """
+        Crea una transacción usando actualpy (síncrono).
+
+        Esta función se ejecuta en un thread separado para no bloquear el event loop.
+        """
+        with self._open_actual() as actual:
+            # Obtener la cuenta (un error acá cuenta como fallo para el breaker)
+            try:
+                account = self._resolve_account(actual.session, account_id)
+            except Exception as e:
+                logger.error("Error al obtener cuenta %s: %s", account_id, e)
+                raise
+            if not account:
+                raise ValueError(f"Cuenta no encontrada en Actual Budget: {account_id}")
 
-            # Usar reconcile_transaction que maneja duplicados automáticamente
             try:
-                t = reconcile_transaction(
-                    actual.session,
-                    date=date,
-                    account=account,
-                    payee=payee,
-                    notes=notes,
-                    category=category,
-                    amount=amount,
-                    imported_id=imported_id,
-                    cleared=True,  # Marcar como cleared
-                )
+                t = self._reconcile_gasto(actual.session, gasto, account)
 
                 # Verificar si es nueva o existente ANTES del commit
                 is_new = t and t.changed()
@@ -101,20 +377,159 @@ class ActualBudgetService:
                 actual.commit()
 
                 if is_new:
-                    logger.info(f"✅ Transacción nueva sincronizada con Actual Budget: {t.id}")
+                    logger.info("✅ Transacción nueva sincronizada con Actual Budget: %s", t.id)
                 else:
                     logger.info("ℹ️ Transacción ya existía (duplicado evitado)")
 
             except Exception as e:
-                logger.error(f"Error al crear transacción: {e}", exc_info=True)
+                # Lo memorizado en esta sesión pudo no haberse confirmado
+                self._resolver.invalidate()
+                logger.error("Error al crear transacción: %s", e, exc_info=True)
+                raise
+
+    def _find_by_imported_id(self, session, gasto: Gasto):
+        """Transacción (no borrada) con el ``imported_id`` del gasto, en cualquier cuenta."""
+        from actual.database import Transactions
+        from sqlmodel import select
+
+        imported_id = f"telegram:{gasto.chat_id}:{gasto.message_id}"
+        return session.exec(
+            select(Transactions).where(Transactions.financial_id == imported_id, Transactions.tombstone == 0)
+        ).first()
+
+    def _update_transaction_sync(self, gasto: Gasto) -> bool:
+        """Aplica monto, fecha, notas y categoría del gasto a su transacción en Actual."""
+        with self._open_actual() as actual:
+            t = self._find_by_imported_id(actual.session, gasto)
+            if t is None:
+                return False
+            try:
+                t.set_date(local_date(gasto.ts))
+                t.set_amount(Decimal(str(gasto.amount)))
+                t.notes = gasto.description or ""
+                category = self._resolve_category(actual.session, gasto.category or None)
+                t.category_id = category.id if category is not None else None
+                actual.commit()
+            except Exception:
+                self._resolver.invalidate()
                 raise
+        return True
+
+    def _delete_transaction_sync(self, gasto: Gasto) -> bool:
+        """Borra (tombstone) la transacción del gasto en Actual."""
+        with self._open_actual() as actual:
+            t = self._find_by_imported_id(actual.session, gasto)
+            if t is None:
+                return False
+            t.delete()
+            actual.commit()
+        return True
+
+    def _backfill_sync(
+        self,
+        chunks: Iterable[List[Gasto]],
+        account_id: str,
+        dry_run: bool = False,
+        on_chunk: Optional[Callable[[List[Gasto], Dict[str, int]], None]] = None,
+    ) -> Dict[str, int]:
+        """
+        Reconcilia lotes de gastos usando una única sesión de Actual Budget.
+
+        Hace commit por lote (o rollback si ``dry_run``) y llama a ``on_chunk``
+        después de cada lote con los contadores acumulados.
+        """
+        from sqlalchemy import inspect as sa_inspect
+
+        stats = {"processed": 0, "created": 0, "updated": 0, "unchanged": 0, "chunks": 0}
+
+        with self._open_actual() as actual:
+            account = self._resolve_account(actual.session, account_id)
+            if not account:
+                raise ValueError(f"Cuenta no encontrada en Actual Budget: {account_id}")
+
+            for chunk in chunks:
+                already_matched: list = []
+                try:
+                    for gasto in chunk:
+                        # Sin autoflush, una transacción nueva sigue "pending" al clasificarla
+                        with actual.session.no_autoflush:
+                            t = self._reconcile_gasto(actual.session, gasto, account, already_matched)
+                        already_matched.append(t)
+                        if sa_inspect(t).pending:
+                            stats["created"] += 1
+                        elif t.changed():
+                            stats["updated"] += 1
+                        else:
+                            stats["unchanged"] += 1
+
+                    if dry_run:
+                        actual.session.rollback()
+                    else:
+                        actual.commit()
+                except Exception:
+                    actual.session.rollback()
+                    self._resolver.invalidate()
+                    raise
+
+                if dry_run:
+                    # Lo creado en la sesión se descartó con el rollback
+                    self._resolver.invalidate()
+
+                stats["processed"] += len(chunk)
+                stats["chunks"] += 1
+                if on_chunk:
+                    on_chunk(chunk, dict(stats))
+
+        return stats
+
+    async def warm_up(self):
+        """Precarga el cache de resolución (cuentas, categorías, payee) al iniciar."""
+        if not self.is_configured():
+            return
+        try:
+            await self._run_blocking(self._warm_up_sync)
+        except Exception as exc:
+            logger.warning("No se pudo precargar el cache de Actual Budget: %s", exc)
+
+    async def backfill(
+        self,
+        chunks: Iterable[List[Gasto]],
+        account_id: str,
+        dry_run: bool = False,
+        on_chunk: Optional[Callable[[List[Gasto], Dict[str, int]], None]] = None,
+    ) -> Dict[str, int]:
+        """
+        Reconcilia lotes de gastos en el pool dedicado (sin timeout por llamada).
+
+        ``chunks`` se consume dentro del thread de trabajo, por lo que puede
+        leer del repositorio de forma perezosa.
+        """
+        if not self.is_configured():
+            raise ValueError("Actual Budget no está configurado")
+        return await self._run_blocking(
+            self._backfill_sync, chunks, account_id, dry_run, on_chunk, timeout=None
+        )
+
+    def invalidate_resolver_cache(self):
+        """Descarta los ids cacheados (p. ej. tras cambios manuales en Actual)."""
+        self._resolver.invalidate()
 
     async def create_transaction(self, gasto: Gasto, account_id: str = None):
         """Inserta una transacción en Actual Budget (async wrapper)."""
-        logger.debug(f"create_transaction llamado - base_url={self.base_url}, budget_id={self.budget_id}, account_id={account_id}")
+        logger.debug(
+            "create_transaction llamado - base_url=%s, budget_id=%s, account_id=%s",
+            self.base_url,
+            self.budget_id,
+            account_id,
+        )
 
         if not self.is_configured():
-            logger.warning(f"Actual Budget no configurado correctamente - base_url={self.base_url}, budget_id={self.budget_id}, password={'***' if self.password else None}")
+            logger.warning(
+                "Actual Budget no configurado correctamente - base_url=%s, budget_id=%s, password=%s",
+                self.base_url,
+                self.budget_id,
+                "***" if self.password else None,
+            )
             return
 
         # Validar que haya un account_id válido
@@ -122,14 +537,58 @@ class ActualBudgetService:
             logger.error("No se puede sincronizar: account_id no especificado")
             return
 
-        logger.info(f"Sincronizando transacción: {gasto.amount} {gasto.currency} - {gasto.category} → cuenta {account_id}")
+        logger.info(
+            "Sincronizando transacción: %s %s - %s → cuenta %s",
+            gasto.amount,
+            gasto.currency,
+            gasto.category,
+            account_id,
+        )
 
         try:
-            # Ejecutar la función síncrona en un thread separado
-            await asyncio.to_thread(self._create_transaction_sync, gasto, account_id)
+            # Ejecutar la función síncrona en el pool dedicado
+            await self._run_blocking(self._create_transaction_sync, gasto, account_id)
+        except ActualBudgetUnavailableError as exc:
+            logger.warning(
+                "Sincronización con Actual Budget omitida (%s); breaker=%s",
+                exc,
+                self.breaker.snapshot(),
+            )
+        except asyncio.TimeoutError:
+            pass  # Ya registrado en _run_blocking
         except Exception as exc:
-            logger.error(f"Fallo al sincronizar con Actual Budget: {exc}", exc_info=True)
+            logger.error("Fallo al sincronizar con Actual Budget: %s", exc, exc_info=True)
+
+    async def _mirror(self, func: Callable, gasto: Gasto, action: str):
+        """Ejecuta una edición/borrado en Actual con el mismo manejo de errores que ``create_transaction``."""
+        if not self.is_configured():
+            return
+        try:
+            found = await self._run_blocking(func, gasto)
+        except ActualBudgetUnavailableError as exc:
+            logger.warning("%s en Actual Budget omitido (%s); breaker=%s", action, exc, self.breaker.snapshot())
+            return
+        except asyncio.TimeoutError:
+            return  # Ya registrado en _run_blocking
+        except Exception as exc:
+            logger.error("Fallo al replicar %s en Actual Budget: %s", action, exc, exc_info=True)
+            return
+        if found:
+            logger.info("✅ %s replicado en Actual Budget (chat_id=%s, message_id=%s)", action, gasto.chat_id, gasto.message_id)
+        else:
+            logger.info("ℹ️ %s: la transacción no estaba en Actual Budget", action)
+
+    async def update_transaction(self, gasto: Gasto):
+        """Replica la edición de un gasto en su transacción (buscada por ``imported_id``)."""
+        await self._mirror(self._update_transaction_sync, gasto, "Edición")
+
+    async def delete_transaction(self, gasto: Gasto):
+        """Borra la transacción de un gasto deshecho (buscada por ``imported_id``)."""
+        await self._mirror(self._delete_transaction_sync, gasto, "Borrado")
 
     async def close(self):
-        """Cierra recursos (no necesario para actualpy, mantiene compatibilidad)."""
-        pass
+        """Libera el pool de threads dedicado sin esperar llamadas colgadas."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        logger.info("Métricas de Actual Budget: %s", self.get_metrics())
@@ -0,0 +1,99 @@
+"""Servicio para reconciliar el ledger histórico con Actual Budget."""
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config.settings import settings
+from src.repositories.ledger_repository import LedgerRepository
+from src.schemas import Gasto
+from src.services.actual_budget_service import ActualBudgetService
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class BackfillService:
+    """
+    Envía movimientos del ledger a Actual Budget en lotes.
+
+    Recorre el ledger en orden (ts, chat_id, message_id), reconcilia cada lote
+    en una única sesión de Actual (dedup por ``imported_id``) y guarda un
+    checkpoint tras cada lote confirmado para poder retomar.
+    """
+
+    def __init__(
+        self,
+        ledger_repository: LedgerRepository,
+        actual_budget_service: ActualBudgetService,
+        chunk_size: Optional[int] = None,
+    ):
+        self.ledger = ledger_repository
+        self.actual_budget = actual_budget_service
+        self.chunk_size = chunk_size or settings.BACKFILL_CHUNK_SIZE
+        self.running = False
+
+    def resolve_account_id(self, account: Optional[str] = None) -> Optional[str]:
+        """Acepta un nombre de ``ACTUAL_BUDGET_ACCOUNTS`` o un id; por defecto la cuenta principal."""
+        if not account:
+            return settings.ACTUAL_BUDGET_ACCOUNT_ID
+        return settings.ACTUAL_BUDGET_ACCOUNTS.get(account, account)
+
+    def reset_checkpoint(self):
+        """Olvida el progreso guardado (el próximo backfill empieza desde el inicio)."""
+        self.ledger.save_backfill_checkpoint(None)
+
+    async def run(
+        self,
+        account: Optional[str] = None,
+        dry_run: bool = False,
+        resume: bool = True,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Ejecuta el backfill.
+
+        Args:
+            account: Nombre o id de la cuenta destino en Actual Budget
+            dry_run: Si es True, reporta qué cambiaría sin confirmar nada
+            resume: Si es True, continúa desde el último checkpoint de la misma cuenta
+            progress: Callback (se llama desde el thread de trabajo) con los contadores acumulados
+
+        Returns:
+            Contadores: processed, created, updated, unchanged, chunks
+        """
+        account_id = self.resolve_account_id(account)
+        if not account_id:
+            raise ValueError("No hay cuenta de Actual Budget para el backfill")
+        if self.running:
+            raise RuntimeError("Ya hay un backfill en curso")
+
+        after = None
+        checkpoint = self.ledger.get_backfill_checkpoint() if resume else None
+        if checkpoint and checkpoint.get("account_id") == account_id:
+            after = tuple(checkpoint["last_key"])
+            logger.info("Retomando backfill desde %s", after)
+
+        def on_chunk(chunk: List[Gasto], stats: Dict[str, int]):
+            if not dry_run:
+                last = chunk[-1]
+                self.ledger.save_backfill_checkpoint({
+                    "account_id": account_id,
+                    "last_key": [last.ts, last.chat_id, last.message_id],
+                    "updated_at": datetime.utcnow().isoformat(timespec="seconds"),
+                })
+            logger.info("Backfill%s: %s", " (dry-run)" if dry_run else "", stats)
+            if progress:
+                progress(stats)
+
+        self.running = True
+        try:
+            stats = await self.actual_budget.backfill(
+                self.ledger.iter_ledger_chunks(self.chunk_size, after),
+                account_id,
+                dry_run=dry_run,
+                on_chunk=on_chunk,
+            )
+        finally:
+            self.running = False
+
+        logger.info("Backfill%s finalizado: %s", " (dry-run)" if dry_run else "", stats)
+        return {**stats, "dry_run": dry_run, "account_id": account_id, "resumed_from": after}
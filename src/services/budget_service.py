@@ -0,0 +1,333 @@
+"""Servicio de presupuestos mensuales por categoría."""
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.repositories.ledger_repository import LedgerRepository
+from src.schemas import Gasto
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Porcentajes del presupuesto que disparan un aviso
+ALERT_THRESHOLDS = (80, 100)
+# Meses de acumuladores que se conservan por usuario
+KEEP_MONTHS = 3
+
+
+def _snapshot_name(user_id: int) -> str:
+    return f"budget_{user_id}"
+
+
+def _bucket(category: str, currency: str) -> str:
+    return f"{category}|{currency}"
+
+
+def _new_accumulator() -> Dict[str, Any]:
+    # chats: mayor message_id real sumado por chat; keys: ids sintéticos (negativos) sumados;
+    # undone: claves reales por debajo de la marca de su chat que se restaron
+    return {"spent": 0, "alerted": [], "seeded_ts": None, "chats": {}, "keys": [], "undone": []}
+
+
+def _is_counted(accumulator: Dict[str, Any], gasto: Gasto) -> bool:
+    """Si el gasto se sumó al acumulador después del cálculo inicial."""
+    key = (gasto.chat_id, gasto.message_id)
+    if gasto.message_id < 0:
+        return key in {tuple(k) for k in accumulator["keys"]}
+    if key in {tuple(k) for k in accumulator["undone"]}:
+        return False
+    return gasto.message_id <= accumulator["chats"].get(str(gasto.chat_id), 0)
+
+
+def _in_seed(accumulator: Dict[str, Any], gasto: Gasto) -> bool:
+    """Si el gasto ya estaba en el ledger cuando se calculó el acumulador (``set_limit``)."""
+    seeded_ts = accumulator.get("seeded_ts")
+    return seeded_ts is not None and int(gasto.ts) <= seeded_ts
+
+
+def _mark_counted(accumulator: Dict[str, Any], gasto: Gasto):
+    key = [gasto.chat_id, gasto.message_id]
+    if gasto.message_id < 0:
+        accumulator["keys"].append(key)
+        return
+    if key in accumulator["undone"]:
+        accumulator["undone"].remove(key)
+    chat = str(gasto.chat_id)
+    accumulator["chats"][chat] = max(accumulator["chats"].get(chat, 0), gasto.message_id)
+
+
+def _unmark_counted(accumulator: Dict[str, Any], gasto: Gasto):
+    key = [gasto.chat_id, gasto.message_id]
+    if gasto.message_id < 0:
+        if key in accumulator["keys"]:
+            accumulator["keys"].remove(key)
+    elif gasto.message_id <= accumulator["chats"].get(str(gasto.chat_id), 0) and key not in accumulator["undone"]:
+        accumulator["undone"].append(key)
+
+
+class BudgetService:
+    """
+    Presupuestos mensuales por (usuario, categoría) con avisos al 80% y 100%.
+
+    Cada usuario tiene un snapshot con sus límites y un acumulador por
+    (mes, categoría, moneda): lo gastado, los avisos ya enviados, el momento
+    del cálculo inicial (``set_limit``) y qué gastos se sumaron desde
+    entonces. Registrar un gasto suma al acumulador sin recorrer el ledger.
+
+    Los ids de Telegram crecen dentro de cada chat, así que de los mensajes
+    reales alcanza con guardar el mayor sumado por chat; los ids sintéticos
+    (negativos: recurrentes) se guardan uno por uno. Así el acumulador queda
+    acotado y una redelivery, o un gasto con fecha anterior (ocurrencias
+    recurrentes atrasadas, otro chat, otro worker), se cuenta una sola vez.
+    """
+
+    def __init__(self, ledger_repository: LedgerRepository):
+        self.ledger = ledger_repository
+        self._limits: Dict[int, Dict[str, Dict[str, Any]]] = {}  # Caché de límites por usuario
+        self._lock = threading.Lock()
+
+    def _get_limits(self, user_id: int) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            limits = self._limits.get(user_id)
+        if limits is None:
+            snapshot = self.ledger.load_snapshot(_snapshot_name(user_id)) or {}
+            limits = snapshot.get("limits", {})
+            with self._lock:
+                self._limits[user_id] = limits
+        return limits
+
+    @staticmethod
+    def _usage(spent: int, limit: int) -> int:
+        return int(spent * 100 // limit) if limit > 0 else 0
+
+    # === Configuración ===
+    def set_limit(
+        self, user_id: int, category: str, amount: int, currency: str, month: str, as_of_ts: int
+    ) -> Dict[str, Any]:
+        """
+        Define el presupuesto mensual de una categoría.
+
+        El acumulador del mes se inicializa una única vez sumando lo ya
+        gastado; los umbrales ya superados no vuelven a avisar.
+
+        Args:
+            as_of_ts: Momento del cálculo; los gastos hasta ese segundo ya
+                quedan sumados y no se vuelven a contar si llegan de nuevo
+
+        Returns:
+            Estado de la categoría en el mes (ver ``get_status``)
+        """
+        spent = self.ledger.sum_expenses(user_id, month, category, currency)
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"limits": {}, "months": {}}
+            snapshot["limits"][category] = {"amount": int(amount), "currency": currency}
+            accumulators = snapshot["months"].setdefault(month, {})
+            accumulator = accumulators[_bucket(category, currency)] = _new_accumulator()
+            accumulator["spent"] = spent
+            accumulator["seeded_ts"] = int(as_of_ts)
+            accumulator["alerted"] = [t for t in ALERT_THRESHOLDS if self._usage(spent, amount) >= t]
+            return snapshot
+
+        snapshot = self._update(user_id, mutate)
+        logger.info("Presupuesto definido: user_id=%s %s %s %s", user_id, category, amount, currency)
+        return next(s for s in self._status_from(snapshot, month) if s["category"] == category)
+
+    def reseed_months(self, user_id: int, months: List[str], as_of_ts: int):
+        """
+        Recalcula desde el ledger los acumuladores de los meses indicados.
+
+        Para altas masivas que no pasan por ``record_expense`` (importación de
+        resúmenes). Igual que ``set_limit``, los umbrales ya superados quedan
+        marcados como avisados.
+        """
+        limits = self._get_limits(user_id)
+        if not limits or not months:
+            return
+        spent = {
+            (month, category): self.ledger.sum_expenses(user_id, month, category, limit["currency"])
+            for month in months
+            for category, limit in limits.items()
+        }
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"limits": {}, "months": {}}
+            for (month, category), total in spent.items():
+                limit = snapshot["limits"].get(category)
+                if not limit:
+                    continue
+                accumulator = snapshot["months"].setdefault(month, {})[_bucket(category, limit["currency"])] = (
+                    _new_accumulator()
+                )
+                accumulator["spent"] = total
+                accumulator["seeded_ts"] = int(as_of_ts)
+                accumulator["alerted"] = [t for t in ALERT_THRESHOLDS if self._usage(total, limit["amount"]) >= t]
+            return snapshot
+
+        self._update(user_id, mutate)
+
+    def remove_limit(self, user_id: int, category: str) -> bool:
+        """Elimina el presupuesto de una categoría; devuelve False si no existía."""
+        removed = []
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"limits": {}, "months": {}}
+            removed.append(snapshot["limits"].pop(category, None) is not None)
+            return snapshot
+
+        self._update(user_id, mutate)
+        return removed[0]
+
+    def get_status(self, user_id: int, month: str) -> List[Dict[str, Any]]:
+        """Uso del mes por categoría: category, limit, spent, currency, percent."""
+        snapshot = self.ledger.load_snapshot(_snapshot_name(user_id))
+        return self._status_from(snapshot, month) if snapshot else []
+
+    @staticmethod
+    def _status_from(snapshot: Dict[str, Any], month: str) -> List[Dict[str, Any]]:
+        accumulators = snapshot.get("months", {}).get(month, {})
+        status = []
+        for category, limit in sorted(snapshot.get("limits", {}).items()):
+            spent = accumulators.get(_bucket(category, limit["currency"]), {}).get("spent", 0)
+            status.append({
+                "category": category,
+                "limit": limit["amount"],
+                "currency": limit["currency"],
+                "spent": spent,
+                "percent": BudgetService._usage(spent, limit["amount"]),
+            })
+        return status
+
+    def _update(self, user_id: int, mutate) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+
+        def wrapped(snapshot):
+            snapshot = mutate(snapshot)
+            # Solo se conservan los últimos meses de acumuladores
+            for month in sorted(snapshot["months"])[:-KEEP_MONTHS]:
+                del snapshot["months"][month]
+            result.update(snapshot)
+            return snapshot
+
+        self.ledger.update_snapshot(_snapshot_name(user_id), wrapped)
+        with self._lock:
+            self._limits[user_id] = result.get("limits", {})
+        return result
+
+    # === Registro de gastos ===
+    def record_expense(self, gasto: Gasto, created: bool = True) -> List[Dict[str, Any]]:
+        """
+        Suma un gasto guardado en el ledger y devuelve los avisos que corresponden.
+
+        Es idempotente: un gasto ya sumado se ignora. Se llama también en las
+        redeliveries (``created`` False), así un corte entre el alta en el
+        ledger y el acumulador se recupera; en ese caso un gasto que ya estaba
+        en el ledger al calcular el acumulador (``set_limit``) no se suma.
+
+        Args:
+            created: Si el ledger acaba de crear el movimiento
+
+        Returns:
+            Avisos nuevos: category, threshold, spent, limit, currency, percent
+        """
+        if gasto.amount >= 0 or not gasto.category:
+            return []
+        limit = self._get_limits(gasto.user_id).get(gasto.category)
+        if not limit or limit["currency"] != gasto.currency:
+            return []
+
+        month = gasto.date_iso[:7]
+        alerts: List[Dict[str, Any]] = []
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"limits": {}, "months": {}}
+            current = snapshot["limits"].get(gasto.category)
+            if not current or current["currency"] != gasto.currency:
+                return snapshot
+            accumulator = snapshot["months"].setdefault(month, {}).setdefault(
+                _bucket(gasto.category, gasto.currency), _new_accumulator()
+            )
+            if _is_counted(accumulator, gasto) or (not created and _in_seed(accumulator, gasto)):
+                return snapshot  # Ya sumado (redelivery)
+
+            accumulator["spent"] += abs(int(gasto.amount))
+            _mark_counted(accumulator, gasto)
+            percent = self._usage(accumulator["spent"], current["amount"])
+            for threshold in ALERT_THRESHOLDS:
+                if percent >= threshold and threshold not in accumulator["alerted"]:
+                    accumulator["alerted"].append(threshold)
+                    alerts.append({
+                        "category": gasto.category,
+                        "threshold": threshold,
+                        "spent": accumulator["spent"],
+                        "limit": current["amount"],
+                        "currency": gasto.currency,
+                        "percent": percent,
+                    })
+            return snapshot
+
+        self._update(gasto.user_id, mutate)
+        # Si hay varios umbrales cruzados de una vez, alcanza con el mayor
+        return alerts[-1:]
+
+    def replace_expense(self, old: Gasto, new: Optional[Gasto]) -> List[Dict[str, Any]]:
+        """
+        Ajusta los acumuladores cuando un gasto se edita (``new``) o se deshace (None).
+
+        Resta el gasto anterior si estaba sumado y suma la versión nueva. Los
+        umbrales que dejan de alcanzarse se vuelven a habilitar.
+
+        Returns:
+            Avisos nuevos (como ``record_expense``)
+        """
+        def applies(snapshot: Dict[str, Any], gasto: Optional[Gasto]) -> bool:
+            if gasto is None or gasto.amount >= 0 or not gasto.category:
+                return False
+            limit = snapshot["limits"].get(gasto.category)
+            return bool(limit) and limit["currency"] == gasto.currency
+
+        alerts: List[Dict[str, Any]] = []
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"limits": {}, "months": {}}
+            touched = []
+            if applies(snapshot, old):
+                accumulator = snapshot["months"].get(old.date_iso[:7], {}).get(_bucket(old.category, old.currency))
+                if accumulator and (_is_counted(accumulator, old) or _in_seed(accumulator, old)):
+                    accumulator["spent"] = max(0, accumulator["spent"] - abs(int(old.amount)))
+                    _unmark_counted(accumulator, old)
+                    touched.append((old, accumulator))
+            if applies(snapshot, new):
+                accumulator = snapshot["months"].setdefault(new.date_iso[:7], {}).setdefault(
+                    _bucket(new.category, new.currency), _new_accumulator()
+                )
+                accumulator["spent"] += abs(int(new.amount))
+                _mark_counted(accumulator, new)
+                touched.append((new, accumulator))
+
+            for gasto, accumulator in touched:
+                limit = snapshot["limits"][gasto.category]["amount"]
+                percent = self._usage(accumulator["spent"], limit)
+                accumulator["alerted"] = [t for t in accumulator["alerted"] if percent >= t]
+                for threshold in ALERT_THRESHOLDS:
+                    if percent >= threshold and threshold not in accumulator["alerted"]:
+                        accumulator["alerted"].append(threshold)
+                        alerts.append({
+                            "category": gasto.category,
+                            "threshold": threshold,
+                            "spent": accumulator["spent"],
+                            "limit": limit,
+                            "currency": gasto.currency,
+                            "percent": percent,
+                        })
+            return snapshot
+
+        self._update(old.user_id, mutate)
+        return alerts[-1:]
+
+    @staticmethod
+    def format_alert(alert: Dict[str, Any]) -> str:
+        """Texto del aviso para Telegram."""
+        usage = f"{alert['spent']} / {alert['limit']} {alert['currency']} ({alert['percent']}%)"
+        if alert["threshold"] >= 100:
+            return f"🚨 Superaste el presupuesto de {alert['category']}\n\n💰 {usage}"
+        return f"⚠️ Usaste el {alert['threshold']}% del presupuesto de {alert['category']}\n\n💰 {usage}"
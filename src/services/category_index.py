@@ -0,0 +1,268 @@
+"""Índice por usuario de palabras de la descripción → categoría."""
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.config.settings import settings
+from src.repositories.ledger_repository import LedgerRepository
+from src.schemas import Gasto
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SNAPSHOT_NAME = "category_index"
+SNAPSHOT_VERSION = 2
+# Observaciones entre snapshots persistidos
+SNAPSHOT_EVERY = 25
+# Palabras que se conservan por usuario al persistir (las más frecuentes)
+MAX_TOKENS_PER_USER = 1000
+# Confianza mínima (suma de votos por palabra) para sugerir una categoría
+MIN_SCORE = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"con", "para", "por", "del", "los", "las", "una", "uno", "que", "mas", "the"}
+
+
+def tokenize(text: str) -> Set[str]:
+    """Palabras normalizadas (minúsculas, sin acentos, 3+ letras, sin números)."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    return {
+        token
+        for token in _TOKEN_RE.findall(text)
+        if len(token) >= 3 and not token.isdigit() and token not in _STOPWORDS
+    }
+
+
+class CategoryIndex:
+    """
+    Cuenta, por usuario, cuántas veces cada palabra de la descripción terminó
+    en cada categoría, y el total de gastos por categoría.
+
+    Se construye una vez desde el ledger, se actualiza con cada gasto nuevo y
+    se persiste como snapshot compacto. Cada usuario guarda la clave (ts,
+    chat_id, message_id) de su último movimiento incluido: al reiniciar se
+    recorren los movimientos desde la menor y se suman solo los posteriores a
+    la del usuario. Una marca por usuario (y no una global) hace que cada
+    proceso del modo scale-out avance solo las de sus chats.
+
+    Un movimiento no guardado se recupera al reiniciar si queda después de la
+    marca guardada de su usuario; si no (importaciones con fechas pasadas o un
+    usuario nuevo), se guarda el snapshot en el momento. Las consultas son en
+    memoria y O(palabras).
+    """
+
+    def __init__(self, ledger_repository: LedgerRepository):
+        self.ledger = ledger_repository
+        self._tokens: Dict[int, Dict[str, Dict[str, int]]] = {}
+        self._totals: Dict[int, Dict[str, int]] = {}
+        self._marks: Dict[int, Tuple[int, int, int]] = {}  # Último movimiento incluido por usuario
+        self._saved_marks: Dict[int, Tuple[int, int, int]] = {}  # Idem, ya persistido
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._pending: List[Gasto] = []  # Observados mientras se carga
+        self._dirty_users: Set[int] = set()
+        self._unsaved = 0
+
+    # === Carga y persistencia ===
+    def load(self):
+        """Carga el snapshot y recorre los movimientos posteriores (bloqueante)."""
+        after = None
+        scanned = 0
+        try:
+            snapshot = self.ledger.load_snapshot(SNAPSHOT_NAME) or {}
+            if snapshot.get("version") == SNAPSHOT_VERSION:
+                self._restore(snapshot)
+            # Los usuarios sin marca se guardaron al observarse: quedan después de la menor
+            after = min(self._saved_marks.values()) if self._saved_marks else None
+            for chunk in self.ledger.iter_ledger_chunks(5000, after):
+                with self._lock:
+                    for gasto in chunk:
+                        if not self._is_saved(gasto):
+                            self._observe(gasto)
+                scanned += len(chunk)
+        except Exception as e:
+            # Se sigue con lo cargado: el índice solo mejora sugerencias
+            logger.warning("No se pudo cargar el índice de categorías completo: %s", e)
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            for gasto in pending:
+                self._observe(gasto)
+            self._loaded = True
+        logger.info(
+            "Índice de categorías cargado: %s usuarios (%s movimientos recorridos%s)",
+            len(self._totals),
+            scanned,
+            ", desde snapshot" if after else "",
+        )
+        if scanned or pending:
+            self.save()
+
+    def _restore(self, snapshot: Dict[str, Any]):
+        for user_id, data in snapshot.get("users", {}).items():
+            if data.get("watermark"):
+                self._marks[int(user_id)] = self._saved_marks[int(user_id)] = tuple(data["watermark"])
+            self._totals[int(user_id)] = dict(data.get("totals", {}))
+            self._tokens[int(user_id)] = {token: dict(cats) for token, cats in data.get("tokens", {}).items()}
+
+    def _user_snapshot(self, user_id: int) -> Dict[str, Any]:
+        tokens = self._tokens.get(user_id, {})
+        if len(tokens) > MAX_TOKENS_PER_USER:
+            top = sorted(tokens, key=lambda t: sum(tokens[t].values()), reverse=True)[:MAX_TOKENS_PER_USER]
+            tokens = {token: tokens[token] for token in top}
+        mark = self._marks.get(user_id)
+        return {
+            "watermark": list(mark) if mark else None,
+            "totals": dict(self._totals.get(user_id, {})),
+            "tokens": {t: dict(c) for t, c in tokens.items()},
+        }
+
+    def save(self):
+        """
+        Persiste el snapshot.
+
+        Solo reemplaza los usuarios modificados en este proceso (con su marca),
+        así varios procesos (modo scale-out, chats particionados) no se pisan
+        entre sí.
+        """
+        with self._lock:
+            if not self._loaded or not self._dirty_users:
+                return
+            dirty = set(self._dirty_users)
+            users = {str(user_id): self._user_snapshot(user_id) for user_id in dirty}
+            marks = {user_id: self._marks[user_id] for user_id in dirty if user_id in self._marks}
+            self._dirty_users.clear()
+            self._unsaved = 0
+
+        def merge(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if not snapshot or snapshot.get("version") != SNAPSHOT_VERSION:
+                snapshot = {"version": SNAPSHOT_VERSION, "users": {}}
+            snapshot["users"].update(users)
+            return snapshot
+
+        try:
+            self.ledger.update_snapshot(SNAPSHOT_NAME, merge)
+        except Exception as e:
+            logger.warning("No se pudo guardar el índice de categorías: %s", e)
+            with self._lock:
+                self._dirty_users.update(dirty)
+            return
+        with self._lock:
+            self._saved_marks.update(marks)
+
+    def _is_saved(self, gasto: Gasto) -> bool:
+        """Si el gasto ya está incluido en el snapshot guardado (no cambia el índice)."""
+        mark = self._saved_marks.get(gasto.user_id)
+        return mark is not None and (int(gasto.ts), gasto.chat_id, gasto.message_id) <= mark
+
+    def _needs_save(self, gasto: Gasto) -> bool:
+        """Si un reinicio no encontraría el gasto: no queda después de la marca guardada."""
+        mark = self._saved_marks.get(gasto.user_id)
+        return mark is None or (int(gasto.ts), gasto.chat_id, gasto.message_id) <= mark
+
+    # === Actualización ===
+    def _observe(self, gasto: Gasto):
+        user_id = gasto.user_id
+        key = (int(gasto.ts), gasto.chat_id, gasto.message_id)
+        if user_id not in self._marks or key > self._marks[user_id]:
+            self._marks[user_id] = key
+            self._dirty_users.add(user_id)
+        if gasto.amount >= 0 or not gasto.category:
+            return  # Solo gastos con categoría
+
+        totals = self._totals.setdefault(user_id, {})
+        totals[gasto.category] = totals.get(gasto.category, 0) + 1
+
+        payee = gasto.payee if gasto.payee != settings.PAYEE_DEFAULT else ""
+        user_tokens = self._tokens.setdefault(user_id, {})
+        for token in tokenize(f"{gasto.description} {payee}"):
+            counts = user_tokens.setdefault(token, {})
+            counts[gasto.category] = counts.get(gasto.category, 0) + 1
+        self._dirty_users.add(user_id)
+
+    def _forget(self, gasto: Gasto):
+        if gasto.amount >= 0 or not gasto.category:
+            return
+        user_id = gasto.user_id
+
+        def decrement(counts: Dict[str, int]):
+            if counts.get(gasto.category, 0) > 1:
+                counts[gasto.category] -= 1
+            else:
+                counts.pop(gasto.category, None)
+
+        decrement(self._totals.setdefault(user_id, {}))
+        payee = gasto.payee if gasto.payee != settings.PAYEE_DEFAULT else ""
+        user_tokens = self._tokens.setdefault(user_id, {})
+        for token in tokenize(f"{gasto.description} {payee}"):
+            counts = user_tokens.get(token)
+            if counts is not None:
+                decrement(counts)
+                if not counts:
+                    del user_tokens[token]
+        self._dirty_users.add(user_id)
+
+    def forget(self, gasto: Gasto):
+        """Descuenta un gasto ya observado (deshecho o antes de observar su versión editada)."""
+        with self._lock:
+            if not self._loaded:
+                # Todavía no se recorrió el ledger: la carga ya no lo va a encontrar
+                if gasto in self._pending:
+                    self._pending.remove(gasto)
+                return
+            self._forget(gasto)
+            self._unsaved += 1
+
+    def observe(self, gasto: Gasto):
+        """Registra un gasto nuevo (persistiendo cada ``SNAPSHOT_EVERY`` o si no se recuperaría)."""
+        self.observe_many([gasto])
+
+    def observe_many(self, gastos: Iterable[Gasto]):
+        with self._lock:
+            if not self._loaded:
+                self._pending.extend(gastos)
+                return
+            count = 0
+            urgent = False
+            for gasto in gastos:
+                urgent = urgent or self._needs_save(gasto)
+                self._observe(gasto)
+                count += 1
+            self._unsaved += count
+            should_save = urgent or self._unsaved >= SNAPSHOT_EVERY
+        if should_save:
+            self.save()
+
+    # === Consultas ===
+    def rank_categories(self, user_id: int, categories: List[str]) -> List[str]:
+        """Categorías ordenadas por uso del usuario (las no usadas conservan su orden)."""
+        with self._lock:
+            totals = dict(self._totals.get(user_id, {}))
+        return sorted(categories, key=lambda category: -totals.get(category, 0))
+
+    def suggest(self, user_id: int, text: str, categories: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Categoría más probable para una descripción, o None si no hay confianza.
+
+        Cada palabra vota por sus categorías en proporción a su historial.
+        """
+        scores: Dict[str, float] = {}
+        with self._lock:
+            user_tokens = self._tokens.get(user_id, {})
+            for token in tokenize(text):
+                counts = user_tokens.get(token)
+                if not counts:
+                    continue
+                total = sum(counts.values())
+                for category, count in counts.items():
+                    scores[category] = scores.get(category, 0.0) + count / total
+
+        allowed = set(categories) if categories is not None else None
+        ranked = sorted(
+            ((score, category) for category, score in scores.items() if allowed is None or category in allowed),
+            reverse=True,
+        )
+        if not ranked or ranked[0][0] < MIN_SCORE:
+            return None
+        return ranked[0][1]
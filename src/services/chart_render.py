@@ -0,0 +1,91 @@
+"""
+Render de gráficos a PNG (corre en los procesos del pool de ``ChartService``).
+
+Este módulo no importa nada del bot: los workers se crean con ``spawn`` y
+solo cargan esto y matplotlib (backend Agg, sin display). Los datos llegan
+como columnas compactas (tuplas y ``array``), no como listas de ``Gasto``.
+"""
+import io
+from array import array
+from typing import Sequence
+
+# Categorías con línea propia en el acumulado (el resto va en "Otras")
+TOP_CATEGORIES = 5
+
+
+def _pyplot():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def _to_png(fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=120, bbox_inches="tight")
+    fig.clear()
+    return buffer.getvalue()
+
+
+def render_category_bars(title: str, currency: str, labels: Sequence[str], values: array) -> bytes:
+    """Barras horizontales de gasto por categoría (``labels`` y ``values`` alineados, de mayor a menor)."""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(7, 0.5 * len(labels) + 1.5))
+    try:
+        positions = range(len(labels))
+        bars = ax.barh(positions, values, color="#4c72b0")
+        ax.set_yticks(positions, labels)
+        ax.invert_yaxis()
+        ax.bar_label(bars, labels=[f"{value:,}".replace(",", ".") for value in values], padding=3, fontsize=8)
+        ax.set_title(title)
+        ax.set_xlabel(currency)
+        ax.margins(x=0.15)
+        ax.spines[["top", "right"]].set_visible(False)
+        return _to_png(fig)
+    finally:
+        plt.close(fig)
+
+
+def render_cumulative(
+    title: str, currency: str, days_in_month: int, categories: Sequence[str], days: array, category_ids: array, amounts: array
+) -> bytes:
+    """
+    Gasto acumulado por día del mes: total y una línea por categoría principal.
+
+    Args:
+        categories: Nombres de categoría (``category_ids`` indexa acá)
+        days, category_ids, amounts: Una fila por gasto (día 1-31, categoría, monto positivo)
+    """
+    import numpy as np
+
+    plt = _pyplot()
+    day_index = np.frombuffer(days, dtype=np.uint16).astype(np.intp) - 1
+    category_index = np.frombuffer(category_ids, dtype=np.uint16).astype(np.intp)
+    values = np.frombuffer(amounts, dtype=np.int64)
+
+    per_category = np.zeros((len(categories), days_in_month), dtype=np.int64)
+    np.add.at(per_category, (category_index, day_index), values)
+    cumulative = per_category.cumsum(axis=1)
+    order = np.argsort(-cumulative[:, -1], kind="stable")
+    x = np.arange(1, days_in_month + 1)
+
+    fig, ax = plt.subplots(figsize=(8, 4.5))
+    try:
+        ax.plot(x, cumulative.sum(axis=0), color="black", linewidth=2.5, label="Total")
+        for i in order[:TOP_CATEGORIES]:
+            ax.plot(x, cumulative[i], linewidth=1.5, label=categories[i])
+        if len(order) > TOP_CATEGORIES:
+            ax.plot(x, cumulative[order[TOP_CATEGORIES:]].sum(axis=0), linewidth=1, linestyle="--", label="Otras")
+        ax.set_title(title)
+        ax.set_xlabel("Día")
+        ax.set_ylabel(currency)
+        ax.set_xlim(1, days_in_month)
+        ax.set_ylim(bottom=0)
+        ax.grid(alpha=0.3)
+        ax.legend(fontsize=8, loc="upper left")
+        ax.spines[["top", "right"]].set_visible(False)
+        return _to_png(fig)
+    finally:
+        plt.close(fig)
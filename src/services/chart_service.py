@@ -0,0 +1,155 @@
+"""Gráficos de gastos (/grafico) renderizados en un pool de procesos."""
+import asyncio
+import calendar
+import importlib.util
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from src.config.settings import settings
+from src.repositories.ledger_repository import LedgerRepository
+from src.schemas import Gasto
+from src.services import chart_render
+from src.services.exchange_rates import ExchangeRateStore
+from src.utils.logger import setup_logger
+from src.utils.tracing import span
+
+logger = setup_logger(__name__)
+
+CHART_TYPES = ("categorias", "acumulado")
+
+
+class ChartBusyError(Exception):
+    """El usuario ya tiene el máximo de gráficos en curso."""
+
+
+class ChartService:
+    """
+    Arma los datos de un gráfico desde el ledger y lo renderiza en otro proceso.
+
+    Renderizar con matplotlib es CPU puro: en el event loop (o en threads,
+    por el GIL) frenaría el procesamiento de updates. Los PNG se generan en un
+    ``ProcessPoolExecutor`` propio (``CHART_WORKERS`` procesos, creado al
+    primer uso) y cada usuario puede tener a lo sumo ``CHART_MAX_PER_USER``
+    gráficos en curso.
+    """
+
+    def __init__(self, ledger_repository: LedgerRepository, exchange_rates: Optional[ExchangeRateStore] = None):
+        self.ledger = ledger_repository
+        self.rates = exchange_rates
+        self.max_workers = settings.CHART_WORKERS
+        self.max_per_user = settings.CHART_MAX_PER_USER
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[int, int] = {}
+        self.metrics: Dict[str, int] = {"rendered": 0, "rejected": 0, "failed": 0}
+
+    @staticmethod
+    def is_available() -> bool:
+        """Si matplotlib está instalado (dependencia opcional)."""
+        return importlib.util.find_spec("matplotlib") is not None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: los workers no heredan el event loop, threads ni conexiones del bot
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    # === Datos (columnas compactas para el worker) ===
+    def _month_expenses(self, chat_id: int, month: str) -> Tuple[str, List[Tuple[Gasto, int]]]:
+        """Gastos del mes del chat con su monto positivo en la moneda base (sin los que no tienen cotización)."""
+        gastos = [g for g in self.ledger.load_month(chat_id, month) if g.amount < 0]
+        if self.rates:
+            base = self.rates.base_currency
+            converted = self.rates.convert_gastos(gastos)
+        else:
+            base = settings.DEFAULT_CURRENCY
+            converted = [int(g.amount) if g.currency == base else None for g in gastos]
+        return base, [(g, -amount) for g, amount in zip(gastos, converted) if amount is not None]
+
+    def category_columns(self, chat_id: int, month: str) -> Optional[tuple]:
+        """Argumentos de ``render_category_bars``, o None si no hay gastos."""
+        base, expenses = self._month_expenses(chat_id, month)
+        totals: Dict[str, int] = {}
+        for gasto, amount in expenses:
+            category = gasto.category or "Varios"
+            totals[category] = totals.get(category, 0) + amount
+        if not totals:
+            return None
+        ranked = sorted(totals.items(), key=lambda item: -item[1])
+        labels = tuple(category for category, _ in ranked)
+        return f"Gastos por categoría · {month}", base, labels, array("q", (amount for _, amount in ranked))
+
+    def cumulative_columns(self, chat_id: int, month: str) -> Optional[tuple]:
+        """Argumentos de ``render_cumulative`` (una fila por gasto: día, categoría, monto), o None."""
+        base, expenses = self._month_expenses(chat_id, month)
+        if not expenses:
+            return None
+        year, month_number = (int(part) for part in month.split("-"))
+        categories: Dict[str, int] = {}
+        days, category_ids, amounts = array("H"), array("H"), array("q")
+        for gasto, amount in expenses:
+            days.append(int(gasto.date_iso[8:10]))
+            category_ids.append(categories.setdefault(gasto.category or "Varios", len(categories)))
+            amounts.append(amount)
+        return (
+            f"Gasto acumulado · {month}",
+            base,
+            calendar.monthrange(year, month_number)[1],
+            tuple(categories),
+            days,
+            category_ids,
+            amounts,
+        )
+
+    # === Render ===
+    async def render(self, user_id: int, chart_type: str, chat_id: int, month: str) -> Optional[bytes]:
+        """
+        PNG del gráfico pedido.
+
+        Returns:
+            None si no hay gastos para graficar
+
+        Raises:
+            ChartBusyError: Si el usuario ya tiene ``CHART_MAX_PER_USER`` gráficos en curso
+        """
+        if self._in_flight.get(user_id, 0) >= self.max_per_user:
+            self.metrics["rejected"] += 1
+            raise ChartBusyError()
+        self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+        try:
+            if chart_type == "acumulado":
+                func, build = chart_render.render_cumulative, self.cumulative_columns
+            else:
+                func, build = chart_render.render_category_bars, self.category_columns
+            args = await asyncio.to_thread(build, chat_id, month)
+            if args is None:
+                return None
+            with span(f"chart.{chart_type}"):
+                png = await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+            self.metrics["rendered"] += 1
+            return png
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. OOM): el próximo gráfico arranca un pool nuevo
+            self.metrics["failed"] += 1
+            self._executor = None
+            raise
+        except Exception:
+            self.metrics["failed"] += 1
+            raise
+        finally:
+            if self._in_flight[user_id] <= 1:
+                del self._in_flight[user_id]
+            else:
+                self._in_flight[user_id] -= 1
+
+    def close(self):
+        """Termina el pool de procesos sin esperar renders en curso."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Métricas de gráficos: %s", self.metrics)
@@ -0,0 +1,213 @@
+"""Cotizaciones fechadas y conversión de montos a la moneda base."""
+import bisect
+import csv
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.config.settings import settings
+from src.repositories.ledger_repository import LedgerRepository
+from src.schemas import Gasto
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SNAPSHOT_NAME = "exchange_rates"
+# Cada cuánto se relee el snapshot (otro proceso pudo cargar cotizaciones)
+RELOAD_SECONDS = 60
+_OPEN_END = "9999-12-31"
+
+
+class ExchangeRateStore:
+    """
+    Cotizaciones por moneda y fecha de vigencia, expresadas en la moneda base.
+
+    Una cotización (USD, 2026-10-01, 1450) vale desde esa fecha hasta la
+    siguiente cargada para la misma moneda. Se persisten como snapshot y se
+    cargan desde un CSV o con /cotizacion.
+
+    ``rate_for`` guarda por moneda el último intervalo consultado, así las
+    consultas consecutivas sobre el mismo período no vuelven a buscar;
+    ``convert_amounts`` convierte en lote recorriendo cada moneda ordenada por
+    fecha junto con sus intervalos, sin una búsqueda por fila.
+    """
+
+    def __init__(self, ledger_repository: LedgerRepository, base_currency: Optional[str] = None):
+        self.ledger = ledger_repository
+        self.base_currency = (base_currency or settings.BASE_CURRENCY).upper()
+        self._dates: Dict[str, List[str]] = {}
+        self._rates: Dict[str, List[float]] = {}
+        # Último intervalo consultado por moneda: (desde, hasta exclusivo, cotización)
+        self._interval_cache: Dict[str, Tuple[str, str, Optional[float]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    # === Carga y persistencia ===
+    def reload(self):
+        """Relee las cotizaciones del snapshot."""
+        snapshot = self.ledger.load_snapshot(SNAPSHOT_NAME) or {}
+        dates: Dict[str, List[str]] = {}
+        rates: Dict[str, List[float]] = {}
+        if snapshot.get("base", self.base_currency) != self.base_currency:
+            logger.warning(
+                "Las cotizaciones guardadas están en %s y la moneda base es %s: se ignoran",
+                snapshot.get("base"), self.base_currency,
+            )
+        else:
+            for currency, by_date in snapshot.get("rates", {}).items():
+                ordered = sorted(by_date.items())
+                dates[currency] = [date for date, _ in ordered]
+                rates[currency] = [float(rate) for _, rate in ordered]
+        with self._lock:
+            self._dates, self._rates = dates, rates
+            self._interval_cache = {}
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > RELOAD_SECONDS:
+            self.reload()
+
+    def set_rates(self, rows: Iterable[Tuple[str, str, float]]) -> int:
+        """
+        Guarda cotizaciones (moneda, fecha YYYY-MM-DD, valor en moneda base).
+
+        Returns:
+            Cantidad de cotizaciones guardadas
+
+        Raises:
+            ValueError: Si alguna fila es inválida
+        """
+        clean = []
+        for currency, date, rate in rows:
+            currency = currency.strip().upper()
+            date = date.strip()
+            if len(currency) != 3 or not currency.isalpha():
+                raise ValueError(f"Moneda inválida: {currency}")
+            if len(date) != 10 or date[4] != "-" or date[7] != "-":
+                raise ValueError(f"Fecha inválida (YYYY-MM-DD): {date}")
+            if float(rate) <= 0:
+                raise ValueError(f"Cotización inválida: {rate}")
+            if currency != self.base_currency:
+                clean.append((currency, date, float(rate)))
+
+        def mutate(snapshot):
+            if not snapshot or snapshot.get("base") != self.base_currency:
+                snapshot = {"base": self.base_currency, "rates": {}}
+            for currency, date, rate in clean:
+                snapshot["rates"].setdefault(currency, {})[date] = rate
+            return snapshot
+
+        if clean:
+            self.ledger.update_snapshot(SNAPSHOT_NAME, mutate)
+            self.reload()
+        return len(clean)
+
+    def set_rate(self, currency: str, date: str, rate: float):
+        self.set_rates([(currency, date, rate)])
+
+    def load_file(self, path: str) -> int:
+        """
+        Carga cotizaciones desde un CSV ``moneda,fecha,cotización`` (encabezado opcional).
+
+        Returns:
+            Cantidad de cotizaciones guardadas
+        """
+        rows = []
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for line_number, row in enumerate(csv.reader(f), 1):
+                if not row or not "".join(row).strip():
+                    continue
+                if len(row) < 3:
+                    raise ValueError(f"Línea {line_number}: se esperaban moneda,fecha,cotización")
+                try:
+                    rate = float(row[2].strip().replace(",", "."))
+                except ValueError:
+                    if line_number == 1:
+                        continue  # Encabezado
+                    raise ValueError(f"Línea {line_number}: cotización inválida {row[2]!r}")
+                rows.append((row[0], row[1], rate))
+        return self.set_rates(rows)
+
+    def latest_rates(self) -> Dict[str, Tuple[str, float]]:
+        """Última cotización de cada moneda: {moneda: (fecha, valor)}."""
+        self._ensure_loaded()
+        with self._lock:
+            return {currency: (dates[-1], self._rates[currency][-1]) for currency, dates in self._dates.items()}
+
+    # === Conversión ===
+    def rate_for(self, currency: str, date: str) -> Optional[float]:
+        """
+        Cotización vigente de ``currency`` en ``date`` (YYYY-MM-DD), o None si no hay.
+
+        La moneda base siempre vale 1.
+        """
+        currency = currency.upper()
+        if currency == self.base_currency:
+            return 1.0
+        self._ensure_loaded()
+        with self._lock:
+            cached = self._interval_cache.get(currency)
+            if cached and cached[0] <= date < cached[1]:
+                return cached[2]
+            dates = self._dates.get(currency)
+            if not dates:
+                return None
+            index = bisect.bisect_right(dates, date) - 1
+            if index < 0:
+                # Anterior a la primera cotización cargada
+                self._interval_cache[currency] = ("", dates[0], None)
+                return None
+            end = dates[index + 1] if index + 1 < len(dates) else _OPEN_END
+            rate = self._rates[currency][index]
+            self._interval_cache[currency] = (dates[index], end, rate)
+            return rate
+
+    def convert_amounts(
+        self,
+        amounts: Sequence[float],
+        currencies: Sequence[str],
+        dates: Sequence[str],
+    ) -> List[Optional[int]]:
+        """
+        Convierte montos a la moneda base en lote.
+
+        Agrupa por moneda, ordena cada grupo por fecha y avanza en paralelo por
+        los intervalos de cotización: O(n log n) en total, sin búsquedas por fila.
+
+        Returns:
+            Montos en moneda base (redondeados), alineados con la entrada;
+            None donde no hay cotización para esa fecha
+        """
+        self._ensure_loaded()
+        result: List[Optional[int]] = [None] * len(amounts)
+        by_currency: Dict[str, List[int]] = {}
+        for i, currency in enumerate(currencies):
+            by_currency.setdefault(currency.upper(), []).append(i)
+
+        with self._lock:
+            tables = {currency: (self._dates.get(currency), self._rates.get(currency)) for currency in by_currency}
+
+        for currency, indexes in by_currency.items():
+            if currency == self.base_currency:
+                for i in indexes:
+                    result[i] = int(round(amounts[i]))
+                continue
+            rate_dates, rates = tables[currency]
+            if not rate_dates:
+                continue
+            indexes.sort(key=dates.__getitem__)
+            current = -1
+            for i in indexes:
+                while current + 1 < len(rate_dates) and rate_dates[current + 1] <= dates[i]:
+                    current += 1
+                if current >= 0:
+                    result[i] = int(round(amounts[i] * rates[current]))
+        return result
+
+    def convert_gastos(self, gastos: Sequence[Gasto]) -> List[Optional[int]]:
+        """``convert_amounts`` sobre movimientos del ledger (fecha local de cada uno)."""
+        return self.convert_amounts(
+            [g.amount for g in gastos],
+            [g.currency for g in gastos],
+            [g.date_iso[:10] for g in gastos],
+        )
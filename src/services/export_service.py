@@ -1,8 +1,11 @@
 """Servicio para exportación de gastos a CSV."""
 import csv
+import io
 import os
-from typing import List
+from typing import List, Optional, Tuple
 from src.schemas import Gasto
+from src.services.exchange_rates import ExchangeRateStore
+from src.utils.local_time import local_date
 from src.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -10,38 +13,67 @@ logger = setup_logger(__name__)
 EXPORT_PATH = "data/import_actual.csv"
 
 
-def export_to_csv(gastos: List[Gasto]) -> int:
+def render_csv(gastos: List[Gasto], rates: Optional[ExchangeRateStore] = None) -> Tuple[str, int]:
     """
-    Exporta gastos a CSV compatible con Actual Budget.
+    Arma el CSV compatible con Actual Budget (sin escribirlo).
 
     Args:
         gastos: Lista de gastos a exportar
+        rates: Si se indica, los montos se exportan en la moneda base (el
+            original queda en las notas); los que no tienen cotización quedan
+            en su moneda
 
     Returns:
-        Número de gastos exportados
+        (contenido del CSV, número de gastos)
     """
     rows = []
+    converted = rates.convert_gastos(gastos) if rates else [None] * len(gastos)
+    unconverted = 0
 
-    for gasto in gastos:
-        # Extraer solo la fecha (YYYY-MM-DD)
-        date_str = gasto.date_iso.split(" ")[0] if " " in gasto.date_iso else gasto.date_iso
+    for gasto, amount in zip(gastos, converted):
+        notes = gasto.description
+        if rates and gasto.currency.upper() != rates.base_currency:
+            if amount is None:
+                unconverted += 1
+            else:
+                notes = f"{notes} [{gasto.amount} {gasto.currency}]".strip()
 
         rows.append({
-            "Date": date_str,
+            "Date": local_date(gasto.ts).isoformat(),
             "Payee": gasto.payee,
             "Category": gasto.category,
-            "Notes": gasto.description,
-            "Amount": str(gasto.amount)
+            "Notes": notes,
+            "Amount": str(amount if amount is not None else gasto.amount)
         })
 
+    if unconverted:
+        logger.warning("%s movimientos sin cotización quedaron en su moneda original", unconverted)
+
+    out = io.StringIO(newline="")
+    writer = csv.DictWriter(out, fieldnames=["Date", "Payee", "Category", "Notes", "Amount"])
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue(), len(rows)
+
+
+def write_export(content: str, count: int):
+    """Escribe un CSV ya armado en ``EXPORT_PATH``."""
     # Crear directorio si no existe
     os.makedirs(os.path.dirname(EXPORT_PATH), exist_ok=True)
 
-    # Escribir CSV
     with open(EXPORT_PATH, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["Date", "Payee", "Category", "Notes", "Amount"])
-        writer.writeheader()
-        writer.writerows(rows)
+        f.write(content)
+
+    logger.info("Exportados %s gastos a %s", count, EXPORT_PATH)
+
 
-    logger.info(f"Exportados {len(rows)} gastos a {EXPORT_PATH}")
-    return len(rows)
+def export_to_csv(gastos: List[Gasto], rates: Optional[ExchangeRateStore] = None) -> int:
+    """
+    Exporta gastos a CSV compatible con Actual Budget.
+
+    Returns:
+        Número de gastos exportados
+    """
+    content, count = render_csv(gastos, rates=rates)
+    write_export(content, count)
+    return count
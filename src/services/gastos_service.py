@@ -1,18 +1,42 @@
 """Servicio para gestión de gastos e ingresos."""
+import asyncio
+import os
 import re
-from datetime import datetime
-from dateutil import tz
+import shlex
+import tempfile
+import time
+from dataclasses import replace
 from typing import Optional, Tuple
 from src.config.settings import settings
 from src.schemas import TelegramMessage, Gasto, SessionDraft
 from src.repositories.ledger_repository import LedgerRepository
 from src.services.actual_budget_service import ActualBudgetService
+from src.services.backfill_service import BackfillService
+from src.services.budget_service import BudgetService
+from src.services.category_index import CategoryIndex
+from src.services.chart_service import CHART_TYPES, ChartBusyError, ChartService
+from src.services.exchange_rates import ExchangeRateStore
+from src.services.recent_entries import RecentEntries
+from src.services.recurring_service import RecurringService, describe_schedule, next_fire
+from src.services.report_cache import ALL, ReportCache
+from src.services.statement_import_service import StatementImportService
 from src.services.telegram_service import TelegramService
+from src.utils.local_time import format_local
 from src.utils.logger import setup_logger
+from src.utils import tracing
+from src.utils.tracing import trace_methods
 
 logger = setup_logger(__name__)
 
+# Límite de descarga de archivos de la Bot API
+MAX_DOCUMENT_SIZE = 20 * 1024 * 1024
 
+# Resultados por página de /buscar
+SEARCH_PAGE_SIZE = 10
+MORE_RESULTS_BUTTON = "🔎 Más resultados"
+
+
+@trace_methods("handler", lambda name: name.startswith(("handle_", "process_wizard_")))
 class GastosService:
     """Servicio para la lógica de negocio de gastos."""
 
@@ -21,10 +45,34 @@ class GastosService:
         telegram_service: TelegramService,
         ledger_repository: LedgerRepository,
         actual_budget_service: ActualBudgetService = None,
+        backfill_service: BackfillService = None,
+        statement_import_service: StatementImportService = None,
+        category_index: CategoryIndex = None,
+        budget_service: BudgetService = None,
+        recurring_service: RecurringService = None,
+        exchange_rates: ExchangeRateStore = None,
+        recent_entries: RecentEntries = None,
+        report_cache: ReportCache = None,
+        chart_service: ChartService = None,
     ):
         self.telegram = telegram_service
         self.ledger = ledger_repository
         self.actual_budget = actual_budget_service
+        self.backfill = backfill_service
+        self.statement_import = statement_import_service
+        self.category_index = category_index
+        self.budgets = budget_service
+        self.recurring = recurring_service
+        self.rates = exchange_rates
+        self.recent = recent_entries or RecentEntries()
+        self.reports = report_cache or ReportCache(settings.REPORT_CACHE_BYTES)
+        self.charts = chart_service
+        self._background_tasks = set()
+        self._importing_chats = set()
+        # Última búsqueda por chat: (texto, clave del último resultado mostrado)
+        self._search_cursors = {}
+        # Último /deshacer aplicado por (chat, usuario): un reenvío no deshace otro movimiento
+        self._last_undo = {}
 
     async def sync_with_actual_budget(self, gasto: Gasto, account_id: str = None):
         """Sincroniza el gasto con Actual Budget si hay configuración."""
@@ -32,7 +80,7 @@ class GastosService:
             logger.warning("ActualBudgetService no está inicializado, omitiendo sincronización")
             return
 
-        logger.info(f"Iniciando sincronización con Actual Budget (account_id={account_id})")
+        logger.info("Iniciando sincronización con Actual Budget (account_id=%s)", account_id)
         try:
             await self.actual_budget.create_transaction(gasto, account_id=account_id)
             logger.info("Sincronización completada exitosamente")
@@ -58,6 +106,50 @@ class GastosService:
             raise ValueError("Monto inválido")
         return int(s)
 
+    def rank_categories(self, user_id: int) -> list:
+        """Categorías configuradas, primero las que más usa el usuario."""
+        if not self.category_index:
+            return list(settings.CATEGORIES)
+        return self.category_index.rank_categories(user_id, settings.CATEGORIES)
+
+    def suggest_category(self, user_id: int, description: str) -> Optional[str]:
+        """Categoría sugerida para una descripción según el historial del usuario."""
+        if not self.category_index or not description:
+            return None
+        return self.category_index.suggest(user_id, description, settings.CATEGORIES)
+
+    def parse_quick_entry(self, text: str, with_category: bool = True) -> Optional[dict]:
+        """
+        Interpreta una carga rápida: "/gasto 2500 [ARS] [Categoría] [descripción]".
+
+        Returns:
+            Draft con amount, currency, category (None si no se indicó) y description;
+            None si no hay un monto válido
+        """
+        try:
+            args = shlex.split(text)[1:]
+        except ValueError:  # Comillas sin cerrar
+            args = text.split()[1:]
+        if not args:
+            return None
+        try:
+            amount = abs(self.normalize_amount(args.pop(0)))
+        except ValueError:
+            return None
+
+        currency = settings.DEFAULT_CURRENCY
+        if args and len(args[0]) == 3 and args[0].isalpha() and (
+            args[0].isupper() or args[0].upper() in (settings.DEFAULT_CURRENCY, "USD", "EUR")
+        ):
+            currency = args.pop(0).upper()
+
+        category = None
+        categories_by_name = {cat.lower(): cat for cat in settings.CATEGORIES}
+        if with_category and args and args[0].lower() in categories_by_name:
+            category = categories_by_name[args.pop(0).lower()]
+
+        return {"amount": amount, "currency": currency, "category": category, "description": " ".join(args)}
+
     def to_local_datetime(self, unix_ts: int) -> str:
         """
         Convierte timestamp unix a fecha/hora local.
@@ -68,9 +160,73 @@ class GastosService:
         Returns:
             Fecha en formato "YYYY-MM-DD HH:MM"
         """
-        tzinfo = tz.gettz(settings.TIMEZONE)
-        dt = datetime.fromtimestamp(unix_ts, tz.UTC).astimezone(tzinfo)
-        return dt.strftime("%Y-%m-%d %H:%M")
+        return format_local(unix_ts)
+
+    @staticmethod
+    def _draft_summary(draft: dict) -> str:
+        """Encabezado del mensaje del wizard inline con lo cargado hasta el momento."""
+        lines = ["💸 Nuevo Gasto" if draft.get("type", "expense") == "expense" else "💰 Nuevo Ingreso"]
+        if "amount" in draft:
+            lines.append(f"💰 {draft['amount']} {draft.get('currency', '')}".rstrip())
+        if draft.get("category"):
+            lines.append(f"📂 {draft['category']}")
+        if draft.get("description"):
+            lines.append(f"📝 {draft['description']}")
+        return "\n".join(lines) + "\n\n"
+
+    async def _wizard_prompt(
+        self,
+        message: TelegramMessage,
+        draft: dict,
+        stage: str,
+        text: str,
+        options: Optional[list] = None,
+        inline_text: Optional[str] = None,
+        skippable: bool = False,
+    ):
+        """
+        Muestra un paso del wizard.
+
+        Por defecto envía un mensaje nuevo con teclado de respuesta. Con
+        ``INLINE_WIZARD`` edita el mensaje del wizard (``draft["wizard_message_id"]``)
+        con el resumen del draft y botones inline cuyo callback_data es
+        ``wiz:<stage>:<índice>``; las opciones quedan en el draft para
+        resolver el índice al recibir el callback.
+
+        Args:
+            text: Texto del paso en modo teclado de respuesta
+            options: Valores a ofrecer como botones
+            inline_text: Texto del paso en modo inline (por defecto ``text``)
+            skippable: Agrega un botón "Omitir" (equivale a /omitir)
+        """
+        chat_id = message.chat.chat_id
+        if not settings.INLINE_WIZARD:
+            reply_markup = self.telegram.make_keyboard_buttons(options) if options else None
+            await self.telegram.send_message(chat_id, text, reply_markup=reply_markup)
+            return
+
+        values = list(options or [])
+        labels = list(values)
+        if skippable:
+            values.append("/omitir")
+            labels.append("⏭️ Omitir")
+        draft["wizard_options"] = values
+        reply_markup = None
+        if values:
+            reply_markup = self.telegram.make_inline_keyboard(
+                [(label, f"wiz:{stage}:{i}") for i, label in enumerate(labels)]
+            )
+
+        full_text = self._draft_summary(draft) + (inline_text or text)
+        wizard_message_id = draft.get("wizard_message_id")
+        if wizard_message_id and await self.telegram.edit_message_text(
+            chat_id, wizard_message_id, full_text, reply_markup=reply_markup
+        ):
+            return
+        # Primer paso, o el mensaje ya no se puede editar: se envía uno nuevo
+        draft["wizard_message_id"] = await self.telegram.send_message_returning_id(
+            chat_id, full_text, reply_markup=reply_markup
+        )
 
     async def process_wizard_amount(
         self,
@@ -83,24 +239,25 @@ class GastosService:
         Returns:
             (next_stage, updated_draft)
         """
+        draft = session.get("draft", {})
         try:
             amount = self.normalize_amount(message.text)
         except ValueError:
-            await self.telegram.send_message(
-                message.chat.chat_id,
+            await self._wizard_prompt(
+                message, draft, "amount",
                 "❌ Monto inválido. Solo números, por favor.\n\nEjemplo: 2500"
             )
-            return ("amount", session.get("draft"))
+            return ("amount", draft)
 
         # Actualizar draft
-        draft = session.get("draft", {})
         draft["amount"] = abs(amount)
 
         # Mostrar botones de moneda
-        await self.telegram.send_message(
-            message.chat.chat_id,
+        await self._wizard_prompt(
+            message, draft, "currency",
             f"💵 ¿En qué moneda?\n\n(Por defecto: {settings.DEFAULT_CURRENCY})",
-            reply_markup=self.telegram.make_keyboard_buttons([settings.DEFAULT_CURRENCY, "USD", "EUR"])
+            options=[settings.DEFAULT_CURRENCY, "USD", "EUR"],
+            inline_text="💵 ¿En qué moneda?"
         )
 
         return ("currency", draft)
@@ -128,17 +285,19 @@ class GastosService:
 
         # Si es un ingreso, saltar categoría e ir directo a descripción
         if draft.get("type") == "income":
-            await self.telegram.send_message(
-                message.chat.chat_id,
-                "📝 Descripción del ingreso (opcional)\n\nEscribí el texto o enviá /omitir"
+            await self._wizard_prompt(
+                message, draft, "description",
+                "📝 Descripción del ingreso (opcional)\n\nEscribí el texto o enviá /omitir",
+                inline_text="📝 Descripción (opcional): escribila o tocá Omitir",
+                skippable=True
             )
             return ("description", draft)
 
         # Para gastos, mostrar botones de categorías
-        await self.telegram.send_message(
-            message.chat.chat_id,
+        await self._wizard_prompt(
+            message, draft, "category",
             "📂 Elegí la categoría:",
-            reply_markup=self.telegram.make_keyboard_buttons(settings.CATEGORIES)
+            options=self.rank_categories(message.user.user_id)
         )
 
         return ("category", draft)
@@ -155,23 +314,26 @@ class GastosService:
             (next_stage, updated_draft)
         """
         category = message.text.strip()
+        draft = session.get("draft", {})
 
         # Validar categoría
         if category not in settings.CATEGORIES:
-            await self.telegram.send_message(
-                message.chat.chat_id,
-                "❌ Categoría inválida. Elegí una del teclado:"
+            await self._wizard_prompt(
+                message, draft, "category",
+                "❌ Categoría inválida. Elegí una del teclado:",
+                options=self.rank_categories(message.user.user_id) if settings.INLINE_WIZARD else None
             )
-            return ("category", session.get("draft"))
+            return ("category", draft)
 
         # Actualizar draft
-        draft = session.get("draft", {})
         draft["category"] = category
 
         # Pedir descripción
-        await self.telegram.send_message(
-            message.chat.chat_id,
-            "📝 Descripción del gasto (opcional)\n\nEscribí el texto o enviá /omitir"
+        await self._wizard_prompt(
+            message, draft, "description",
+            "📝 Descripción del gasto (opcional)\n\nEscribí el texto o enviá /omitir",
+            inline_text="📝 Descripción (opcional): escribila o tocá Omitir",
+            skippable=True
         )
 
         return ("description", draft)
@@ -198,11 +360,10 @@ class GastosService:
         # Si hay cuentas configuradas, preguntar en cuál registrar
         accounts = settings.ACTUAL_BUDGET_ACCOUNTS
         if accounts:
-            account_names = list(accounts.keys())
-            await self.telegram.send_message(
-                message.chat.chat_id,
+            await self._wizard_prompt(
+                message, draft, "account",
                 "🏦 ¿En qué cuenta registrar?",
-                reply_markup=self.telegram.make_keyboard_buttons(account_names)
+                options=list(accounts.keys())
             )
             return ("account", draft)
 
@@ -221,18 +382,19 @@ class GastosService:
             (None, None) - Finaliza el wizard
         """
         account_name = message.text.strip()
+        draft = session.get("draft", {})
 
         # Validar que la cuenta exista
         accounts = settings.ACTUAL_BUDGET_ACCOUNTS
         if account_name not in accounts:
-            await self.telegram.send_message(
-                message.chat.chat_id,
-                "❌ Cuenta inválida. Elegí una del teclado:"
+            await self._wizard_prompt(
+                message, draft, "account",
+                "❌ Cuenta inválida. Elegí una del teclado:",
+                options=list(accounts.keys()) if settings.INLINE_WIZARD else None
             )
-            return ("account", session.get("draft"))
+            return ("account", draft)
 
         # Actualizar draft con la cuenta seleccionada
-        draft = session.get("draft", {})
         draft["account_name"] = account_name
         draft["account_id"] = accounts[account_name]
 
@@ -280,9 +442,13 @@ class GastosService:
         )
 
         # Guardar en ledger
-        was_created = self.ledger.append_gasto(gasto)
+        was_created = await self.ledger.append_gasto_async(gasto)
 
         if was_created:
+            self.recent.push(gasto)
+            self.reports.invalidate_gastos([gasto])
+            if self.category_index:
+                self.category_index.observe(gasto)
             # Sincronizar con Actual Budget pasando el account_id si fue seleccionado
             account_id = draft.get("account_id")
             await self.sync_with_actual_budget(gasto, account_id=account_id)
@@ -292,27 +458,50 @@ class GastosService:
         if draft.get("account_name"):
             account_info = f"🏦 {draft['account_name']}\n"
 
-        # Confirmar al usuario
-        await self.telegram.send_message(
-            message.chat.chat_id,
+        # Confirmar al usuario (en modo inline, en el mismo mensaje del wizard)
+        confirmation = (
             f"✅ {'Gasto' if gasto_type == 'expense' else 'Ingreso'} registrado!\n\n"
             f"💰 {abs(amount)} {gasto.currency}\n"
-            f"📂 {gasto.category}\n"
+            f"📂 {gasto.category}{' (sugerida)' if draft.get('category_suggested') else ''}\n"
             f"{account_info}"
             f"📝 {gasto.description if gasto.description else 'Sin descripción'}\n\n"
-            f"Podés seguir registrando desde el menú.",
-            reply_markup=self.telegram.make_main_menu()
+            f"Podés seguir registrando desde el menú."
         )
+        wizard_message_id = draft.get("wizard_message_id")
+        if not (wizard_message_id and await self.telegram.edit_message_text(
+            message.chat.chat_id, wizard_message_id, confirmation
+        )):
+            await self.telegram.send_message(
+                message.chat.chat_id,
+                confirmation,
+                reply_markup=self.telegram.make_main_menu()
+            )
+
+        # También en redeliveries: recupera un corte entre el ledger y el acumulador (que descarta lo ya sumado)
+        await self._check_budget(gasto, created=was_created)
 
         return (None, None)
 
+    async def _check_budget(self, gasto: Gasto, created: bool = True):
+        """Suma el gasto al presupuesto de su categoría y avisa si cruzó el 80% o el 100%."""
+        if not self.budgets:
+            return
+        try:
+            alerts = await asyncio.to_thread(self.budgets.record_expense, gasto, created)
+        except Exception as e:
+            logger.warning("No se pudo actualizar el presupuesto de %s: %s", gasto.category, e)
+            return
+        for alert in alerts:
+            await self.telegram.send_message(gasto.chat_id, BudgetService.format_alert(alert))
+
     async def handle_button_nuevo_gasto(self, message: TelegramMessage) -> Tuple[str, dict]:
         """Maneja el botón 'Nuevo Gasto'."""
         draft = {"type": "expense"}
 
-        await self.telegram.send_message(
-            message.chat.chat_id,
-            "💸 Nuevo Gasto\n\n¿Cuál es el monto?\n\nEjemplo: 2500"
+        await self._wizard_prompt(
+            message, draft, "amount",
+            "💸 Nuevo Gasto\n\n¿Cuál es el monto?\n\nEjemplo: 2500",
+            inline_text="¿Cuál es el monto?\n\nEjemplo: 2500"
         )
 
         return ("amount", draft)
@@ -321,13 +510,449 @@ class GastosService:
         """Maneja el botón 'Nuevo Ingreso'."""
         draft = {"type": "income"}
 
-        await self.telegram.send_message(
-            message.chat.chat_id,
-            "💰 Nuevo Ingreso\n\n¿Cuál es el monto?\n\nEjemplo: 50000"
+        await self._wizard_prompt(
+            message, draft, "amount",
+            "💰 Nuevo Ingreso\n\n¿Cuál es el monto?\n\nEjemplo: 50000",
+            inline_text="¿Cuál es el monto?\n\nEjemplo: 50000"
         )
 
         return ("amount", draft)
 
+    async def handle_command_gasto(self, message: TelegramMessage) -> Tuple[Optional[str], Optional[dict]]:
+        """
+        Maneja /gasto: sin argumentos inicia el wizard, con argumentos guarda directo.
+
+        Si no se indica categoría, se completa según la descripción.
+        """
+        if message.text.strip() == "/gasto":
+            return await self.handle_button_nuevo_gasto(message)
+
+        draft = self.parse_quick_entry(message.text)
+        if draft is None:
+            await self.telegram.send_message(
+                message.chat.chat_id,
+                "❌ Formato: /gasto 2500 [ARS] [Categoría] [descripción]\n\nEjemplo: /gasto 2500 Comida empanadas"
+            )
+            return (None, None)
+
+        draft["type"] = "expense"
+        if not draft["category"]:
+            suggested = self.suggest_category(message.user.user_id, draft["description"])
+            draft["category"] = suggested or "Varios"
+            draft["category_suggested"] = suggested is not None
+        return await self._save_gasto_from_draft(message, draft)
+
+    async def handle_command_ingreso(self, message: TelegramMessage) -> Tuple[Optional[str], Optional[dict]]:
+        """Maneja /ingreso: sin argumentos inicia el wizard, con argumentos guarda directo."""
+        if message.text.strip() == "/ingreso":
+            return await self.handle_button_nuevo_ingreso(message)
+
+        draft = self.parse_quick_entry(message.text, with_category=False)
+        if draft is None:
+            await self.telegram.send_message(
+                message.chat.chat_id,
+                "❌ Formato: /ingreso 50000 [ARS] [descripción]\n\nEjemplo: /ingreso 50000 Sueldo"
+            )
+            return (None, None)
+
+        draft["type"] = "income"
+        draft["category"] = ""
+        return await self._save_gasto_from_draft(message, draft)
+
+    async def handle_command_presupuesto(self, message: TelegramMessage):
+        """
+        Maneja /presupuesto.
+
+        - /presupuesto: uso del mes de cada presupuesto
+        - /presupuesto Comida 50000 [ARS]: define el presupuesto mensual de la categoría
+        - /presupuesto Comida 0: lo elimina
+        """
+        chat_id = message.chat.chat_id
+        user_id = message.user.user_id
+        month = self.to_local_datetime(message.date)[:7]
+        if not self.budgets:
+            await self.telegram.send_message(chat_id, "❌ Los presupuestos no están disponibles.")
+            return
+
+        try:
+            args = shlex.split(message.text)[1:]
+        except ValueError:
+            args = message.text.split()[1:]
+
+        if not args:
+            status = await asyncio.to_thread(self.budgets.get_status, user_id, month)
+            if not status:
+                await self.telegram.send_message(
+                    chat_id,
+                    "📊 No tenés presupuestos definidos.\n\n"
+                    "Uso: /presupuesto <Categoría> <monto> [moneda]\n"
+                    "Ejemplo: /presupuesto Comida 50000"
+                )
+                return
+            lines = [f"📊 Presupuestos de {month}:\n"]
+            for item in status:
+                icon = "🚨" if item["percent"] >= 100 else "⚠️" if item["percent"] >= 80 else "✅"
+                lines.append(
+                    f"{icon} {item['category']}: {item['spent']} / {item['limit']} {item['currency']} "
+                    f"({item['percent']}%)"
+                )
+            await self.telegram.send_message(chat_id, "\n".join(lines))
+            return
+
+        categories_by_name = {cat.lower(): cat for cat in settings.CATEGORIES}
+        category = categories_by_name.get(args[0].lower())
+        amount = None
+        if len(args) in (2, 3):
+            try:
+                amount = abs(self.normalize_amount(args[1]))
+            except ValueError:
+                pass
+        if category is None or amount is None:
+            await self.telegram.send_message(
+                chat_id,
+                "❌ Formato: /presupuesto <Categoría> <monto> [moneda]\n\n"
+                "Ejemplo: /presupuesto Comida 50000\n"
+                "Con monto 0 se elimina el presupuesto."
+            )
+            return
+
+        if amount == 0:
+            removed = await asyncio.to_thread(self.budgets.remove_limit, user_id, category)
+            text = f"🗑️ Presupuesto de {category} eliminado." if removed else f"ℹ️ {category} no tenía presupuesto."
+            await self.telegram.send_message(chat_id, text)
+            return
+
+        currency = args[2].upper() if len(args) == 3 else settings.DEFAULT_CURRENCY
+        item = await asyncio.to_thread(
+            self.budgets.set_limit, user_id, category, amount, currency, month, message.date
+        )
+        await self.telegram.send_message(
+            chat_id,
+            f"✅ Presupuesto mensual de {category}: {item['limit']} {item['currency']}\n\n"
+            f"💰 Usado en {month}: {item['spent']} ({item['percent']}%)\n"
+            f"Te aviso al llegar al 80% y al 100%."
+        )
+
+    async def handle_command_recurrente(self, message: TelegramMessage):
+        """
+        Maneja /recurrente.
+
+        - /recurrente: lista las reglas del usuario
+        - /recurrente <día|"cron"> <gasto|ingreso> <monto> [moneda] [Categoría] [descripción]: crea una regla
+        - /recurrente borrar <id>: elimina una regla
+        """
+        chat_id = message.chat.chat_id
+        user_id = message.user.user_id
+        usage = (
+            "❌ Formato: /recurrente <día|\"cron\"> <gasto|ingreso> <monto> [moneda] [Categoría] [descripción]\n\n"
+            "Ejemplos:\n"
+            "/recurrente 5 gasto 150000 Vivienda Alquiler\n"
+            "/recurrente \"0 9 * * 1\" gasto 3000 Comida Verdulería\n"
+            "/recurrente 1 ingreso 900000 Sueldo\n"
+            "/recurrente borrar 3"
+        )
+        if not self.recurring:
+            await self.telegram.send_message(chat_id, "❌ Los movimientos recurrentes no están disponibles.")
+            return
+
+        try:
+            args = shlex.split(message.text)[1:]
+        except ValueError:
+            args = message.text.split()[1:]
+
+        if not args:
+            rules = await asyncio.to_thread(self.recurring.list_rules, user_id)
+            if not rules:
+                await self.telegram.send_message(chat_id, "🔁 No tenés movimientos recurrentes.\n\n" + usage[2:])
+                return
+            lines = ["🔁 Movimientos recurrentes:\n"]
+            for rule in rules:
+                next_text = self.to_local_datetime(rule["next_ts"]) if rule["next_ts"] else "sin próxima fecha"
+                lines.append(
+                    f"#{rule['id']} {rule['amount']} {rule['currency']}"
+                    f"{'  📂 ' + rule['category'] if rule['category'] else ''}"
+                    f"{'  📝 ' + rule['description'] if rule['description'] else ''}\n"
+                    f"    📅 {describe_schedule(rule['schedule'])} · próximo: {next_text}"
+                )
+            await self.telegram.send_message(chat_id, "\n".join(lines))
+            return
+
+        if args[0].lower() == "borrar":
+            if len(args) != 2 or not args[1].lstrip("#").isdigit():
+                await self.telegram.send_message(chat_id, usage)
+                return
+            removed = await asyncio.to_thread(self.recurring.remove_rule, user_id, int(args[1].lstrip("#")))
+            text = f"🗑️ Regla #{args[1].lstrip('#')} eliminada." if removed else "❌ No encontré esa regla."
+            await self.telegram.send_message(chat_id, text)
+            return
+
+        if len(args) < 3 or args[1].lower() not in ("gasto", "ingreso"):
+            await self.telegram.send_message(chat_id, usage)
+            return
+        schedule = {"day": int(args[0])} if args[0].isdigit() else {"cron": args[0]}
+        is_expense = args[1].lower() == "gasto"
+        draft = self.parse_quick_entry("/recurrente " + shlex.join(args[2:]), with_category=is_expense)
+        if draft is None:
+            await self.telegram.send_message(chat_id, usage)
+            return
+        if is_expense and not draft["category"]:
+            draft["category"] = self.suggest_category(user_id, draft["description"]) or "Varios"
+
+        try:
+            rule = await asyncio.to_thread(
+                self.recurring.add_rule,
+                user_id,
+                chat_id,
+                schedule,
+                -draft["amount"] if is_expense else draft["amount"],
+                draft["currency"],
+                draft["category"] if is_expense else "",
+                draft["description"],
+                message.date,
+            )
+        except ValueError as e:
+            await self.telegram.send_message(chat_id, f"❌ {e}")
+            return
+
+        next_ts = next_fire(rule["schedule"], rule["last_ts"])
+        await self.telegram.send_message(
+            chat_id,
+            f"🔁 Regla #{rule['id']} creada: {'gasto' if is_expense else 'ingreso'} de {draft['amount']} "
+            f"{rule['currency']}{' en ' + rule['category'] if rule['category'] else ''}\n\n"
+            f"📅 {describe_schedule(schedule)}\n"
+            f"⏭️ Próximo: {self.to_local_datetime(next_ts) if next_ts else 'sin próxima fecha'}"
+        )
+
+    async def handle_recurring_gastos(self, gastos: list, catch_up: bool):
+        """Avisa de los movimientos recurrentes registrados y actualiza índice y presupuestos."""
+        self.reports.invalidate_gastos(gastos)
+        if self.category_index:
+            self.category_index.observe_many(gastos)
+        for gasto in gastos:
+            self.recent.push(gasto)
+            await self._check_budget(gasto)
+            if not catch_up:
+                await self.sync_with_actual_budget(gasto)
+
+        by_chat = {}
+        for gasto in gastos:
+            by_chat.setdefault(gasto.chat_id, []).append(gasto)
+        for chat_id, chat_gastos in by_chat.items():
+            if catch_up:
+                lines = [f"🔁 Registré {len(chat_gastos)} movimientos recurrentes pendientes:\n"]
+            else:
+                lines = ["🔁 Movimiento recurrente registrado:\n"]
+            for gasto in chat_gastos[:20]:
+                lines.append(
+                    f"📅 {gasto.date_iso.split(' ')[0]}  {gasto.amount} {gasto.currency}"
+                    f"{'  📂 ' + gasto.category if gasto.category else ''}"
+                    f"{'  📝 ' + gasto.description if gasto.description else ''}"
+                )
+            if len(chat_gastos) > 20:
+                lines.append(f"… y {len(chat_gastos) - 20} más")
+            if catch_up and self.actual_budget:
+                lines.append("\nUsá /backfill para enviarlos a Actual Budget.")
+            try:
+                await self.telegram.send_message(chat_id, "\n".join(lines))
+            except Exception as e:
+                logger.warning("No se pudo avisar del movimiento recurrente a chat_id=%s: %s", chat_id, e)
+
+    def _recent_entry(self, message: TelegramMessage, args: list) -> Tuple[Optional[Gasto], list]:
+        """Movimiento reciente elegido con un número opcional al principio (1 = el último)."""
+        position = 1
+        if args and args[0].lstrip("#").isdigit():
+            position = int(args.pop(0).lstrip("#"))
+        recent = self.recent.recent(message.chat.chat_id, message.user.user_id)
+        if 1 <= position <= len(recent):
+            return recent[position - 1], args
+        return None, args
+
+    @staticmethod
+    def _describe_entry(gasto: Gasto) -> str:
+        return (
+            f"{gasto.date_iso[:16]}  {abs(gasto.amount)} {gasto.currency}"
+            f"{'  📂 ' + gasto.category if gasto.category else ''}"
+            f"{'  📝 ' + gasto.description if gasto.description else ''}"
+        )
+
+    async def _apply_correction(self, old: Gasto, new: Optional[Gasto]):
+        """Replica una edición (o el borrado si ``new`` es None) en reportes, índice, presupuestos y Actual."""
+        self.reports.invalidate_gastos([old] if new is None else [old, new])
+        if self.category_index:
+            self.category_index.forget(old)
+            if new is not None:
+                self.category_index.observe(new)
+        if self.budgets:
+            try:
+                alerts = await asyncio.to_thread(self.budgets.replace_expense, old, new)
+            except Exception as e:
+                logger.warning("No se pudo ajustar el presupuesto de %s: %s", old.category, e)
+                alerts = []
+            for alert in alerts:
+                await self.telegram.send_message(old.chat_id, BudgetService.format_alert(alert))
+        if self.actual_budget:
+            if new is None:
+                await self.actual_budget.delete_transaction(old)
+            else:
+                await self.actual_budget.update_transaction(new)
+
+    async def handle_command_deshacer(self, message: TelegramMessage):
+        """Maneja /deshacer [n]: elimina el último movimiento cargado (o el n-ésimo más reciente)."""
+        chat_id = message.chat.chat_id
+        undo_key = (chat_id, message.user.user_id)
+        if self._last_undo.get(undo_key) == message.message_id:
+            return  # Reenvío del mismo /deshacer
+        gasto, args = self._recent_entry(message, message.text.split()[1:])
+        if gasto is None or args:
+            await self.telegram.send_message(
+                chat_id,
+                "ℹ️ No hay movimientos recientes para deshacer.\n\n"
+                "Solo se pueden deshacer los últimos cargados desde que arrancó el bot. Usá /editar para verlos."
+            )
+            return
+
+        deleted = await self.ledger.delete_gasto_async(gasto.chat_id, gasto.message_id)
+        self.recent.remove(gasto.chat_id, gasto.message_id)
+        self._last_undo[undo_key] = message.message_id
+        if not deleted:
+            await self.telegram.send_message(chat_id, "❌ Ese movimiento ya no está en el ledger (¿mes archivado?).")
+            return
+        await self.telegram.send_message(chat_id, f"↩️ Movimiento eliminado:\n\n{self._describe_entry(gasto)}")
+        await self._apply_correction(gasto, None)
+
+    async def handle_command_editar(self, message: TelegramMessage):
+        """
+        Maneja /editar.
+
+        - /editar: lista los últimos movimientos cargados
+        - /editar [n] monto|moneda|categoria|descripcion <valor>: corrige el último (o el n-ésimo)
+        """
+        chat_id = message.chat.chat_id
+        usage = (
+            "✏️ Uso: /editar [n] <campo> <valor>\n\n"
+            "Campos: monto, moneda, categoria, descripcion\n"
+            "Ejemplos:\n"
+            "/editar monto 3200\n"
+            "/editar 2 categoria Transporte"
+        )
+        args = message.text.split()[1:]
+        if not args:
+            recent = self.recent.recent(chat_id, message.user.user_id)
+            if not recent:
+                await self.telegram.send_message(chat_id, "ℹ️ No hay movimientos recientes para editar.")
+                return
+            lines = ["✏️ Últimos movimientos:\n"]
+            lines.extend(f"{i}. {self._describe_entry(gasto)}" for i, gasto in enumerate(recent, 1))
+            await self.telegram.send_message(chat_id, "\n".join(lines) + "\n\n" + usage)
+            return
+
+        # El valor puede tener espacios: se separa como máximo en [n] campo valor
+        maxsplit = 3 if args[0].lstrip("#").isdigit() else 2
+        gasto, args = self._recent_entry(message, message.text.split(maxsplit=maxsplit)[1:])
+        if gasto is None:
+            await self.telegram.send_message(chat_id, "❌ No encontré ese movimiento reciente. Usá /editar para verlos.")
+            return
+        if len(args) != 2:
+            await self.telegram.send_message(chat_id, usage)
+            return
+
+        field, value = args[0].lower(), args[1].strip()
+        if field == "monto":
+            try:
+                amount = abs(self.normalize_amount(value))
+            except ValueError:
+                await self.telegram.send_message(chat_id, "❌ Monto inválido.")
+                return
+            changes = {"amount": -amount if gasto.amount < 0 else amount}
+        elif field == "moneda":
+            if len(value) != 3 or not value.isalpha():
+                await self.telegram.send_message(chat_id, "❌ Moneda inválida (p. ej. ARS, USD).")
+                return
+            changes = {"currency": value.upper()}
+        elif field in ("categoria", "categoría"):
+            categories_by_name = {cat.lower(): cat for cat in settings.CATEGORIES}
+            if value.lower() not in categories_by_name:
+                await self.telegram.send_message(
+                    chat_id, "❌ Categoría inválida. Opciones: " + ", ".join(settings.CATEGORIES)
+                )
+                return
+            changes = {"category": categories_by_name[value.lower()]}
+        elif field in ("descripcion", "descripción"):
+            changes = {"description": value}
+        else:
+            await self.telegram.send_message(chat_id, usage)
+            return
+
+        edited = replace(gasto, **changes)
+        if edited == gasto:
+            await self.telegram.send_message(chat_id, "ℹ️ Sin cambios.")
+            return
+        if not await self.ledger.update_gasto_async(edited):
+            self.recent.remove(gasto.chat_id, gasto.message_id)
+            await self.telegram.send_message(chat_id, "❌ Ese movimiento ya no está en el ledger (¿mes archivado?).")
+            return
+        self.recent.replace(edited)
+        await self.telegram.send_message(chat_id, f"✏️ Movimiento actualizado:\n\n{self._describe_entry(edited)}")
+        await self._apply_correction(gasto, edited)
+
+    async def handle_command_buscar(self, message: TelegramMessage):
+        """Maneja /buscar <texto>: movimientos por descripción o payee, del más reciente al más antiguo."""
+        query = message.text.strip()[len("/buscar"):].strip()
+        if not query:
+            await self.telegram.send_message(
+                message.chat.chat_id,
+                "🔎 Uso: /buscar <texto>\n\nEjemplo: /buscar empanadas"
+            )
+            return
+        await self._send_search_page(message.chat.chat_id, query, before=None)
+
+    async def handle_button_mas_resultados(self, message: TelegramMessage):
+        """Maneja el botón 'Más resultados' (página siguiente de la última búsqueda)."""
+        cursor = self._search_cursors.get(message.chat.chat_id)
+        if not cursor:
+            await self.telegram.send_message(
+                message.chat.chat_id,
+                "🔎 No hay una búsqueda activa. Usá /buscar <texto>.",
+                reply_markup=self.telegram.make_main_menu()
+            )
+            return
+        query, before = cursor
+        await self._send_search_page(message.chat.chat_id, query, before=before)
+
+    async def _send_search_page(self, chat_id: int, query: str, before):
+        # Se pide uno de más para saber si hay otra página
+        gastos = await asyncio.to_thread(
+            self.ledger.search_gastos, chat_id, query, limit=SEARCH_PAGE_SIZE + 1, before=before
+        )
+        has_more = len(gastos) > SEARCH_PAGE_SIZE
+        gastos = gastos[:SEARCH_PAGE_SIZE]
+
+        if not gastos:
+            self._search_cursors.pop(chat_id, None)
+            text = f"🔎 Sin resultados para \"{query}\"" if before is None else "🔎 No hay más resultados."
+            await self.telegram.send_message(chat_id, text, reply_markup=self.telegram.make_main_menu())
+            return
+
+        lines = [f"🔎 Resultados para \"{query}\":\n"]
+        for gasto in gastos:
+            line = f"📅 {gasto.date_iso.split(' ')[0]}  {gasto.amount} {gasto.currency}"
+            if gasto.category:
+                line += f"  📂 {gasto.category}"
+            detail = " · ".join(part for part in (gasto.description, gasto.payee) if part)
+            if detail:
+                line += f"\n    📝 {detail}"
+            lines.append(line)
+
+        if has_more:
+            last = gastos[-1]
+            self._search_cursors[chat_id] = (query, (last.ts, last.message_id))
+            reply_markup = self.telegram.make_keyboard_buttons([MORE_RESULTS_BUTTON, "❓ Ayuda"], columns=2)
+        else:
+            self._search_cursors.pop(chat_id, None)
+            reply_markup = self.telegram.make_main_menu()
+
+        await self.telegram.send_message(chat_id, "\n".join(lines), reply_markup=reply_markup)
+
     async def handle_button_ver_categorias(self, message: TelegramMessage):
         """Maneja el botón 'Ver Categorías'."""
         categorias_text = "📋 Categorías disponibles:\n\n"
@@ -336,12 +961,27 @@ class GastosService:
 
         await self.telegram.send_message(message.chat.chat_id, categorias_text)
 
+    def _render_export(self) -> Tuple[str, int]:
+        """CSV de todo el ledger, desde el caché si no hubo cambios."""
+        from src.services.export_service import render_csv
+
+        # Con varios workers cada uno ve solo las altas de sus chats: el CSV global no se cachea
+        cacheable = settings.WORKER_PROCESSES <= 1
+        cached = self.reports.get(ALL, "csv", ALL) if cacheable else None
+        if cached is not None:
+            return cached
+        stamp = self.reports.stamp()
+        content, count = render_csv(self.ledger.load_ledger(), rates=self.rates)
+        if cacheable:
+            self.reports.put(ALL, "csv", ALL, (content, count), stamp, size=len(content))
+        return content, count
+
     async def handle_button_exportar_csv(self, message: TelegramMessage):
         """Maneja el botón 'Exportar CSV'."""
-        from src.services.export_service import export_to_csv
+        from src.services.export_service import write_export
 
-        gastos = self.ledger.load_ledger()
-        n = export_to_csv(gastos)
+        content, n = await asyncio.to_thread(self._render_export)
+        await asyncio.to_thread(write_export, content, n)
 
         await self.telegram.send_message(
             message.chat.chat_id,
@@ -352,6 +992,370 @@ class GastosService:
             f"Cuenta → Import → CSV"
         )
 
+    async def handle_command_cotizacion(self, message: TelegramMessage):
+        """
+        Maneja /cotizacion.
+
+        - /cotizacion: últimas cotizaciones cargadas
+        - /cotizacion USD 1450 [YYYY-MM-DD]: carga una cotización (solo administradores)
+        """
+        chat_id = message.chat.chat_id
+        if not self.rates:
+            await self.telegram.send_message(chat_id, "❌ Las cotizaciones no están disponibles.")
+            return
+
+        args = message.text.split()[1:]
+        if not args:
+            latest = await asyncio.to_thread(self.rates.latest_rates)
+            if not latest:
+                await self.telegram.send_message(
+                    chat_id,
+                    f"💱 No hay cotizaciones cargadas (moneda base: {self.rates.base_currency}).\n\n"
+                    f"Uso: /cotizacion USD 1450 [YYYY-MM-DD]"
+                )
+                return
+            lines = [f"💱 Cotizaciones en {self.rates.base_currency}:\n"]
+            for currency, (date, rate) in sorted(latest.items()):
+                lines.append(f"• 1 {currency} = {rate:g} {self.rates.base_currency} (desde {date})")
+            await self.telegram.send_message(chat_id, "\n".join(lines))
+            return
+
+        if not self.is_admin(message):
+            await self.telegram.send_message(chat_id, "⛔ Solo los administradores pueden cargar cotizaciones.")
+            return
+
+        date = args[2] if len(args) == 3 else self.to_local_datetime(message.date)[:10]
+        try:
+            if len(args) not in (2, 3):
+                raise ValueError("Formato: /cotizacion USD 1450 [YYYY-MM-DD]")
+            rate = float(args[1].replace(",", "."))
+            await asyncio.to_thread(self.rates.set_rate, args[0], date, rate)
+        except ValueError as e:
+            await self.telegram.send_message(chat_id, f"❌ {e}")
+            return
+        # Cambian las conversiones a la moneda base de todos los reportes
+        self.reports.invalidate()
+
+        await self.telegram.send_message(
+            chat_id,
+            f"✅ Cotización guardada: 1 {args[0].upper()} = {rate:g} {self.rates.base_currency} desde {date}"
+        )
+
+    def _month_summary(self, chat_id: int, month: str) -> dict:
+        """
+        Totales del mes de un chat en la moneda base.
+
+        Returns:
+            dict con currency, expenses (por categoría), income, count y
+            missing ({moneda: movimientos sin cotización})
+        """
+        gastos = self.ledger.load_month(chat_id, month)
+        if self.rates:
+            base = self.rates.base_currency
+            converted = self.rates.convert_gastos(gastos)
+        else:
+            base = settings.DEFAULT_CURRENCY
+            converted = [int(g.amount) if g.currency == base else None for g in gastos]
+
+        expenses = {}
+        income = 0
+        missing = {}
+        for gasto, amount in zip(gastos, converted):
+            if amount is None:
+                missing[gasto.currency] = missing.get(gasto.currency, 0) + 1
+            elif amount < 0:
+                category = gasto.category or "Varios"
+                expenses[category] = expenses.get(category, 0) - amount
+            else:
+                income += amount
+        return {"currency": base, "expenses": expenses, "income": income, "count": len(gastos), "missing": missing}
+
+    async def handle_command_resumen(self, message: TelegramMessage):
+        """Maneja /resumen [YYYY-MM]: gastos por categoría e ingresos del mes en la moneda base."""
+        chat_id = message.chat.chat_id
+        args = message.text.split()[1:]
+        month = args[0] if args else self.to_local_datetime(message.date)[:7]
+        if not re.fullmatch(r"\d{4}-\d{2}", month):
+            await self.telegram.send_message(chat_id, "❌ Formato: /resumen [YYYY-MM]\n\nEjemplo: /resumen 2025-01")
+            return
+
+        text = self.reports.get(chat_id, "resumen", month)
+        if text is None:
+            stamp = self.reports.stamp()
+            summary = await asyncio.to_thread(self._month_summary, chat_id, month)
+            text = self._format_month_summary(month, summary)
+            self.reports.put(chat_id, "resumen", month, text, stamp)
+        await self.telegram.send_message(chat_id, text)
+
+    async def handle_command_grafico(self, message: TelegramMessage):
+        """Maneja /grafico [categorias|acumulado] [YYYY-MM]: gráfico del mes en la moneda base."""
+        chat_id = message.chat.chat_id
+        usage = (
+            "📈 Uso: /grafico [categorias|acumulado] [YYYY-MM]\n\n"
+            "• categorias: gasto del mes por categoría\n"
+            "• acumulado: gasto acumulado día a día"
+        )
+        if not self.charts or not self.charts.is_available():
+            await self.telegram.send_message(chat_id, "❌ Los gráficos no están disponibles (falta matplotlib).")
+            return
+
+        chart_type, month = CHART_TYPES[0], self.to_local_datetime(message.date)[:7]
+        for arg in message.text.lower().split()[1:]:
+            if arg in CHART_TYPES:
+                chart_type = arg
+            elif re.fullmatch(r"\d{4}-\d{2}", arg):
+                month = arg
+            else:
+                await self.telegram.send_message(chat_id, usage)
+                return
+
+        report = f"grafico:{chart_type}"
+        png = self.reports.get(chat_id, report, month)
+        if png is None:
+            stamp = self.reports.stamp()
+            try:
+                png = await self.charts.render(message.user.user_id, chart_type, chat_id, month)
+            except ChartBusyError:
+                await self.telegram.send_message(chat_id, "⏳ Ya estoy armando un gráfico tuyo, esperá a que termine.")
+                return
+            except Exception as e:
+                logger.error("No se pudo generar el gráfico %s de %s: %s", chart_type, month, e, exc_info=True)
+                await self.telegram.send_message(chat_id, "❌ No pude generar el gráfico. Probá de nuevo.")
+                return
+            if png is None:
+                await self.telegram.send_message(chat_id, f"📈 No hay gastos para graficar en {month}.")
+                return
+            self.reports.put(chat_id, report, month, png, stamp)
+
+        if not await self.telegram.send_photo(chat_id, png, filename=f"{chart_type}-{month}.png"):
+            await self.telegram.send_message(chat_id, "❌ No pude enviar el gráfico. Probá de nuevo.")
+
+    @staticmethod
+    def _format_month_summary(month: str, summary: dict) -> str:
+        if not summary["count"]:
+            return f"📊 No hay movimientos en {month}."
+
+        currency = summary["currency"]
+        total_expenses = sum(summary["expenses"].values())
+        lines = [f"📊 Resumen de {month} (en {currency})\n", f"💸 Gastos: {total_expenses} {currency}"]
+        for category, amount in sorted(summary["expenses"].items(), key=lambda item: -item[1]):
+            lines.append(f"  • {category}: {amount}")
+        lines.append(f"💰 Ingresos: {summary['income']} {currency}")
+        lines.append(f"⚖️ Balance: {summary['income'] - total_expenses} {currency}")
+        if summary["missing"]:
+            detail = ", ".join(f"{count} en {cur}" for cur, count in sorted(summary["missing"].items()))
+            lines.append(f"\n⚠️ Sin cotización: {detail}. Cargala con /cotizacion.")
+        return "\n".join(lines)
+
+    def is_admin(self, message: TelegramMessage) -> bool:
+        """Indica si el usuario puede ejecutar comandos de administración."""
+        return message.user.user_id in settings.ADMIN_USER_IDS
+
+    async def handle_command_backfill(self, message: TelegramMessage):
+        """
+        Maneja el comando /backfill [dry] [reset] [cuenta] (solo administradores).
+
+        Reconcilia todo el ledger con Actual Budget en segundo plano.
+        """
+        if not self.is_admin(message):
+            await self.telegram.send_message(message.chat.chat_id, "⛔ Comando solo para administradores.")
+            return
+
+        if not self.backfill or not self.actual_budget or not self.actual_budget.is_configured():
+            await self.telegram.send_message(message.chat.chat_id, "❌ Actual Budget no está configurado.")
+            return
+
+        if self.backfill.running:
+            await self.telegram.send_message(message.chat.chat_id, "⏳ Ya hay un backfill en curso.")
+            return
+
+        args = message.text.split()[1:]
+        dry_run = "dry" in args
+        reset = "reset" in args
+        account = next((a for a in args if a not in ("dry", "reset")), None)
+
+        if reset and not dry_run:
+            await asyncio.to_thread(self.backfill.reset_checkpoint)
+
+        await self.telegram.send_message(
+            message.chat.chat_id,
+            f"🔄 Backfill {'(simulación) ' if dry_run else ''}iniciado"
+            f"{' desde el principio' if reset else ''}..."
+        )
+
+        task = asyncio.create_task(self._run_backfill(message.chat.chat_id, account, dry_run, resume=not reset))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def handle_command_traza(self, message: TelegramMessage):
+        """
+        Maneja /traza [on|off] (solo administradores).
+
+        Sin argumentos muestra el estado y los updates más lentos de las últimas trazas.
+        """
+        chat_id = message.chat.chat_id
+        if not self.is_admin(message):
+            await self.telegram.send_message(chat_id, "⛔ Comando solo para administradores.")
+            return
+
+        args = message.text.lower().split()[1:]
+        if args and args[0] in ("on", "off"):
+            tracing.set_enabled(args[0] == "on")
+            await self.telegram.send_message(
+                chat_id, f"⏱️ Tracing {'activado' if tracing.is_enabled() else 'desactivado'}."
+            )
+            return
+
+        traces = tracing.recent_traces(limit=5)
+        lines = [f"⏱️ Tracing {'activado' if tracing.is_enabled() else 'desactivado'}"]
+        if traces:
+            lines.append("\nUpdates más lentos recientes:")
+            lines.extend(f"• {trace.describe()}" for trace in traces)
+        else:
+            lines.append("\nTodavía no hay trazas. Usá /traza on.")
+        cache = self.reports.stats()
+        lines.append(
+            f"\n🗂️ Caché de reportes: {cache['hits']} aciertos, {cache['misses']} fallos, "
+            f"{cache['entries']} guardados ({cache['bytes'] // 1024} KB)"
+        )
+        await self.telegram.send_message(chat_id, "\n".join(lines))
+
+    async def handle_command_perfil(self, message: TelegramMessage):
+        """Maneja /perfil [segundos] (solo administradores): cProfile del bot y reporte en disco."""
+        chat_id = message.chat.chat_id
+        if not self.is_admin(message):
+            await self.telegram.send_message(chat_id, "⛔ Comando solo para administradores.")
+            return
+
+        args = message.text.split()[1:]
+        if args and args[0].lower() == "stop":
+            path = tracing.profiler.stop()
+            await self.telegram.send_message(
+                chat_id, f"🔬 Reporte guardado en {path}" if path else "ℹ️ No había un profiling en curso."
+            )
+            return
+        try:
+            seconds = min(600.0, float(args[0])) if args else settings.PROFILE_SECONDS
+        except ValueError:
+            await self.telegram.send_message(chat_id, "❌ Uso: /perfil [segundos|stop]")
+            return
+
+        def done(path):
+            if path:
+                task = asyncio.create_task(self.telegram.send_message(chat_id, f"🔬 Reporte guardado en {path}"))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+
+        if not tracing.profiler.start(seconds, on_done=done):
+            await self.telegram.send_message(chat_id, "⏳ Ya hay un profiling en curso (/perfil stop para cortarlo).")
+            return
+        await self.telegram.send_message(chat_id, f"🔬 Profiling activado por {seconds:g}s.")
+
+    async def _run_backfill(self, chat_id: int, account, dry_run: bool, resume: bool):
+        """Ejecuta el backfill e informa el progreso al chat (como mucho cada 15s)."""
+        loop = asyncio.get_running_loop()
+        last_report = [time.monotonic()]
+
+        def progress(stats):
+            # Se llama desde el thread de trabajo de Actual Budget
+            if time.monotonic() - last_report[0] < 15:
+                return
+            last_report[0] = time.monotonic()
+            asyncio.run_coroutine_threadsafe(
+                self.telegram.send_message(chat_id, f"⏳ Backfill: {stats['processed']} movimientos procesados..."),
+                loop,
+            )
+
+        try:
+            result = await self.backfill.run(account=account, dry_run=dry_run, resume=resume, progress=progress)
+        except Exception as exc:
+            logger.error("Fallo en backfill: %s", exc, exc_info=True)
+            await self.telegram.send_message(chat_id, f"❌ Backfill interrumpido: {exc}\n\nVolvé a ejecutarlo para retomar.")
+            return
+
+        verb = "se crearían" if dry_run else "creados"
+        await self.telegram.send_message(
+            chat_id,
+            f"✅ Backfill {'(simulación) ' if dry_run else ''}finalizado\n\n"
+            f"📊 {result['processed']} movimientos procesados\n"
+            f"🆕 {result['created']} {verb}\n"
+            f"✏️ {result['updated']} actualizados\n"
+            f"✔️ {result['unchanged']} sin cambios"
+        )
+
+    async def handle_document(self, message: TelegramMessage):
+        """
+        Maneja un archivo adjunto: importa resúmenes bancarios en CSV.
+
+        El caption puede indicar la categoría para los gastos sin categoría.
+        """
+        chat_id = message.chat.chat_id
+        document = message.document or {}
+        file_name = document.get("file_name") or "resumen.csv"
+
+        if not self.statement_import or not file_name.lower().endswith(".csv"):
+            await self.telegram.send_message(
+                chat_id, "📎 Solo puedo importar resúmenes en CSV (MercadoPago, Credicoop o genérico)."
+            )
+            return
+
+        if document.get("file_size", 0) > MAX_DOCUMENT_SIZE:
+            await self.telegram.send_message(chat_id, "❌ El archivo supera los 20 MB que permite Telegram.")
+            return
+
+        if chat_id in self._importing_chats:
+            await self.telegram.send_message(chat_id, "⏳ Ya hay una importación en curso en este chat.")
+            return
+
+        caption = (message.caption or "").strip()
+        category = caption if caption in settings.CATEGORIES else None
+
+        self._importing_chats.add(chat_id)
+        fd, path = tempfile.mkstemp(prefix="gastos-import-", suffix=".csv")
+        os.close(fd)
+        try:
+            await self.telegram.send_message(chat_id, f"⏳ Importando {file_name}...")
+            file_path = await self.telegram.get_file_path(document["file_id"])
+            if not file_path or not await self.telegram.download_file(file_path, path):
+                await self.telegram.send_message(chat_id, "❌ No pude descargar el archivo. Probá de nuevo.")
+                return
+
+            try:
+                stats = await asyncio.to_thread(
+                    self.statement_import.import_file,
+                    path,
+                    chat_id,
+                    message.user.user_id,
+                    category=category,
+                )
+            except ValueError as e:
+                await self.telegram.send_message(chat_id, f"❌ {e}")
+                return
+        finally:
+            self._importing_chats.discard(chat_id)
+            os.remove(path)
+
+        if stats["imported"]:
+            self.reports.invalidate(chat_id)
+            self.reports.invalidate(message.user.user_id)
+            if self.budgets:
+                try:
+                    await asyncio.to_thread(
+                        self.budgets.reseed_months, message.user.user_id, stats["months"], int(time.time())
+                    )
+                except Exception as e:
+                    logger.warning("No se pudieron recalcular los presupuestos tras la importación: %s", e)
+
+        await self.telegram.send_message(
+            chat_id,
+            f"✅ Resumen importado ({stats['format']})\n\n"
+            f"📄 {stats['rows']} filas leídas\n"
+            f"🆕 {stats['imported']} movimientos nuevos\n"
+            f"♻️ {stats['duplicates']} ya registrados\n"
+            f"⚠️ {stats['invalid']} filas sin fecha o monto válidos"
+            + ("\n\nUsá /backfill para enviarlos a Actual Budget." if stats["imported"] and self.actual_budget else "")
+        )
+
     async def handle_button_ayuda(self, message: TelegramMessage):
         """Maneja el botón 'Ayuda'."""
         help_text = (
@@ -360,7 +1364,18 @@ class GastosService:
             "Usá los botones para registrar gastos guiados.\n\n"
             "🔹 *Comandos disponibles:*\n"
             "• /start - Mostrar menú\n"
-            "• /export - Exportar CSV\n\n"
+            "• /gasto 2500 [ARS] [Categoría] [descripción] - Carga rápida\n"
+            "• /ingreso 50000 [ARS] [descripción] - Ingreso rápido\n"
+            "• /buscar <texto> - Buscar movimientos\n"
+            "• /editar [n campo valor] - Corregir un movimiento reciente\n"
+            "• /deshacer - Eliminar el último movimiento cargado\n"
+            "• /presupuesto [Categoría monto] - Presupuestos mensuales\n"
+            "• /recurrente - Alquiler, suscripciones y sueldo automáticos\n"
+            "• /resumen [YYYY-MM] - Resumen del mes en la moneda base\n"
+            "• /grafico [categorias|acumulado] [YYYY-MM] - Gráfico de gastos del mes\n"
+            "• /cotizacion [USD 1450] - Ver o cargar cotizaciones\n"
+            "• /export - Exportar CSV\n"
+            "• Enviá un CSV del banco para importarlo\n\n"
             "🔹 *Flujo de registro:*\n"
             "1. Click en 💸 Nuevo Gasto\n"
             "2. Ingresá el monto\n"
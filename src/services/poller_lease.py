@@ -0,0 +1,101 @@
+"""Lease para que una sola instancia del bot haga polling a la vez."""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+from src.config.settings import settings
+from src.repositories.ledger_repository import LedgerRepository
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+LEASE_NAME = "poller"
+
+
+class PollerLease:
+    """
+    Coordina instancias superpuestas (p. ej. durante un redeploy en Railway).
+
+    Solo la instancia que tiene el lease hace polling; las demás quedan en
+    standby reintentando cada ``ttl / 3`` segundos. El holder renueva el lease
+    con el mismo intervalo y, si lo pierde, detiene su polling. Un error al
+    renovar (base caída un momento) se tolera mientras el lease siga vigente.
+    """
+
+    def __init__(self, ledger_repository: LedgerRepository, ttl: Optional[float] = None):
+        self.ledger = ledger_repository
+        self.ttl = ttl or settings.POLLER_LEASE_TTL
+        self.interval = max(1.0, self.ttl / 3)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = False
+        self._expires_at = 0.0  # time.monotonic() en que vence el lease obtenido
+
+    async def _try_acquire(self) -> Optional[bool]:
+        """True/False según se tenga el lease; None si no se pudo consultar."""
+        started = time.monotonic()
+        try:
+            acquired = await asyncio.wait_for(
+                asyncio.to_thread(self.ledger.try_acquire_lease, LEASE_NAME, self.holder, self.ttl),
+                timeout=self.interval,
+            )
+        except Exception as e:
+            logger.error("Error consultando el lease de polling: %s", str(e) or type(e).__name__)
+            return None
+        if acquired:
+            self._expires_at = started + self.ttl
+        return acquired
+
+    async def acquire(self):
+        """Espera (en standby) hasta obtener el lease."""
+        announced = False
+        while not await self._try_acquire():
+            if not announced:
+                logger.info("⏸️ Otra instancia está haciendo polling; esperando en standby (%s)", self.holder)
+                announced = True
+            await asyncio.sleep(self.interval)
+        self.held = True
+        logger.info("🔑 Lease de polling obtenido (%s)", self.holder)
+
+    async def run_while_held(self, run: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecuta ``run`` mientras se conserve el lease.
+
+        Si el lease se pierde, cancela ``run`` y vuelve a esperar en standby.
+        """
+        while True:
+            await self.acquire()
+            task = asyncio.create_task(run())
+            try:
+                while True:
+                    done, _ = await asyncio.wait({task}, timeout=self.interval)
+                    if done:
+                        return task.result()
+                    acquired = await self._try_acquire()
+                    # Sin respuesta: se sigue solo si el lease no vence antes del próximo intento
+                    if acquired is None and time.monotonic() + self.interval < self._expires_at:
+                        continue
+                    if not acquired:
+                        logger.warning("⚠️ Lease de polling perdido; deteniendo el polling")
+                        self.held = False
+                        break
+            finally:
+                if not task.done():
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+
+    async def release(self):
+        """Libera el lease (al apagar) para que el standby tome el control enseguida."""
+        if not self.held:
+            return
+        try:
+            await asyncio.to_thread(self.ledger.release_lease, LEASE_NAME, self.holder)
+            logger.info("🔓 Lease de polling liberado")
+        except Exception as e:
+            logger.warning("No se pudo liberar el lease de polling: %s", e)
+        self.held = False
@@ -0,0 +1,67 @@
+"""Últimos movimientos cargados por usuario (para /deshacer y /editar)."""
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.schemas import Gasto
+
+# Movimientos que se recuerdan por usuario y chat
+RECENT_ENTRIES_PER_USER = 10
+
+
+class RecentEntries:
+    """
+    Buffer circular en memoria de los últimos movimientos de cada (chat, usuario).
+
+    Junto al buffer se mantiene un índice (chat_id, message_id) → movimiento,
+    así deshacer o editar no recorre el ledger. No se persiste: tras un
+    reinicio solo se pueden corregir los movimientos cargados desde entonces.
+    """
+
+    def __init__(self, size: int = RECENT_ENTRIES_PER_USER):
+        self.size = size
+        self._buffers: Dict[Tuple[int, int], Deque[Tuple[int, int]]] = {}
+        self._entries: Dict[Tuple[int, int], Gasto] = {}
+        self._lock = threading.Lock()
+
+    def push(self, gasto: Gasto):
+        """Registra un movimiento nuevo (desplaza al más viejo si el buffer está lleno)."""
+        key = (gasto.chat_id, gasto.message_id)
+        with self._lock:
+            buffer = self._buffers.setdefault((gasto.chat_id, gasto.user_id), deque())
+            if key in self._entries:
+                buffer.remove(key)
+            elif len(buffer) >= self.size:
+                self._entries.pop(buffer.popleft(), None)
+            buffer.append(key)
+            self._entries[key] = gasto
+
+    def recent(self, chat_id: int, user_id: int) -> List[Gasto]:
+        """Movimientos recordados del usuario en el chat, del más nuevo al más viejo."""
+        with self._lock:
+            buffer = self._buffers.get((chat_id, user_id), ())
+            return [self._entries[key] for key in reversed(buffer)]
+
+    def get(self, chat_id: int, message_id: int) -> Optional[Gasto]:
+        with self._lock:
+            return self._entries.get((chat_id, message_id))
+
+    def replace(self, gasto: Gasto):
+        """Actualiza un movimiento recordado (tras editarlo), sin cambiar su posición."""
+        key = (gasto.chat_id, gasto.message_id)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = gasto
+
+    def remove(self, chat_id: int, message_id: int) -> Optional[Gasto]:
+        """Olvida un movimiento (tras deshacerlo)."""
+        key = (chat_id, message_id)
+        with self._lock:
+            gasto = self._entries.pop(key, None)
+            if gasto is not None:
+                buffer = self._buffers.get((chat_id, gasto.user_id))
+                if buffer is not None:
+                    buffer.remove(key)
+                    if not buffer:
+                        del self._buffers[(chat_id, gasto.user_id)]
+            return gasto
@@ -0,0 +1,356 @@
+"""Movimientos recurrentes (alquiler, suscripciones, sueldo) y su scheduler."""
+import asyncio
+import hashlib
+import heapq
+import time
+from calendar import monthrange
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.config.settings import settings
+from src.repositories.ledger_repository import LedgerRepository
+from src.schemas import Gasto
+from src.utils.local_time import format_local, local_tz
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SNAPSHOT_NAME = "recurring"
+# Hora local en la que se registran las reglas mensuales ("día N")
+MONTHLY_HOUR = 9
+# Tope de espera: re-lee las reglas por si otro proceso las modificó
+MAX_SLEEP = 300
+# Tope de ocurrencias pendientes por regla al recuperar una caída larga
+MAX_CATCH_UP = 400
+# Días que se recorren buscando la próxima ocurrencia de un cron
+_CRON_HORIZON_DAYS = 5 * 366
+
+_CRON_FIELDS = (("minuto", 0, 59), ("hora", 0, 23), ("día", 1, 31), ("mes", 1, 12), ("día de semana", 0, 7))
+
+
+def _parse_cron_field(spec: str, name: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in spec.split(","):
+        part, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, _, end_text = part.partition("-")
+            start, end = int(start_text), int(end_text)
+        else:
+            start = end = int(part)
+            if step_text:
+                end = high
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Campo {name} fuera de rango: {spec}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expression: str) -> Tuple[Set[int], Set[int], Set[int], Set[int], Set[int], bool, bool]:
+    """
+    Interpreta un cron de 5 campos (minuto hora día mes día-de-semana).
+
+    Soporta ``*``, listas, rangos y pasos. Como en cron, si se restringen día
+    del mes y día de semana alcanza con que coincida uno de los dos.
+
+    Raises:
+        ValueError: Si la expresión es inválida
+    """
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError("El cron debe tener 5 campos: minuto hora día mes día-de-semana")
+    try:
+        minutes, hours, days, months, weekdays = (
+            _parse_cron_field(spec, name, low, high) for spec, (name, low, high) in zip(fields, _CRON_FIELDS)
+        )
+    except ValueError as e:
+        raise ValueError(f"Cron inválido: {e}")
+    if 7 in weekdays:  # 0 y 7 son domingo
+        weekdays = (weekdays - {7}) | {0}
+    return minutes, hours, days, months, weekdays, fields[2] != "*", fields[4] != "*"
+
+
+def next_fire(schedule: Dict[str, Any], after_ts: int) -> Optional[int]:
+    """
+    Próxima ocurrencia (timestamp unix) estrictamente posterior a ``after_ts``.
+
+    Args:
+        schedule: {"day": N} (día N de cada mes, o el último si el mes es más
+            corto) o {"cron": "m h dom mes dow"}, en hora local
+    """
+    tzinfo = local_tz()
+    after = datetime.fromtimestamp(after_ts, tzinfo)
+
+    if "day" in schedule:
+        year, month = after.year, after.month
+        for _ in range(13):
+            day = min(int(schedule["day"]), monthrange(year, month)[1])
+            candidate = datetime(year, month, day, MONTHLY_HOUR, 0, tzinfo=tzinfo)
+            if candidate.timestamp() > after_ts:
+                return int(candidate.timestamp())
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return None
+
+    minutes, hours, days, months, weekdays, days_restricted, weekdays_restricted = parse_cron(schedule["cron"])
+    date = after.date()
+    for _ in range(_CRON_HORIZON_DAYS):
+        if date.month in months:
+            dom_ok = date.day in days
+            dow_ok = (date.weekday() + 1) % 7 in weekdays
+            if days_restricted and weekdays_restricted:
+                matches = dom_ok or dow_ok
+            else:
+                matches = dom_ok and dow_ok
+            if matches:
+                for hour in sorted(hours):
+                    for minute in sorted(minutes):
+                        candidate = datetime(date.year, date.month, date.day, hour, minute, tzinfo=tzinfo)
+                        if candidate.timestamp() > after_ts:
+                            return int(candidate.timestamp())
+        date += timedelta(days=1)
+    return None
+
+
+def describe_schedule(schedule: Dict[str, Any]) -> str:
+    """Texto corto de la programación para mostrar al usuario."""
+    if "day" in schedule:
+        return f"día {schedule['day']} de cada mes"
+    return f"cron \"{schedule['cron']}\""
+
+
+def recurring_message_id(rule_id: int, chat_id: int, ts: int) -> int:
+    """
+    message_id determinístico de una ocurrencia.
+
+    Negativo, como los movimientos importados, para no chocar con ids de
+    Telegram; la misma ocurrencia siempre genera el mismo id y el ledger la
+    descarta si ya existe.
+    """
+    digest = hashlib.blake2b(f"recurring:{chat_id}:{rule_id}:{ts}".encode("utf-8"), digest_size=8).digest()
+    return -(int.from_bytes(digest, "big") >> 2) - 1
+
+
+class RecurringService:
+    """
+    Reglas recurrentes por usuario y el scheduler que las materializa.
+
+    Las reglas se guardan en un snapshot junto con la última ocurrencia
+    registrada de cada una. El scheduler mantiene un heap de próximas
+    ocurrencias y duerme hasta la más cercana; al arrancar registra de una
+    sola escritura todas las ocurrencias que quedaron pendientes.
+    """
+
+    def __init__(
+        self,
+        ledger_repository: LedgerRepository,
+        on_materialized: Optional[Callable[[List[Gasto], bool], Awaitable[None]]] = None,
+    ):
+        self.ledger = ledger_repository
+        self.on_materialized = on_materialized
+        self._changed: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # === Reglas ===
+    def _load_rules(self) -> Dict[str, Dict[str, Any]]:
+        snapshot = self.ledger.load_snapshot(SNAPSHOT_NAME) or {}
+        return snapshot.get("rules", {})
+
+    def add_rule(
+        self,
+        user_id: int,
+        chat_id: int,
+        schedule: Dict[str, Any],
+        amount: int,
+        currency: str,
+        category: str,
+        description: str,
+        now_ts: int,
+    ) -> Dict[str, Any]:
+        """
+        Crea una regla; la primera ocurrencia es la siguiente a ``now_ts``.
+
+        Args:
+            amount: Monto con signo (negativo para gastos)
+
+        Raises:
+            ValueError: Si la programación es inválida
+        """
+        if "cron" in schedule:
+            parse_cron(schedule["cron"])
+        elif not 1 <= int(schedule.get("day", 0)) <= 31:
+            raise ValueError("El día debe estar entre 1 y 31")
+        created: Dict[str, Any] = {}
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"next_id": 1, "rules": {}}
+            rule_id = snapshot["next_id"]
+            snapshot["next_id"] = rule_id + 1
+            created.update({
+                "id": rule_id,
+                "user_id": user_id,
+                "chat_id": chat_id,
+                "schedule": schedule,
+                "amount": int(amount),
+                "currency": currency,
+                "category": category,
+                "description": description,
+                "last_ts": int(now_ts),
+            })
+            snapshot["rules"][str(rule_id)] = dict(created)
+            return snapshot
+
+        self.ledger.update_snapshot(SNAPSHOT_NAME, mutate)
+        logger.info("Regla recurrente %s creada (user_id=%s, %s)", created["id"], user_id, describe_schedule(schedule))
+        self.wake()
+        return created
+
+    def remove_rule(self, user_id: int, rule_id: int) -> bool:
+        """Elimina una regla del usuario; devuelve False si no existe."""
+        removed = []
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"next_id": 1, "rules": {}}
+            rule = snapshot["rules"].get(str(rule_id))
+            removed.append(rule is not None and rule["user_id"] == user_id)
+            if removed[0]:
+                del snapshot["rules"][str(rule_id)]
+            return snapshot
+
+        self.ledger.update_snapshot(SNAPSHOT_NAME, mutate)
+        if removed[0]:
+            self.wake()
+        return removed[0]
+
+    def list_rules(self, user_id: int) -> List[Dict[str, Any]]:
+        """Reglas del usuario con su próxima ocurrencia (``next_ts``)."""
+        rules = [rule for rule in self._load_rules().values() if rule["user_id"] == user_id]
+        for rule in rules:
+            rule["next_ts"] = next_fire(rule["schedule"], rule["last_ts"])
+        return sorted(rules, key=lambda rule: rule["id"])
+
+    # === Materialización ===
+    def _occurrences(self, rule: Dict[str, Any], until_ts: int) -> List[int]:
+        occurrences = []
+        fire_ts = next_fire(rule["schedule"], rule["last_ts"])
+        while fire_ts is not None and fire_ts <= until_ts:
+            occurrences.append(fire_ts)
+            fire_ts = next_fire(rule["schedule"], fire_ts)
+        if len(occurrences) > MAX_CATCH_UP:
+            logger.warning("Regla %s: %s ocurrencias pendientes, se registran las últimas %s",
+                           rule["id"], len(occurrences), MAX_CATCH_UP)
+            occurrences = occurrences[-MAX_CATCH_UP:]
+        return occurrences
+
+    @staticmethod
+    def _to_gasto(rule: Dict[str, Any], ts: int) -> Gasto:
+        return Gasto(
+            chat_id=rule["chat_id"],
+            message_id=recurring_message_id(rule["id"], rule["chat_id"], ts),
+            user_id=rule["user_id"],
+            ts=ts,
+            date_iso=format_local(ts),
+            amount=rule["amount"],
+            currency=rule["currency"],
+            category=rule["category"],
+            description=rule["description"],
+            payee=settings.PAYEE_DEFAULT,
+        )
+
+    def materialize_due(
+        self, now_ts: int, rule_ids: Optional[Iterable[str]] = None, catch_up: bool = False
+    ) -> List[Gasto]:
+        """
+        Registra las ocurrencias vencidas hasta ``now_ts``.
+
+        En la recuperación tras una caída (``catch_up``) todas las ocurrencias
+        pendientes se escriben juntas con ``append_gastos``; en marcha normal
+        cada una va por ``append_gasto``. Los ids determinísticos hacen que
+        repetir esto sea inofensivo.
+
+        Returns:
+            Gastos nuevos, ordenados por fecha
+        """
+        rules = self._load_rules()
+        selected = rules if rule_ids is None else {rid: rules[rid] for rid in rule_ids if rid in rules}
+        due: List[Tuple[str, Gasto]] = [
+            (rule_id, self._to_gasto(rule, ts))
+            for rule_id, rule in selected.items()
+            for ts in self._occurrences(rule, now_ts)
+        ]
+        if not due:
+            return []
+
+        gastos = [gasto for _, gasto in due]
+        if catch_up:
+            # Si un corte impidió actualizar last_ts, parte del lote ya estaba registrado
+            added = set(self.ledger.append_gastos(gastos))
+            created = [gasto for gasto in gastos if (gasto.chat_id, gasto.message_id) in added]
+        else:
+            created = [gasto for gasto in gastos if self.ledger.append_gasto(gasto)]
+
+        last_fired: Dict[str, int] = {}
+        for rule_id, gasto in due:
+            last_fired[rule_id] = max(last_fired.get(rule_id, 0), gasto.ts)
+
+        def mutate(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            snapshot = snapshot or {"next_id": 1, "rules": {}}
+            for rule_id, fired_ts in last_fired.items():
+                rule = snapshot["rules"].get(rule_id)
+                if rule is not None and fired_ts > rule["last_ts"]:
+                    rule["last_ts"] = fired_ts
+            return snapshot
+
+        self.ledger.update_snapshot(SNAPSHOT_NAME, mutate)
+        logger.info("🔁 Ocurrencias recurrentes registradas: %s (de %s reglas)", len(created), len(last_fired))
+        return sorted(created, key=lambda g: (g.ts, g.chat_id, g.message_id))
+
+    # === Scheduler ===
+    def wake(self):
+        """Despierta al scheduler para que relea las reglas (thread-safe)."""
+        if self._changed is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    def _build_heap(self) -> List[Tuple[int, str]]:
+        heap = []
+        for rule_id, rule in self._load_rules().items():
+            fire_ts = next_fire(rule["schedule"], rule["last_ts"])
+            if fire_ts is not None:
+                heap.append((fire_ts, rule_id))
+        heapq.heapify(heap)
+        return heap
+
+    async def _materialize(self, now_ts: int, rule_ids: Optional[List[str]] = None, catch_up: bool = False):
+        try:
+            gastos = await asyncio.to_thread(self.materialize_due, now_ts, rule_ids, catch_up)
+        except Exception as e:
+            logger.error("Error registrando movimientos recurrentes: %s", e, exc_info=True)
+            return
+        if gastos and self.on_materialized:
+            await self.on_materialized(gastos, catch_up)
+
+    async def run(self):
+        """Bucle del scheduler: recupera lo pendiente y duerme hasta la próxima ocurrencia."""
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+
+        # Recuperación tras una caída: todo lo vencido en una sola escritura
+        await self._materialize(int(time.time()), catch_up=True)
+
+        while True:
+            self._changed.clear()
+            heap = await asyncio.to_thread(self._build_heap)
+            now = time.time()
+            if heap and heap[0][0] <= now:
+                due = []
+                while heap and heap[0][0] <= now:
+                    due.append(heapq.heappop(heap)[1])
+                await self._materialize(int(now), due)
+                continue
+
+            timeout = min(heap[0][0] - now, MAX_SLEEP) if heap else MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,142 @@
+"""Caché de reportes ya armados (resúmenes, CSV, gráficos)."""
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from src.schemas import Gasto
+
+# Dueño/período comodín: reportes de todos los chats o de todo el histórico
+ALL = None
+
+_Key = Tuple[Optional[int], str, Optional[str]]
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return sys.getsizeof(value)
+
+
+class ReportCache:
+    """
+    LRU de reportes renderizados por (dueño, tipo de reporte, período).
+
+    El dueño es el chat (o usuario) al que pertenece el reporte y el período
+    un mes ``YYYY-MM``; ``ALL`` en cualquiera de los dos marca reportes que
+    abarcan a todos. El tamaño total se acota por bytes, descartando primero
+    los menos usados.
+
+    Cada alta, edición o baja de un movimiento invalida solo los reportes de
+    su chat/usuario y su mes (más los que abarcan a todos). Para no guardar un
+    reporte armado con datos que cambiaron mientras se calculaba, ``put``
+    recibe la marca de ``stamp()`` tomada antes de leer el ledger y se ignora
+    si hubo invalidaciones en el medio.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[_Key, Tuple[Any, int]]" = OrderedDict()
+        self._by_owner: Dict[Optional[int], Set[_Key]] = {}
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, owner: Optional[int], report: str, period: Optional[str]) -> Optional[Any]:
+        key = (owner, report, period)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def stamp(self) -> int:
+        """Marca a pasar a ``put`` (tomarla antes de leer los datos del reporte)."""
+        with self._lock:
+            return self._generation
+
+    def put(
+        self,
+        owner: Optional[int],
+        report: str,
+        period: Optional[str],
+        value: Any,
+        stamp: int,
+        size: Optional[int] = None,
+    ) -> bool:
+        """
+        Guarda un reporte.
+
+        Returns:
+            False si no se guardó (caché desactivado, reporte más grande que
+            el límite o datos invalidados desde ``stamp``)
+        """
+        size = _sizeof(value) if size is None else size
+        key = (owner, report, period)
+        with self._lock:
+            if stamp != self._generation or size > self.max_bytes:
+                return False
+            self._discard(key)
+            self._entries[key] = (value, size)
+            self._by_owner.setdefault(owner, set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def _discard(self, key: _Key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[1]
+        keys = self._by_owner.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_owner[key[0]]
+
+    # === Invalidación ===
+    def invalidate_gastos(self, gastos: Iterable[Gasto]):
+        """Descarta los reportes afectados por movimientos nuevos, editados o borrados."""
+        affected = {}
+        for gasto in gastos:
+            affected.setdefault(gasto.chat_id, set()).add(gasto.date_iso[:7])
+            affected.setdefault(gasto.user_id, set()).add(gasto.date_iso[:7])
+        with self._lock:
+            self._generation += 1
+            all_periods = set().union(*affected.values()) if affected else set()
+            for owner, periods in list(affected.items()) + [(ALL, all_periods)]:
+                for key in list(self._by_owner.get(owner, ())):
+                    if key[2] is ALL or key[2] in periods:
+                        self._discard(key)
+                        self.invalidations += 1
+
+    def invalidate(self, owner: Optional[int] = ALL):
+        """Descarta todos los reportes de un chat/usuario (más los globales), o todos si no se indica."""
+        with self._lock:
+            self._generation += 1
+            owners = list(self._by_owner) if owner is ALL else [owner, ALL]
+            for key in [key for o in owners for key in self._by_owner.get(o, ())]:
+                self._discard(key)
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,338 @@
+"""Servicio para importar resúmenes bancarios (CSV) al ledger."""
+import csv
+import functools
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from src.config.settings import settings
+from src.repositories.ledger_repository import LedgerRepository
+from src.schemas import Gasto
+from src.utils.local_time import local_tz
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Columnas reconocidas por formato (encabezados normalizados: minúsculas, sin acentos, "_")
+STATEMENT_FORMATS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "mercadopago": {
+        "signature": ("release_date", "transaction_net_amount"),
+        "date": ("release_date",),
+        "amount": ("transaction_net_amount",),
+        "payee": ("transaction_type",),
+        "description": ("reference_id",),
+    },
+    "credicoop": {
+        "signature": ("fecha", "concepto", "debito", "credito"),
+        "date": ("fecha",),
+        "debit": ("debito",),
+        "credit": ("credito",),
+        "payee": ("concepto",),
+        "description": ("nro_cpbte", "cod_operacion"),
+    },
+    "generic": {
+        "signature": (),
+        "date": ("date", "fecha", "fecha_de_operacion", "fecha_operacion"),
+        "amount": ("amount", "importe", "monto", "valor"),
+        "debit": ("debit", "debito", "egreso"),
+        "credit": ("credit", "credito", "ingreso"),
+        "payee": ("payee", "comercio", "beneficiario", "descripcion", "description", "concepto", "detalle"),
+        "description": ("notes", "notas", "referencia"),
+        "category": ("category", "categoria"),
+        "currency": ("currency", "moneda"),
+    },
+}
+
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d/%m/%y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y %H:%M:%S",
+)
+
+# Filas a revisar buscando el encabezado (los bancos suelen agregar un preámbulo)
+_HEADER_SCAN_ROWS = 30
+
+
+def _normalize_header(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "_", value.strip().lower()).strip("_")
+
+
+def _normalize_payee(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+def parse_amount(text: str) -> Optional[Decimal]:
+    """
+    Interpreta montos con formato local o internacional.
+
+    "1.234,56", "1,234.56", "-1500", "$ 2.500" y "(300,00)" son válidos.
+    Con un único separador seguido de exactamente 3 dígitos se toma como
+    separador de miles (convención argentina: "1.500" = 1500).
+    """
+    s = text.strip().replace("$", "").replace(" ", "").replace("\u00a0", "")
+    if not s:
+        return None
+    negative = s.startswith("(") and s.endswith(")")
+    s = s.strip("()")
+    if "," in s and "." in s:
+        decimal_sep = "," if s.rfind(",") > s.rfind(".") else "."
+        thousands_sep = "." if decimal_sep == "," else ","
+        s = s.replace(thousands_sep, "").replace(decimal_sep, ".")
+    elif "," in s or "." in s:
+        sep = "," if "," in s else "."
+        parts = s.split(sep)
+        if len(parts) > 2 or len(parts[-1]) == 3:
+            s = s.replace(sep, "")
+        else:
+            s = s.replace(sep, ".")
+    try:
+        value = Decimal(s)
+    except InvalidOperation:
+        return None
+    return -value if negative else value
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(text: str) -> Optional[datetime]:
+    """Interpreta la fecha de una fila (cacheado: un resumen tiene pocas fechas distintas)."""
+    s = text.strip()
+    # Timestamps ISO con milisegundos/zona ("2024-01-15T10:23:00.000-03:00")
+    s = re.sub(r"(:\d{2})(\.\d+)?([+-]\d{2}:?\d{2}|Z)?$", r"\1", s)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def fingerprint(chat_id: int, date: str, amount: int, payee: str) -> int:
+    """Huella de 64 bits de (chat, fecha YYYY-MM-DD, monto, payee normalizado)."""
+    key = f"{chat_id}|{date}|{int(amount)}|{_normalize_payee(payee)}"
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def synthetic_message_id(fp: int, occurrence: int) -> int:
+    """
+    message_id determinístico para un movimiento importado.
+
+    Es negativo para no chocar nunca con ids reales de Telegram; reimportar
+    el mismo archivo genera los mismos ids.
+    """
+    digest = hashlib.blake2b(f"{fp}:{occurrence}".encode("utf-8"), digest_size=8).digest()
+    return -(int.from_bytes(digest, "big") >> 2) - 1
+
+
+def detect_delimiter(sample: str) -> str:
+    """Separador más frecuente en las primeras líneas (tolera preámbulos sin separadores)."""
+    lines = [line for line in sample.splitlines()[:50] if line.strip()]
+    counts = {delimiter: sum(line.count(delimiter) for line in lines) for delimiter in ";,\t|"}
+    return max(counts, key=counts.get) if any(counts.values()) else ","
+
+
+def detect_format(header: List[str]) -> Optional[str]:
+    """Devuelve el formato cuyo encabezado coincide (o None)."""
+    columns = set(header)
+    for name, spec in STATEMENT_FORMATS.items():
+        if spec["signature"] and all(col in columns for col in spec["signature"]):
+            return name
+    generic = STATEMENT_FORMATS["generic"]
+    has_amount = any(c in columns for c in generic["amount"] + generic["debit"] + generic["credit"])
+    if any(c in columns for c in generic["date"]) and has_amount:
+        return "generic"
+    return None
+
+
+class StatementImportService:
+    """
+    Importa resúmenes bancarios (MercadoPago, Credicoop o CSV genérico).
+
+    El archivo se recorre fila por fila; cada movimiento se compara contra un
+    índice en memoria de huellas (fecha, monto, payee) del ledger existente,
+    construido en una sola pasada, y los nuevos se escriben en lotes.
+    """
+
+    def __init__(
+        self,
+        ledger_repository: LedgerRepository,
+        batch_size: int = 5000,
+        on_imported: Optional[Callable[[List[Gasto]], None]] = None,
+    ):
+        self.ledger = ledger_repository
+        self.batch_size = max(1, batch_size)
+        # Callback con cada lote escrito (p. ej. para actualizar índices derivados)
+        self.on_imported = on_imported
+
+    def _fingerprint_index(self, chat_id: int) -> Counter:
+        """Cantidad de movimientos existentes por huella para el chat."""
+        index: Counter = Counter()
+        for chunk in self.ledger.iter_ledger_chunks(5000):
+            index.update(
+                fingerprint(g.chat_id, g.date_iso[:10], g.amount, g.payee)
+                for g in chunk
+                if g.chat_id == chat_id
+            )
+        return index
+
+    @staticmethod
+    def _iter_records(stream: TextIO, fmt: Optional[str]) -> Iterator[Tuple[str, Dict[str, str]]]:
+        """Recorre las filas como {columna normalizada: valor}, después del encabezado."""
+        sample = stream.read(8192)
+        stream.seek(0)
+        reader = csv.reader(stream, delimiter=detect_delimiter(sample))
+
+        header = None
+        for row_number, row in enumerate(reader):
+            if row_number >= _HEADER_SCAN_ROWS:
+                break
+            candidate = [_normalize_header(cell) for cell in row]
+            detected = detect_format(candidate)
+            if detected and (fmt is None or fmt == detected or fmt == "generic"):
+                header, fmt = candidate, fmt or detected
+                break
+        if header is None:
+            raise ValueError("No se encontró un encabezado de resumen reconocible")
+
+        for row in reader:
+            if any(cell.strip() for cell in row):
+                yield fmt, dict(zip(header, row))
+
+    @staticmethod
+    def _pick(record: Dict[str, str], columns: Tuple[str, ...]) -> str:
+        for column in columns:
+            value = record.get(column)
+            if value and value.strip():
+                return value.strip()
+        return ""
+
+    def _record_to_fields(self, fmt: str, record: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        spec = STATEMENT_FORMATS[fmt]
+        date = parse_date(self._pick(record, spec["date"]))
+        if date is None:
+            return None
+
+        amount = parse_amount(self._pick(record, spec.get("amount", ())))
+        if amount is None:
+            debit = parse_amount(self._pick(record, spec.get("debit", ())))
+            credit = parse_amount(self._pick(record, spec.get("credit", ())))
+            if debit is None and credit is None:
+                return None
+            amount = (credit or 0) - abs(debit or 0)
+
+        return {
+            "date": date,
+            # El ledger guarda montos enteros, igual que el wizard
+            "amount": int(amount.quantize(Decimal("1"))),
+            "payee": self._pick(record, spec["payee"]),
+            "description": self._pick(record, spec.get("description", ())),
+            "category": self._pick(record, spec.get("category", ())),
+            "currency": self._pick(record, spec.get("currency", ())).upper(),
+        }
+
+    def import_stream(
+        self,
+        stream: TextIO,
+        chat_id: int,
+        user_id: int,
+        category: Optional[str] = None,
+        currency: Optional[str] = None,
+        fmt: Optional[str] = None,
+        dry_run: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Importa un resumen desde un stream de texto con seek (archivo abierto).
+
+        Args:
+            stream: CSV abierto en modo texto
+            chat_id: Chat al que se asignan los movimientos
+            user_id: Usuario que importa
+            category: Categoría para filas sin categoría (por defecto "Varios")
+            currency: Moneda para filas sin moneda (por defecto ``DEFAULT_CURRENCY``)
+            fmt: Forzar formato ("mercadopago", "credicoop", "generic")
+            dry_run: Si es True, solo cuenta lo que se importaría
+
+        Returns:
+            Contadores: rows, imported, duplicates, invalid; el formato detectado
+            y los meses ("YYYY-MM") con movimientos importados
+        """
+        tzinfo = local_tz()
+        existing = self._fingerprint_index(chat_id)
+        seen: Counter = Counter()
+        stats: Dict[str, Any] = {"format": fmt, "rows": 0, "imported": 0, "duplicates": 0, "invalid": 0, "months": []}
+        months = set()
+        batch: List[Gasto] = []
+
+        def flush():
+            if batch and not dry_run:
+                added = set(self.ledger.append_gastos(batch))
+                imported = [gasto for gasto in batch if (gasto.chat_id, gasto.message_id) in added]
+                stats["imported"] += len(imported)
+                months.update(gasto.date_iso[:7] for gasto in imported)
+                if self.on_imported and imported:
+                    self.on_imported(imported)
+            elif batch:
+                stats["imported"] += len(batch)
+            batch.clear()
+
+        for detected, record in self._iter_records(stream, fmt):
+            stats["format"] = detected
+            stats["rows"] += 1
+            fields = self._record_to_fields(detected, record)
+            if fields is None or fields["amount"] == 0:
+                stats["invalid"] += 1
+                continue
+
+            local = fields["date"]
+            if local.hour == 0 and local.minute == 0:
+                local = local.replace(hour=12)  # Solo fecha: mediodía evita saltos de día por zona horaria
+            day = local.strftime("%Y-%m-%d")
+            fp = fingerprint(chat_id, day, fields["amount"], fields["payee"])
+            seen[fp] += 1
+            # Movimientos idénticos el mismo día: se importan los que superen a los ya registrados
+            if seen[fp] <= existing[fp]:
+                stats["duplicates"] += 1
+                continue
+
+            batch.append(Gasto(
+                chat_id=chat_id,
+                message_id=synthetic_message_id(fp, seen[fp]),
+                user_id=user_id,
+                ts=int(local.replace(tzinfo=tzinfo).timestamp()),
+                date_iso=local.strftime("%Y-%m-%d %H:%M"),
+                amount=fields["amount"],
+                currency=fields["currency"] or currency or settings.DEFAULT_CURRENCY,
+                category=fields["category"] or category or ("Varios" if fields["amount"] < 0 else ""),
+                description=fields["description"],
+                payee=fields["payee"],
+            ))
+            if len(batch) >= self.batch_size:
+                flush()
+        flush()
+        stats["months"] = sorted(months)
+
+        logger.info("Importación de resumen%s: %s", " (dry-run)" if dry_run else "", stats)
+        return stats
+
+    def import_file(self, path: str, chat_id: int, user_id: int, **kwargs) -> Dict[str, Any]:
+        """Importa un CSV desde disco (UTF-8 o Windows-1252, detectado al inicio)."""
+        with open(path, "rb") as f:
+            head = f.read(65536)
+        try:
+            head.decode("utf-8")
+            encoding = "utf-8-sig"
+        except UnicodeDecodeError as e:
+            # Un corte al final del bloque leído no indica otra codificación
+            encoding = "utf-8-sig" if e.start >= len(head) - 3 else "cp1252"
+
+        with open(path, "r", encoding=encoding, errors="replace", newline="") as stream:
+            return self.import_stream(stream, chat_id, user_id, **kwargs)
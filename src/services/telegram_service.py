@@ -2,13 +2,17 @@
 import asyncio
 import aiohttp
 import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from src.config.settings import settings
 from src.utils.logger import setup_logger
+from src.utils.tracing import span
 from src.schemas import TelegramMessage
 
 logger = setup_logger(__name__)
 
+# Tipos de update que maneja el bot (el resto no se pide a Telegram)
+ALLOWED_UPDATES = ["message", "callback_query"]
+
 
 class TelegramService:
     """Servicio para interactuar con la API de Telegram usando aiohttp."""
@@ -29,22 +33,34 @@ class TelegramService:
         if self._session and not self._session.closed:
             await self._session.close()
 
-    async def get_updates(self, offset: Optional[int] = None, timeout: int = 5) -> List[Dict[str, Any]]:
+    async def get_updates(
+        self,
+        offset: Optional[int] = None,
+        timeout: int = 5,
+        limit: Optional[int] = None,
+        allowed_updates: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
         """
         Obtiene las actualizaciones del bot de Telegram.
 
         Args:
             offset: Offset para obtener solo updates nuevos
             timeout: Timeout de long polling de Telegram (segundos)
+            limit: Máximo de updates por respuesta (1-100)
+            allowed_updates: Tipos de update a recibir (None: los que Telegram tenga configurados)
 
         Returns:
             Lista de updates
         """
         url = f"{self.base_url}/getUpdates"
-        params: Dict[str, int] = {"timeout": timeout}
+        params: Dict[str, Any] = {"timeout": timeout}
 
         if offset is not None:
             params["offset"] = offset
+        if limit is not None:
+            params["limit"] = limit
+        if allowed_updates is not None:
+            params["allowed_updates"] = json.dumps(allowed_updates)
 
         try:
             session = await self._get_session()
@@ -58,16 +74,59 @@ class TelegramService:
                 if data.get("ok"):
                     return data.get("result", [])
                 else:
-                    logger.error(f"Error en getUpdates: {data}")
+                    logger.error("Error en getUpdates: %s", data)
                     return []
 
         except aiohttp.ClientError as e:
-            logger.error(f"Error al obtener actualizaciones de Telegram: {e}")
+            logger.error("Error al obtener actualizaciones de Telegram: %s", e)
             return []
         except asyncio.TimeoutError as e:
-            logger.error(f"Timeout al obtener actualizaciones de Telegram: {e}")
+            logger.error("Timeout al obtener actualizaciones de Telegram: %s", e)
             return []
 
+    async def _call(
+        self,
+        method: str,
+        payload: Dict[str, Any],
+        timeout: float = 10,
+        files: Optional[Dict[str, Tuple[str, bytes, str]]] = None,
+    ) -> Optional[Any]:
+        """
+        Llama a un método de la Bot API.
+
+        Args:
+            files: {campo: (nombre, contenido, content-type)}; si se indica, se envía como multipart
+
+        Returns:
+            ``result`` de la respuesta, o None si falló
+        """
+        url = f"{self.base_url}/{method}"
+        if files:
+            body = aiohttp.FormData()
+            for key, value in payload.items():
+                body.add_field(key, value if isinstance(value, str) else json.dumps(value))
+            for key, (filename, content, content_type) in files.items():
+                body.add_field(key, content, filename=filename, content_type=content_type)
+            request = {"data": body}
+        else:
+            request = {"json": payload}
+        try:
+            session = await self._get_session()
+            with span(f"http.{method}"):
+                async with session.post(url, **request, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error("Error en %s: %s", method, e)
+            return None
+
+        if data.get("ok"):
+            return data.get("result", True)
+        description = data.get("description", "")
+        if "message is not modified" in description:
+            return True  # Mismo contenido: no es un error
+        logger.error("Error en %s: %s", method, description or data)
+        return None
+
     async def send_message(
         self,
         chat_id: int,
@@ -87,8 +146,17 @@ class TelegramService:
         Returns:
             True si se envió correctamente
         """
-        url = f"{self.base_url}/sendMessage"
-        payload = {
+        return await self.send_message_returning_id(chat_id, text, reply_markup, reply_to_message_id) is not None
+
+    async def send_message_returning_id(
+        self,
+        chat_id: int,
+        text: str,
+        reply_markup: Optional[Dict[str, Any]] = None,
+        reply_to_message_id: Optional[int] = None
+    ) -> Optional[int]:
+        """Como ``send_message``, pero devuelve el message_id enviado (para editarlo después)."""
+        payload: Dict[str, Any] = {
             "chat_id": chat_id,
             "text": text
         }
@@ -99,15 +167,115 @@ class TelegramService:
         if reply_to_message_id:
             payload["reply_to_message_id"] = reply_to_message_id
 
+        result = await self._call("sendMessage", payload)
+        return result.get("message_id") if isinstance(result, dict) else None
+
+    async def send_photo(
+        self,
+        chat_id: int,
+        photo: bytes,
+        caption: Optional[str] = None,
+        filename: str = "grafico.png",
+    ) -> bool:
+        """
+        Envía una imagen PNG (subida como multipart).
+
+        Returns:
+            True si se envió correctamente
+        """
+        payload: Dict[str, Any] = {"chat_id": chat_id}
+        if caption:
+            payload["caption"] = caption
+        result = await self._call("sendPhoto", payload, timeout=60, files={"photo": (filename, photo, "image/png")})
+        return result is not None
+
+    async def edit_message_text(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Reemplaza el texto (y el teclado inline) de un mensaje enviado por el bot.
+
+        Sin ``reply_markup`` el mensaje queda sin botones.
+
+        Returns:
+            True si se editó (o ya tenía ese contenido)
+        """
+        payload: Dict[str, Any] = {"chat_id": chat_id, "message_id": message_id, "text": text}
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        return await self._call("editMessageText", payload) is not None
+
+    async def edit_message_reply_markup(
+        self,
+        chat_id: int,
+        message_id: int,
+        reply_markup: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """Reemplaza solo el teclado inline de un mensaje (sin ``reply_markup`` lo quita)."""
+        payload: Dict[str, Any] = {"chat_id": chat_id, "message_id": message_id}
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        return await self._call("editMessageReplyMarkup", payload) is not None
+
+    async def answer_callback_query(self, callback_query_id: str, text: Optional[str] = None) -> bool:
+        """Confirma un botón inline (saca el indicador de carga; ``text`` se muestra como aviso)."""
+        payload: Dict[str, Any] = {"callback_query_id": callback_query_id}
+        if text:
+            payload["text"] = text
+        return await self._call("answerCallbackQuery", payload) is not None
+
+    async def get_file_path(self, file_id: str) -> Optional[str]:
+        """
+        Obtiene la ruta de descarga de un archivo enviado al bot.
+
+        Args:
+            file_id: ID del archivo (document.file_id)
+
+        Returns:
+            file_path para descargar, o None si falla
+        """
+        url = f"{self.base_url}/getFile"
         try:
             session = await self._get_session()
-            async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                response.raise_for_status()
-                data = await response.json()
-                return data.get("ok", False)
-
+            with span("http.getFile"):
+                async with session.get(url, params={"file_id": file_id}, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+            if data.get("ok"):
+                return data["result"].get("file_path")
+            logger.error("Error en getFile: %s", data)
+            return None
         except aiohttp.ClientError as e:
-            logger.error(f"Error al enviar mensaje: {e}")
+            logger.error("Error al obtener archivo de Telegram: %s", e)
+            return None
+
+    async def download_file(self, file_path: str, destination: str) -> bool:
+        """
+        Descarga un archivo a disco en bloques (sin cargarlo entero en memoria).
+
+        Args:
+            file_path: Ruta devuelta por getFile
+            destination: Archivo local de destino
+
+        Returns:
+            True si se descargó correctamente
+        """
+        url = f"https://api.telegram.org/file/bot{self.bot_token}/{file_path}"
+        try:
+            session = await self._get_session()
+            with span("http.downloadFile"):
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=120)) as response:
+                    response.raise_for_status()
+                    with open(destination, "wb") as f:
+                        async for block in response.content.iter_chunked(64 * 1024):
+                            f.write(block)
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error("Error al descargar archivo de Telegram: %s", e)
             return False
 
     def make_keyboard_buttons(self, buttons: List[str], columns: int = 3) -> Dict[str, Any]:
@@ -139,6 +307,23 @@ class TelegramService:
             "one_time_keyboard": True
         }
 
+    def make_inline_keyboard(self, buttons: List[Tuple[str, str]], columns: int = 3) -> Dict[str, Any]:
+        """
+        Crea un teclado inline (botones dentro del mensaje).
+
+        Args:
+            buttons: Lista de (texto, callback_data); callback_data hasta 64 bytes
+            columns: Número de columnas
+
+        Returns:
+            Reply markup para Telegram
+        """
+        rows = [
+            [{"text": text, "callback_data": data} for text, data in buttons[start:start + columns]]
+            for start in range(0, len(buttons), columns)
+        ]
+        return {"inline_keyboard": rows}
+
     def make_main_menu(self) -> Dict[str, Any]:
         """Crea el menú principal del bot."""
         return {
@@ -151,53 +336,91 @@ class TelegramService:
             "persistent": True
         }
 
-    async def start_polling(self, on_message_callback):
+    async def start_polling(self, on_message_callback, on_ready=None, on_received=None):
         """
         Inicia el polling de mensajes.
 
+        Un productor hace el long polling y deja cada lote en una cola acotada
+        (``POLLING_PREFETCH`` lotes); el consumidor procesa los updates en
+        orden. Así el siguiente getUpdates ya está en vuelo mientras se procesa
+        el lote actual, y si el procesamiento se atrasa el productor espera.
+
+        Pedir el lote siguiente confirma en Telegram los anteriores aunque
+        todavía estén en la cola: ``on_received`` se espera antes de esa
+        confirmación, para que quien llama los guarde y pueda reprocesarlos si
+        el proceso se corta.
+
         Args:
             on_message_callback: Callback async para procesar cada mensaje
+            on_ready: Callback (sync) invocado justo antes del primer getUpdates
+            on_received: Callback async opcional con cada lote recibido, antes
+                de confirmarlo en Telegram
+
+        Returns:
+            update_id del último update procesado
         """
-        offset = 0
-        consecutive_empty = 0  # Contador de polls vacíos consecutivos
+        batches: asyncio.Queue = asyncio.Queue(maxsize=settings.POLLING_PREFETCH)
+        processed = 0
 
         logger.info("Iniciando polling de Telegram...")
-
+        producer = asyncio.create_task(self._produce_updates(batches, on_ready, on_received))
         try:
             while True:
-                try:
-                    # Solo loguear cada 10 polls vacíos
-                    if consecutive_empty % 10 == 0:
-                        logger.debug(f"Polling... (offset={offset+1})")
-
-                    updates = await self.get_updates(offset=offset+1 if offset > 0 else None, timeout=settings.POLLING_INTERVAL)
-
-                    if not updates:
-                        consecutive_empty += 1
-                        continue
-
-                    # Reseteamos contador si hay mensajes
-                    consecutive_empty = 0
-                    logger.info(f"📥 {len(updates)} mensaje(s) nuevo(s)")
-
-                    for update in updates:
-                        offset = max(offset, update["update_id"])
-
-                        # Procesar el mensaje
-                        try:
-                            await on_message_callback(update)
-                        except Exception as e:
-                            logger.error(f"Error procesando update {update.get('update_id')}: {e}", exc_info=True)
-
-                except KeyboardInterrupt:
-                    raise
-                except Exception as e:
-                    logger.error(f"Error en el polling: {e}")
-                    await asyncio.sleep(5)
-
+                batch = await batches.get()
+                for update in batch:
+                    try:
+                        await on_message_callback(update)
+                    except Exception as e:
+                        logger.error("Error procesando update %s: %s", update.get("update_id"), e, exc_info=True)
+                    processed = max(processed, update["update_id"])
         except KeyboardInterrupt:
             logger.info("Polling detenido por el usuario")
         finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
             await self.close()
 
-        return offset
+        return processed
+
+    async def _produce_updates(self, batches: asyncio.Queue, on_ready=None, on_received=None):
+        """Long polling continuo: cada lote no vacío va a ``batches``."""
+        offset = None
+        consecutive_empty = 0  # Contador de polls vacíos consecutivos
+        ready_notified = on_ready is None
+
+        while True:
+            try:
+                # Solo loguear cada 10 polls vacíos
+                if consecutive_empty % 10 == 0:
+                    logger.debug("Polling... (offset=%s)", offset)
+
+                if not ready_notified:
+                    ready_notified = True
+                    on_ready()
+
+                updates = await self.get_updates(
+                    offset=offset,
+                    timeout=settings.POLLING_INTERVAL,
+                    limit=settings.POLLING_LIMIT,
+                    allowed_updates=ALLOWED_UPDATES,
+                )
+
+                if not updates:
+                    consecutive_empty += 1
+                    continue
+
+                # Reseteamos contador si hay mensajes
+                consecutive_empty = 0
+                logger.info("📥 %s mensaje(s) nuevo(s)", len(updates))
+
+                if on_received is not None:
+                    await on_received(updates)
+                # El próximo getUpdates confirma este lote en Telegram
+                offset = max(update["update_id"] for update in updates) + 1
+                await batches.put(updates)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error en el polling: %s", e)
+                await asyncio.sleep(5)
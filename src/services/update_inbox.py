@@ -0,0 +1,44 @@
+"""Inbox de updates: lo recibido de Telegram que todavía no se procesó."""
+import asyncio
+from typing import List, Optional
+
+from src.repositories.ledger_repository import LedgerRepository
+
+# Snapshot con los updates recibidos (ya confirmados en Telegram) que falta procesar
+INBOX_SNAPSHOT = "telegram_inbox"
+
+
+class UpdateInbox:
+    """
+    Updates guardados antes de que el próximo getUpdates los confirme en Telegram.
+
+    Si el proceso se corta con updates recibidos sin procesar, al arrancar se
+    reprocesan los posteriores al offset guardado.
+    """
+
+    def __init__(self, ledger_repository: LedgerRepository):
+        self.ledger = ledger_repository
+
+    async def save(self, updates: List[dict], processed: Optional[int]):
+        """Agrega un lote; se descartan los updates hasta ``processed`` (ya procesados)."""
+
+        def mutate(snapshot):
+            pending = [
+                update for update in (snapshot or {}).get("updates", [])
+                if processed is None or update["update_id"] > processed
+            ]
+            known = {update["update_id"] for update in pending}
+            return {"updates": pending + [update for update in updates if update["update_id"] not in known]}
+
+        await asyncio.to_thread(self.ledger.update_snapshot, INBOX_SNAPSHOT, mutate)
+
+    async def pending(self) -> List[dict]:
+        """Updates del inbox posteriores al offset persistido."""
+        snapshot = await asyncio.to_thread(self.ledger.load_snapshot, INBOX_SNAPSHOT)
+        if not snapshot or not snapshot.get("updates"):
+            return []
+        offset = await asyncio.to_thread(self.ledger.get_update_offset)
+        return [update for update in snapshot["updates"] if update["update_id"] > offset]
+
+    async def clear(self):
+        await asyncio.to_thread(self.ledger.update_snapshot, INBOX_SNAPSHOT, lambda _: {"updates": []})
@@ -0,0 +1,98 @@
+"""
+Circuit breaker simple para llamadas a servicios externos.
+"""
+import time
+from typing import Any, Dict
+
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Corta las llamadas a un servicio tras fallos consecutivos.
+
+    - closed: las llamadas pasan normalmente.
+    - open: las llamadas se rechazan sin contactar al servicio hasta que pase
+      ``reset_timeout``.
+    - half_open: se deja pasar una única llamada de prueba; si funciona se
+      vuelve a closed, si falla se vuelve a open.
+
+    Pensado para usarse desde el event loop (no es thread-safe).
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.metrics: Dict[str, int] = {
+            "successes": 0,
+            "failures": 0,
+            "rejected": 0,
+            "opened": 0,
+        }
+
+    def _transition(self, new_state: str):
+        if new_state == self.state:
+            return
+        logger.warning(
+            "Circuit breaker '%s': %s → %s (fallos consecutivos=%s)",
+            self.name,
+            self.state,
+            new_state,
+            self.consecutive_failures,
+        )
+        self.state = new_state
+
+    def allow_request(self) -> bool:
+        """Indica si se puede realizar una llamada en este momento."""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+
+        if self.state == CLOSED:
+            return True
+
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self.metrics["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.metrics["successes"] += 1
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self._transition(CLOSED)
+
+    def record_failure(self):
+        self.metrics["failures"] += 1
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            if self.state != OPEN:
+                self.metrics["opened"] += 1
+            self._transition(OPEN)
+
+    def release_probe(self):
+        """Libera la llamada de prueba sin cambiar de estado (llamada cancelada)."""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado y contadores actuales (para logs/métricas)."""
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            **self.metrics,
+        }
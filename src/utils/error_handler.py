@@ -18,19 +18,19 @@ def handle_telegram_errors():
                 return await func(self, *args, **kwargs)
 
             except aiohttp.ClientResponseError as e:
-                logger.error(f"Error HTTP de API: {e}")
+                logger.error("Error HTTP de API: %s", e)
                 raise
 
             except aiohttp.ClientError as e:
-                logger.error(f"Error de conexión con API: {e}")
+                logger.error("Error de conexión con API: %s", e)
                 raise
 
             except ValueError as e:
-                logger.error(f"Error de validación: {e}")
+                logger.error("Error de validación: %s", e)
                 raise
 
             except Exception as e:
-                logger.error(f"Error inesperado en {func.__name__}: {e}", exc_info=True)
+                logger.error("Error inesperado en %s: %s", func.__name__, e, exc_info=True)
                 raise
 
         return wrapper
@@ -0,0 +1,36 @@
+"""Fechas en la zona horaria del bot (``TIMEZONE``) a partir de timestamps unix."""
+import functools
+from datetime import date, datetime, tzinfo
+
+from src.config.settings import settings
+
+
+@functools.lru_cache(maxsize=8)
+def _gettz(name: str) -> tzinfo:
+    from dateutil import tz
+
+    return tz.gettz(name)
+
+
+def local_tz() -> tzinfo:
+    """tzinfo de ``TIMEZONE`` (se resuelve una sola vez por nombre)."""
+    return _gettz(settings.TIMEZONE)
+
+
+def to_local(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, local_tz())
+
+
+def format_local(ts: int) -> str:
+    """Fecha y hora local como en ``date_iso``: "YYYY-MM-DD HH:MM"."""
+    return to_local(ts).strftime("%Y-%m-%d %H:%M")
+
+
+def local_date(ts: int) -> date:
+    return to_local(ts).date()
+
+
+def month_bucket(ts: int) -> str:
+    """Mes local "YYYY-MM"."""
+    local = to_local(ts)
+    return f"{local.year:04d}-{local.month:02d}"
@@ -1,5 +1,136 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.config.settings import settings
+
+# Campos de contexto que se adjuntan a cada registro (update en curso)
+_CONTEXT_FIELDS = ("update_id", "chat_id", "stage")
+_log_context: contextvars.ContextVar[dict] = contextvars.ContextVar("log_context", default={})
+
+_shared_handler: Optional[logging.Handler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _ContextFilter(logging.Filter):
+    """Inyecta update_id, chat_id y stage del contexto actual en el registro."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        for field in _CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como una línea JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in _CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que solo resuelve el mensaje en el thread que loguea.
+
+    El formateo final (timestamp, JSON, escritura a stdout) ocurre en el
+    thread del QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _make_formatter() -> logging.Formatter:
+    if settings.LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+
+def _get_shared_handler() -> logging.Handler:
+    """Crea (una sola vez) el handler compartido por todos los loggers."""
+    global _shared_handler, _listener
+
+    if _shared_handler is not None:
+        return _shared_handler
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(_make_formatter())
+
+    if settings.LOG_ASYNC:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        handler: logging.Handler = _DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        handler = stream_handler
+
+    handler.addFilter(_ContextFilter())
+    _shared_handler = handler
+    return handler
+
+
+def shutdown_logging():
+    """Vacía la cola de logs y detiene el thread del listener (si existe)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Asocia campos de contexto (update_id, chat_id, stage) a los logs del bloque.
+
+    Ejemplo:
+        with log_context(update_id=123, chat_id=456):
+            logger.info("Procesando")
+    """
+    merged = {**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}}
+    token = _log_context.set(merged)
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def bind_log_context(**fields):
+    """Agrega campos al contexto de logging activo (dentro de un log_context)."""
+    _log_context.set({**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}})
 
 
 def setup_logger(name: str, level: str = "INFO") -> logging.Logger:
@@ -9,15 +140,6 @@ def setup_logger(name: str, level: str = "INFO") -> logging.Logger:
     logger.setLevel(getattr(logging, level))
 
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(getattr(logging, level))
-
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        handler.setFormatter(formatter)
-
-        logger.addHandler(handler)
+        logger.addHandler(_get_shared_handler())
 
     return logger
@@ -0,0 +1,264 @@
+"""
+Trazas por update y profiling bajo demanda.
+
+Con el tracing activo (``TRACING`` o ``/traza on``), cada update abre una
+traza (``trace_update``) y los spans registrados durante su procesamiento
+(handlers, repositorio, HTTP a Telegram, Actual Budget) quedan asociados por
+``update_id``, también desde threads (``asyncio.to_thread`` copia el
+contexto). Al terminar se loguea el desglose por categoría si el update tardó
+más de ``TRACE_SLOW_MS``, y las últimas trazas quedan en memoria para ``/traza``.
+
+Apagado, un span cuesta un chequeo de un booleano: ``span`` devuelve un
+context manager vacío compartido y ``traced`` llama directo a la función.
+"""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Trazas terminadas que se conservan para /traza
+RECENT_TRACES = 50
+
+_enabled = settings.TRACING
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+_current_category: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span_category", default=None)
+_recent: Deque["Trace"] = deque(maxlen=RECENT_TRACES)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    """Activa o desactiva el tracing en caliente (afecta a los próximos updates)."""
+    global _enabled
+    _enabled = enabled
+    logger.info("Tracing %s", "activado" if enabled else "desactivado")
+
+
+class Trace:
+    """Spans de un update: (nombre, categoría, duración en ms, anidado en su misma categoría)."""
+
+    def __init__(self, update_id: Optional[int], chat_id: Optional[int]):
+        self.update_id = update_id
+        self.chat_id = chat_id
+        self.started_at = time.time()
+        self.total_ms = 0.0
+        self.spans: List[tuple] = []
+
+    def breakdown(self) -> Dict[str, List[float]]:
+        """{categoría: [ms, cantidad]} sin contar dos veces los spans anidados de la misma categoría."""
+        result: Dict[str, List[float]] = {}
+        for _, category, elapsed_ms, nested in self.spans:
+            if nested:
+                continue
+            totals = result.setdefault(category, [0.0, 0])
+            totals[0] += elapsed_ms
+            totals[1] += 1
+        return result
+
+    def describe(self) -> str:
+        parts = [
+            f"{category} {elapsed:.0f}ms ({count})"
+            for category, (elapsed, count) in sorted(self.breakdown().items(), key=lambda item: -item[1][0])
+        ]
+        return f"update {self.update_id}: {self.total_ms:.0f}ms" + (" | " + " · ".join(parts) if parts else "")
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "category", "start", "token", "nested")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+        self.category = name.split(".", 1)[0]
+
+    def __enter__(self):
+        self.nested = _current_category.get() == self.category
+        self.token = _current_category.set(self.category)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        _current_category.reset(self.token)
+        self.trace.spans.append((self.name, self.category, elapsed_ms, self.nested))
+        return False
+
+
+def span(name: str):
+    """
+    Span ``categoría.nombre`` dentro de la traza del update actual.
+
+    Ejemplo:
+        with span("http.sendMessage"):
+            ...
+    """
+    if not _enabled:
+        return _NOOP
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+
+@contextmanager
+def trace_update(update_id: Optional[int], chat_id: Optional[int] = None):
+    """Abre la traza de un update (no hace nada si el tracing está apagado)."""
+    if not _enabled:
+        yield None
+        return
+    trace = Trace(update_id, chat_id)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.total_ms = (time.perf_counter() - start) * 1000
+        _current_trace.reset(token)
+        _recent.append(trace)
+        if trace.total_ms >= settings.TRACE_SLOW_MS:
+            logger.info("⏱️ Update lento: %s", trace.describe())
+        else:
+            logger.debug("⏱️ %s", trace.describe())
+
+
+def recent_traces(limit: int = 5, slowest: bool = True) -> List[Trace]:
+    """Últimas trazas terminadas (las más lentas primero si ``slowest``)."""
+    traces = list(_recent)
+    if slowest:
+        traces.sort(key=lambda trace: -trace.total_ms)
+    else:
+        traces.reverse()
+    return traces[:limit]
+
+
+def traced(name: str) -> Callable:
+    """Decorador: registra cada llamada (sync o async) como el span ``name``."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled or _current_trace.get() is None:
+                    return await func(*args, **kwargs)
+                with _Span(_current_trace.get(), name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled or _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with _Span(_current_trace.get(), name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(category: str, predicate: Callable[[str], bool] = lambda name: not name.startswith("_")):
+    """Decorador de clase: aplica ``traced("categoría.método")`` a los métodos que cumplen ``predicate``."""
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if inspect.isfunction(value) and predicate(attr):
+                setattr(cls, attr, traced(f"{category}.{attr}")(value))
+        return cls
+    return decorator
+
+
+class Profiler:
+    """
+    cProfile del event loop durante N segundos; el reporte queda en ``PROFILE_DIR``.
+
+    cProfile mide solo el thread que lo activa: se arranca desde el event
+    loop, que es donde corre el procesamiento de updates (lo que va a threads
+    aparece como espera de ``to_thread``).
+    """
+
+    def __init__(self, output_dir: Optional[str] = None):
+        self.output_dir = output_dir or settings.PROFILE_DIR
+        self._profile: Optional[cProfile.Profile] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = threading.Lock()
+        self.last_report: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self, seconds: float, on_done: Optional[Callable[[Optional[str]], Any]] = None) -> bool:
+        """
+        Arranca el profiling (debe llamarse desde el event loop).
+
+        Args:
+            on_done: Se llama con la ruta del reporte al terminar
+
+        Returns:
+            False si ya había uno en curso
+        """
+        with self._lock:
+            if self._profile is not None:
+                return False
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        logger.info("🔬 Profiling activado por %ss", seconds)
+
+        def finish():
+            path = self.stop()
+            if on_done is not None:
+                on_done(path)
+
+        self._timer = asyncio.get_running_loop().call_later(seconds, finish)
+        return True
+
+    def stop(self) -> Optional[str]:
+        """Detiene el profiling y escribe el reporte; devuelve su ruta."""
+        with self._lock:
+            profile, self._profile = self._profile, None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if profile is None:
+            return None
+        profile.disable()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}")
+        profile.dump_stats(base + ".prof")
+        text = io.StringIO()
+        stats = pstats.Stats(profile, stream=text)
+        stats.sort_stats("cumulative").print_stats(60)
+        stats.sort_stats("tottime").print_stats(30)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+        self.last_report = base + ".txt"
+        logger.info("🔬 Reporte de profiling: %s (y %s.prof)", self.last_report, base)
+        return self.last_report
+
+
+profiler = Profiler()
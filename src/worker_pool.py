@@ -0,0 +1,282 @@
+"""
+Modo scale-out: un ingress (polling) y N procesos worker particionados por chat_id.
+
+Cada update se envía a la cola del worker ``hash(chat_id) % N``, por lo que
+los mensajes de un mismo chat se procesan siempre en orden y en el mismo
+proceso. Cada worker arma su propio ``GastosBot`` (conexiones propias al
+repositorio, a Telegram y a Actual Budget). El ingress es el único que
+persiste el offset de updates, y solo avanza hasta el último update cuyo
+procesamiento (y el de todos los anteriores) fue confirmado por los workers.
+
+Telegram da por confirmado un lote en el siguiente getUpdates, así que el
+ingress guarda cada lote en el inbox antes de repartirlo: al arrancar se
+reenvían a los workers los updates del inbox posteriores al offset. Si un
+worker muere, se relanza y recibe de nuevo lo que tenía sin confirmar.
+"""
+import asyncio
+import heapq
+import multiprocessing as mp
+import queue
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_STOP = None
+
+# Factory ejecutada dentro de cada worker: devuelve (handle(update), close())
+HandlerFactory = Callable[[], Tuple[Callable[[dict], Awaitable[Any]], Callable[[], Awaitable[Any]]]]
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Extrae el chat_id de un update (mensaje o callback)."""
+    message = update.get("message") or (update.get("callback_query") or {}).get("message") or {}
+    return message.get("chat", {}).get("id")
+
+
+def partition_for(chat_id: Optional[int], workers: int) -> int:
+    """Worker asignado a un chat (los updates sin chat van al worker 0)."""
+    if chat_id is None:
+        return 0
+    return hash(chat_id) % workers
+
+
+def bot_handler_factory():
+    """Factory por defecto: un ``GastosBot`` completo que no persiste offsets."""
+    from src.bot import GastosBot
+
+    bot = GastosBot()
+    bot.track_offset = False  # El offset lo maneja el ingress
+    bot.category_index.load()
+    return bot.process_message, bot.close
+
+
+def _worker_main(index: int, inbox, acks, handler_factory: HandlerFactory):
+    asyncio.run(_worker_loop(index, inbox, acks, handler_factory))
+
+
+async def _worker_loop(index: int, inbox, acks, handler_factory: HandlerFactory):
+    handle, close = handler_factory()
+    loop = asyncio.get_running_loop()
+    logger.info("Worker %s iniciado", index)
+    try:
+        while True:
+            update = await loop.run_in_executor(None, inbox.get)
+            if update is _STOP:
+                break
+            try:
+                await handle(update)
+            except Exception as e:
+                logger.error("Worker %s: error procesando update %s: %s", index, update.get("update_id"), e, exc_info=True)
+            acks.put((index, update.get("update_id", 0)))
+    finally:
+        await close()
+        logger.info("Worker %s detenido", index)
+
+
+class OffsetTracker:
+    """
+    Calcula el offset seguro a persistir con confirmaciones fuera de orden.
+
+    El offset avanza solo hasta el mayor update_id tal que todos los
+    despachados hasta él fueron confirmados.
+    """
+
+    def __init__(self):
+        self._pending: List[int] = []  # heap de update_ids despachados
+        self._acked = set()
+
+    def dispatched(self, update_id: int):
+        heapq.heappush(self._pending, update_id)
+
+    def acked(self, update_id: int) -> Optional[int]:
+        """Registra una confirmación; devuelve el nuevo offset seguro o None."""
+        self._acked.add(update_id)
+        committed = None
+        while self._pending and self._pending[0] in self._acked:
+            committed = heapq.heappop(self._pending)
+            self._acked.discard(committed)
+        return committed
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+
+class PartitionedWorkerPool:
+    """Pool de procesos worker con una cola por worker."""
+
+    def __init__(
+        self,
+        workers: int,
+        handler_factory: HandlerFactory = bot_handler_factory,
+        queue_size: int = 1000,
+    ):
+        self.workers = max(1, workers)
+        self.handler_factory = handler_factory
+        self._ctx = mp.get_context("spawn")  # fork + asyncio/aiohttp no es seguro
+        self.queue_size = queue_size
+        self._inboxes = [self._ctx.Queue(maxsize=queue_size) for _ in range(self.workers)]
+        self._acks = self._ctx.Queue()
+        self._processes: List[mp.Process] = []
+        # Updates encolados y sin confirmar, por worker (en orden de envío)
+        self._unacked: List[Dict[int, Dict[str, Any]]] = [{} for _ in range(self.workers)]
+        self._stopping = False
+        self.tracker = OffsetTracker()
+
+    def _spawn(self, index: int) -> mp.Process:
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self._inboxes[index], self._acks, self.handler_factory),
+            name=f"gastos-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def start(self):
+        self._processes = [self._spawn(index) for index in range(self.workers)]
+        logger.info("🧵 %s workers iniciados", self.workers)
+
+    async def submit(self, update: Dict[str, Any]):
+        """Encola el update en el worker de su chat (espera si la cola está llena)."""
+        index = partition_for(update_chat_id(update), self.workers)
+        update_id = update.get("update_id", 0)
+        if update_id in self._unacked[index]:
+            return  # Ya encolado (reentrega de Telegram o reenvío desde el inbox)
+        self.tracker.dispatched(update_id)
+        while True:
+            try:
+                # La cola se relee: si el worker se relanzó, la anterior ya no se consume
+                self._inboxes[index].put_nowait(update)
+                self._unacked[index][update_id] = update
+                return
+            except queue.Full:
+                await asyncio.sleep(0.01)
+
+    def collect_acks(self) -> Optional[int]:
+        """Procesa las confirmaciones disponibles; devuelve el offset seguro más reciente."""
+        committed = None
+        while True:
+            try:
+                index, update_id = self._acks.get_nowait()
+            except queue.Empty:
+                return committed
+            # Un update reenviado tras relanzar el worker puede confirmarse dos veces
+            if self._unacked[index].pop(update_id, None) is None:
+                continue
+            offset = self.tracker.acked(update_id)
+            if offset is not None:
+                committed = offset
+
+    def check_workers(self) -> Optional[int]:
+        """
+        Relanza los workers caídos y les reenvía lo que tenían sin confirmar.
+
+        Devuelve el offset seguro de las confirmaciones leídas antes de relanzar.
+        """
+        committed = None
+        for index, process in enumerate(self._processes):
+            if self._stopping or process.is_alive():
+                continue
+            offset = self.collect_acks()
+            if offset is not None:
+                committed = offset
+            pending = list(self._unacked[index].values())
+            logger.error(
+                "Worker %s terminó inesperadamente (exit code %s); relanzando con %s update(s) pendientes",
+                index, process.exitcode, len(pending),
+            )
+            # Cola nueva: la anterior puede haber quedado con datos a medio leer
+            self._inboxes[index] = self._ctx.Queue(maxsize=max(self.queue_size, len(pending)))
+            for update in pending:
+                self._inboxes[index].put_nowait(update)
+            self._processes[index] = self._spawn(index)
+        return committed
+
+    def stop(self, timeout: float = 10.0):
+        """Pide a cada worker que termine lo encolado y se detenga."""
+        self._stopping = True
+        for inbox in self._inboxes:
+            inbox.put(_STOP)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Worker %s no terminó a tiempo, forzando cierre", process.name)
+                process.terminate()
+        self._processes.clear()
+
+
+async def run_scale_out(workers: int):
+    """Ingress de polling que reparte updates entre ``workers`` procesos."""
+    from src.bot import GastosBot
+    from src.services.poller_lease import PollerLease
+
+    settings.validate()
+    if not settings.DATABASE_URL:
+        logger.warning("Modo scale-out con backend de archivos: se recomienda DATABASE_URL")
+
+    # El ingress también corre recurrentes y archivado (una sola vez, no por worker)
+    bot = GastosBot()
+    bot.track_offset = False
+    repository = bot.ledger_repository
+    telegram = bot.telegram_service
+    lease = PollerLease(repository) if settings.POLLER_LEASE else None
+    if lease:
+        # Los workers arrancan recién cuando esta instancia es la que hace polling
+        await lease.acquire()
+    index_task = asyncio.create_task(asyncio.to_thread(bot.category_index.load))
+    pool = PartitionedWorkerPool(workers)
+    pool.start()
+
+    committed = await asyncio.to_thread(repository.get_update_offset)
+    logger.info("🔄 Último update procesado: %s", committed)
+
+    async def monitor():
+        nonlocal committed
+        while True:
+            await asyncio.sleep(0.2)
+            for offset in (pool.collect_acks(), pool.check_workers()):
+                if offset is not None and offset > committed:
+                    committed = offset
+                    await asyncio.to_thread(repository.save_update_offset, offset)
+
+    async def save_inbox(updates: List[Dict[str, Any]]):
+        await bot.inbox.save(updates, committed)
+
+    replayed = set()
+
+    async def submit(update: Dict[str, Any]):
+        # Telegram puede reentregar lo que ya se reenvió desde el inbox
+        if update.get("update_id") in replayed:
+            return
+        await pool.submit(update)
+
+    async def poll():
+        # Lo recibido y confirmado en Telegram que no llegó a procesarse
+        pending = await bot.inbox.pending()
+        if pending:
+            logger.info("📬 Reenviando %s update(s) recibidos antes del último corte", len(pending))
+        for update in pending:
+            await pool.submit(update)
+            replayed.add(update["update_id"])
+        await telegram.start_polling(submit, on_received=save_inbox)
+
+    monitor_task = asyncio.create_task(monitor())
+    try:
+        if lease:
+            await lease.run_while_held(lambda: bot.run_scheduled(poll))
+        else:
+            await bot.run_scheduled(poll)
+    finally:
+        monitor_task.cancel()
+        await asyncio.get_running_loop().run_in_executor(None, pool.stop)
+        offset = pool.collect_acks()
+        if offset is not None and offset > committed:
+            await asyncio.to_thread(repository.save_update_offset, offset)
+        if lease:
+            await lease.release()
+        index_task.cancel()
+        await bot.close()